@@ -0,0 +1,308 @@
+#!/usr/bin/env python
+"""
+Synthetic file-storm benchmark for pulsar.
+
+Builds a temporary directory tree, watches it with pulsar.process(), then
+generates rounds of create/modify/delete storms. Each round runs
+pulsar.process() and hands the events to splunk_pulsar_return, which posts to
+a local HEC stand-in (a tiny http server on 127.0.0.1).
+
+Reported:
+  * throughput (events/s through process() + returner)
+  * per-phase sweep times (read_config, check_events, update_watches,
+    prune_watches; taken from pulsar's delta_t)
+  * event latency percentiles (file operation -> event received by the HEC)
+
+example:
+
+    PYTHONPATH=. python contrib/pulsar-storm-bench.py --rounds 10 --creates 2000
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import threading
+from json.decoder import WHITESPACE
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import yaml
+
+import hubblestack.hec.opt
+import hubblestack.modules.pulsar as pulsar
+import hubblestack.returners.splunk_pulsar_return as splunk_pulsar_return
+
+PHASES = ('read_config', 'check_events', 'update_watches', 'prune_watches')
+
+
+def get_args(*a):
+    parser = argparse.ArgumentParser(description='pulsar synthetic file-storm benchmark')
+    parser.add_argument('--dirs', type=int, default=20,
+        help='number of directories in the initial tree (default: %(default)s)')
+    parser.add_argument('--files', type=int, default=50,
+        help='number of files per directory in the initial tree (default: %(default)s)')
+    parser.add_argument('--rounds', type=int, default=5,
+        help='number of storm rounds (default: %(default)s)')
+    parser.add_argument('--creates', type=int, default=500,
+        help='files created per round (default: %(default)s)')
+    parser.add_argument('--modifies', type=int, default=500,
+        help='files modified per round (default: %(default)s)')
+    parser.add_argument('--deletes', type=int, default=250,
+        help='files deleted per round (default: %(default)s)')
+    parser.add_argument('--watch-files', action='store_true',
+        help='set watch_files: True on the watched tree (one watch per file)')
+    parser.add_argument('--checksum', action='store_true',
+        help='set checksum: sha256 in the pulsar config')
+    parser.add_argument('--seed', type=int, default=None,
+        help='random seed for choosing storm targets')
+    parser.add_argument('--tmpdir', default=None,
+        help='where to build the temporary tree (default: system temp dir)')
+    parser.add_argument('--keep', action='store_true',
+        help='do not remove the temporary tree afterwards')
+    parser.add_argument('--json', action='store_true',
+        help='print the final report as json')
+    return parser.parse_args(*a)
+
+
+class HECStandIn(object):
+    """ a local http event collector that accepts everything and notes the arrival time of each payload """
+
+    def __init__(self):
+        self.received = list()
+        self.lock = threading.Lock()
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def do_POST(self):
+                now = time.time()
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                with stand_in.lock:
+                    stand_in.received.append((now, body))
+                resp = b'{"text":"Success","code":0}'
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(resp)))
+                self.end_headers()
+                self.wfile.write(resp)
+
+            def log_message(self, *_a):
+                pass
+
+        self.server = HTTPServer(('127.0.0.1', 0), Handler)
+        self.port = self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def drain(self):
+        """ pop everything received so far as (arrival_time, payload_dict) tuples """
+        with self.lock:
+            received, self.received = self.received, list()
+        decoder = json.JSONDecoder()
+        for arrival, body in received:
+            body = body.decode()
+            idx = WHITESPACE.match(body, 0).end()
+            while idx < len(body):
+                obj, end = decoder.raw_decode(body, idx)
+                yield arrival, obj
+                idx = WHITESPACE.match(body, end).end()
+
+    def shutdown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def percentile(values, pct):
+    """ nearest-rank percentile of an already sorted list """
+    if not values:
+        return 0.0
+    idx = int(round(pct / 100.0 * (len(values) - 1)))
+    return values[idx]
+
+
+def setup_dunders(hec_port):
+    splunk_opts = [{
+        'token': 'pulsar-bench', 'indexer': '127.0.0.1', 'port': hec_port,
+        'index': 'pulsar-bench', 'sourcetype_pulsar': 'hubble_fim',
+        'http_event_server_ssl': False, 'http_event_collector_ssl_verify': False,
+    }]
+
+    def config_get(key, default=None):
+        ''' pretend salt[config.get] '''
+        if key == 'hubblestack:returner:splunk':
+            return splunk_opts
+        return default
+
+    def grains_get(_key, default=None):
+        ''' pretend salt[grains.get] '''
+        return default
+
+    def cp_cache_file(path):
+        ''' pretend salt[cp.cache_file] '''
+        return path
+
+    def file_get_hash(path, form='sha256'):
+        ''' pretend salt[file.get_hash] '''
+        import hashlib
+        with open(path, 'rb') as fh:
+            return hashlib.new(form, fh.read()).hexdigest()
+
+    mods = {'config.get': config_get, 'grains.get': grains_get,
+            'cp.cache_file': cp_cache_file, 'file.get_hash': file_get_hash}
+    grains = {'id': 'pulsar-bench', 'fqdn': 'pulsar-bench.local', 'local_ip4': '10.0.0.1',
+              'fqdn_ip4': ['10.0.0.1'], 'ipv4': ['10.0.0.1']}
+
+    pulsar.__mods__ = mods
+    pulsar.__opts__ = {}
+    pulsar.__context__ = {}
+    splunk_pulsar_return.__mods__ = mods
+    splunk_pulsar_return.__opts__ = {'id': 'pulsar-bench'}
+    splunk_pulsar_return.__grains__ = grains
+    hubblestack.hec.opt.__mods__ = mods
+
+
+def build_tree(root, dirs, files):
+    live = list()
+    for d in range(dirs):
+        dname = os.path.join(root, 'd{0:04d}'.format(d))
+        os.mkdir(dname)
+        for f in range(files):
+            fname = os.path.join(dname, 'f{0:05d}'.format(f))
+            with open(fname, 'w') as fh:
+                fh.write('initial\n')
+            live.append(fname)
+    return live
+
+
+def storm(root, dirs, live, args, serial):
+    """ create, modify and delete files; return {abspath: time-of-operation} """
+    ops = dict()
+    for _ in range(args.creates):
+        serial[0] += 1
+        fname = os.path.join(root, 'd{0:04d}'.format(random.randrange(dirs)), 'n{0:07d}'.format(serial[0]))
+        ops[fname] = time.time()
+        with open(fname, 'w') as fh:
+            fh.write('created\n')
+        live.append(fname)
+    for fname in random.sample(live, min(args.modifies, len(live))):
+        ops.setdefault(fname, time.time())
+        with open(fname, 'a') as fh:
+            fh.write('modified\n')
+    for fname in random.sample(live, min(args.deletes, len(live))):
+        ops.setdefault(fname, time.time())
+        os.unlink(fname)
+        live.remove(fname)
+    return ops
+
+
+def run(args):
+    random.seed(args.seed)
+    root = tempfile.mkdtemp(prefix='pulsar-bench-', dir=args.tmpdir)
+    tree = os.path.join(root, 'tree')
+    os.mkdir(tree)
+    config_file = os.path.join(root, 'pulsar_bench_config.yaml')
+    config = {tree: {'recurse': True, 'auto_add': True, 'watch_files': args.watch_files}}
+    if args.checksum:
+        config['checksum'] = 'sha256'
+    with open(config_file, 'w') as fh:
+        yaml.safe_dump(config, fh)
+
+    hec = HECStandIn()
+    setup_dunders(hec.port)
+
+    try:
+        live = build_tree(tree, args.dirs, args.files)
+
+        t0 = time.time()
+        pulsar.process(config_file)
+        setup_time = time.time() - t0
+        watch_count = len(pulsar.__context__['pulsar.notifier']._watch_manager.watch_db)
+
+        serial = [0]
+        phases = dict((p, 0.0) for p in PHASES)
+        phases['returner'] = 0.0
+        total_events = 0
+        total_time = 0.0
+        latencies = list()
+        rounds = list()
+
+        for rnd in range(args.rounds):
+            ops = storm(tree, args.dirs, live, args, serial)
+
+            t0 = time.time()
+            events = pulsar.process(config_file)
+            t1 = time.time()
+            splunk_pulsar_return.returner({'id': 'pulsar-bench', 'fun': 'pulsar.process', 'return': events})
+            t2 = time.time()
+
+            sweep = pulsar.__context__['pulsar.delta_t'].as_dict()
+            for p in PHASES:
+                phases[p] += sweep.get(p, 0.0)
+            phases['returner'] += t2 - t1
+
+            seen = set()
+            delivered = 0
+            for arrival, payload in hec.drain():
+                delivered += 1
+                path = payload.get('event', {}).get('object_path')
+                if path in ops and path not in seen:
+                    seen.add(path)
+                    latencies.append(arrival - ops[path])
+
+            total_events += len(events)
+            total_time += t2 - t0
+            rounds.append({'round': rnd, 'operations': len(ops), 'events': len(events),
+                'delivered': delivered, 'process': t1 - t0, 'returner': t2 - t1})
+    finally:
+        hec.shutdown()
+        if not args.keep:
+            shutil.rmtree(root, ignore_errors=True)
+
+    latencies.sort()
+    return {
+        'tree': root,
+        'watches': watch_count,
+        'setup': setup_time,
+        'events': total_events,
+        'seconds': total_time,
+        'events_per_second': total_events / total_time if total_time else 0.0,
+        'phases': phases,
+        'latency': dict(('p{0}'.format(p), percentile(latencies, p)) for p in (50, 90, 99, 100)),
+        'rounds': rounds,
+    }
+
+
+def show(report):
+    print('tree={tree} watches={watches} initial-sweep={setup:0.3f}s'.format(**report))
+    for r in report['rounds']:
+        print('  round={round} ops={operations} events={events} delivered={delivered} '
+              'process={process:0.3f}s returner={returner:0.3f}s'.format(**r))
+    print('events={events} seconds={seconds:0.3f} events/s={events_per_second:0.1f}'.format(**report))
+    print('phases: ' + '; '.join('{0}={1:0.3f}s'.format(k, v) for k, v in sorted(report['phases'].items())))
+    print('latency: ' + '; '.join('{0}={1:0.3f}s'.format(k, v) for k, v in sorted(report['latency'].items())))
+
+
+def main(args):
+    if not pulsar.HAS_PYINOTIFY:
+        print('# pulsar requires pyinotify')
+        return 1
+    report = run(args)
+    if args.json:
+        print(json.dumps(report, indent=2, sort_keys=True))
+    else:
+        show(report)
+    return 0
+
+
+if __name__ == '__main__':
+    try:
+        sys.exit(main(get_args()))
+    except KeyboardInterrupt:
+        pass
@@ -189,7 +189,9 @@ main:
 import os
 import logging
 
+import hubblestack.module_runner.fact_cache as fact_cache
 import hubblestack.module_runner.runner_utils as runner_utils
+import hubblestack.utils.grep
 from hubblestack.exceptions import HubbleCheckValidationError, CommandExecutionError
 
 log = logging.getLogger(__name__)
@@ -342,9 +344,18 @@ def _grep(path,
     args
         Additional command-line flags to pass to the grep command. For example:
         ``-v``, or ``-i -B2``
+
+    Common invocations are evaluated in-process (see hubblestack.utils.grep),
+    with the file read once per audit run; grep is run for everything else.
     """
     if path:
         path = os.path.expanduser(path)
+        lines = fact_cache.call('grep.read_lines', hubblestack.utils.grep.read_lines, path)
+    else:
+        lines = hubblestack.utils.grep.split_lines(string)
+    ret = hubblestack.utils.grep.grep(lines, pattern, *args)
+    if ret is not None:
+        return ret
 
     if args:
         options = [' '.join(args)]
@@ -362,3 +373,23 @@ def _grep(path,
         raise CommandExecutionError(exc.strerror)
 
     return ret
+
+
+def get_fingerprint(block_id, block_dict, extra_args=None):
+    """
+    Fingerprint of the inputs of this module, for incremental audits: the file
+    searched. None when searching chained content
+
+    :param block_id:
+        id of the block
+    :param block_dict:
+        parameter for this module
+    :param extra_args:
+        Extra argument dictionary, (If any)
+        Example: {'chaining_args': {'result': "/some/path/file.txt", 'status': True},
+                  'caller': 'Audit'}
+    """
+    if runner_utils.get_chained_param(extra_args):
+        return None
+    filepath = runner_utils.get_param_for_module(block_id, block_dict, 'path')
+    return runner_utils.get_file_fingerprint(filepath)
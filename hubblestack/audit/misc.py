@@ -257,13 +257,16 @@ import os
 import logging
 
 import re
+import shlex
 
 from hubblestack.exceptions import CommandExecutionError
 from collections import Counter
 
 import hubblestack.module_runner.comparator
 from hubblestack.module_runner.runner import Caller
+import hubblestack.module_runner.fact_cache as fact_cache
 import hubblestack.module_runner.runner_utils as runner_utils
+import hubblestack.utils.grep
 from hubblestack.exceptions import HubbleCheckValidationError
 import hubblestack.audit.grep as grep_module
 
@@ -557,13 +560,20 @@ def _check_directory_files_permission(block_id, block_dict, extra_args=None):
     files_list = files_list.split('\n') if files_list != "" else []
     bad_permission_files = []
     for file_in_directory in files_list:
-        per = _compare_file_stats(block_id, file_in_directory, permission, True)
+        # find only lists regular files, so one lstat gives all the stats
+        try:
+            file_stat = os.lstat(file_in_directory)
+        except OSError:
+            raise CommandExecutionError("Path not found: {0}".format(file_in_directory))
+        path_details = __mods__['file.stats_from_result'](file_in_directory, file_stat, lstat=file_stat)
+        per = _compare_file_stats(block_id, file_in_directory, permission, True, path_details)
         if per is not True:
             bad_permission_files += [file_in_directory + ": Bad Permission - " + per + ":"]
     return True if bad_permission_files == [] else str(bad_permission_files)
 
-def _compare_file_stats(block_id, path, permission, allow_more_strict=False):
-    path_details = __mods__['file.stats'](path)
+def _compare_file_stats(block_id, path, permission, allow_more_strict=False, path_details=None):
+    if path_details is None:
+        path_details = __mods__['file.stats'](path)
 
     comparator_args = {
         "type": "file_permission",
@@ -917,9 +927,23 @@ def _grep(path,
         salt '*' file.grep /etc/sysconfig/network-scripts/ifcfg-eth0 ipaddr -- -i
         salt '*' file.grep /etc/sysconfig/network-scripts/ifcfg-eth0 ipaddr -- -i -B2
         salt '*' file.grep "/etc/sysconfig/network-scripts/*" ipaddr -- -i -l
+
+    Common invocations are evaluated in-process (see hubblestack.utils.grep),
+    with the file read once per audit run; grep is run for everything else.
     """
     path = os.path.expanduser(path)
 
+    # the command line below gets split like a shell would, so the pattern does too
+    try:
+        words = shlex.split(pattern)
+    except ValueError:
+        words = []
+    if len(words) == 1:
+        lines = fact_cache.call('grep.read_lines', hubblestack.utils.grep.read_lines, path)
+        ret = hubblestack.utils.grep.grep(lines, words[0], *args)
+        if ret is not None:
+            return ret
+
     if args:
         options = ' '.join(args)
     else:
@@ -935,7 +959,7 @@ def _grep(path,
 
     try:
         log.info(cmd)
-        ret = __salt__['cmd.run_all'](cmd, python_shell=False, ignore_retcode=True)
+        ret = __mods__['cmd.run_all'](cmd, python_shell=False, ignore_retcode=True)
     except (IOError, OSError) as exc:
         raise CommandExecutionError(exc.strerror)
 
@@ -186,6 +186,7 @@ import json
 import logging
 import os
 
+import hubblestack.utils.osquery_lib
 import hubblestack.module_runner.runner_utils as runner_utils
 from hubblestack.exceptions import HubbleCheckValidationError
 
@@ -309,7 +310,8 @@ def _osquery(block_id, query, osquery_path=None, args=None, cast_to_string=None)
         cmd.extend(args)
 
     # Run the command
-    res = __mods__['cmd.run_all'](cmd, timeout=10000, python_shell=False)
+    res = hubblestack.utils.osquery_lib.run_all_cached(cmd, query, run_all=__mods__['cmd.run_all'],
+                                                       timeout=10000, python_shell=False)
     if res['retcode'] == 0:
         ret = json.loads(res['stdout'])
         for result in ret:
@@ -181,7 +181,9 @@ main:
 import logging
 import fnmatch
 
+import hubblestack.module_runner.fact_cache as fact_cache
 import hubblestack.module_runner.runner_utils as runner_utils
+import hubblestack.utils.pkg
 from hubblestack.exceptions import HubbleCheckValidationError
 
 log = logging.getLogger(__name__)
@@ -240,7 +242,7 @@ def execute(block_id, block_dict, extra_args=None):
     if not name:
         name = runner_utils.get_param_for_module(block_id, block_dict, 'name')
 
-    installed_pkgs_dict = __mods__['pkg.list_pkgs']()
+    installed_pkgs_dict = fact_cache.call('pkg.list_pkgs', __mods__['pkg.list_pkgs'])
     filtered_pkgs_list = fnmatch.filter(installed_pkgs_dict, name)
     result_dict = {}
     for package in filtered_pkgs_list:
@@ -269,3 +271,20 @@ def get_filtered_params_to_log(block_id, block_dict, extra_args=None):
         name = runner_utils.get_param_for_module(block_id, block_dict, 'name')
 
     return {'name': name}
+
+
+def get_fingerprint(block_id, block_dict, extra_args=None):
+    """
+    Fingerprint of the inputs of this module, for incremental audits: the
+    package database. None if it is unknown
+
+    :param block_id:
+        id of the block
+    :param block_dict:
+        parameter for this module
+    :param extra_args:
+        Extra argument dictionary, (If any)
+        Example: {'chaining_args': {'result': "/some/path/file.txt", 'status': True},
+                  'caller': 'Audit'}
+    """
+    return hubblestack.utils.pkg.db_fingerprint()
@@ -224,10 +224,8 @@ main:
 
 import os
 import logging
-import json as _json
-import yaml as _yaml
-import re
 
+import hubblestack.utils.readfile
 from hubblestack.utils.encoding import encode_base64
 import hubblestack.module_runner.runner_utils as runner_utils
 from hubblestack.exceptions import HubbleCheckValidationError
@@ -336,15 +334,11 @@ def _handle_file_helper(file_format, block_id, path, subkey=None, sep=None, chai
         log.error('Path %s not found.', path)
         return runner_utils.prepare_negative_result_for_module(block_id, 'file_not_found')
 
+    if file_format not in ('json', 'yaml'):
+        return runner_utils.prepare_negative_result_for_module(block_id, 'unknown_format')
     ret = None
     try:
-        with open(path, 'r') as file_handle:
-            if file_format == 'json':
-                ret = _json.load(file_handle)
-            elif file_format == 'yaml':
-                ret = _yaml.safe_load(file_handle)
-            else:
-                return runner_utils.prepare_negative_result_for_module(block_id, 'unknown_format')
+        ret = hubblestack.utils.readfile.load(path, file_format)
     except Exception:
         log.error('Error reading file %s.', path, exc_info=True)
         return runner_utils.prepare_negative_result_for_module(block_id, 'exception while reading file')
@@ -497,78 +491,29 @@ def _lines_as_list(path, pattern, ignore_pattern):
     Helper function for config. Process lines as list of strings.
     """
     try:
-        # All lines as list of strings
-        if not pattern and not ignore_pattern:
-            with open(path, 'r') as input_file:
-                ret = input_file.readlines()
-                ret = [s.strip() for s in ret]
-                return ret
-        # Some lines as a list of strings
-        ret = []
-        with open(path, 'r') as input_file:
-            for line in input_file:
-                line = line.strip()
-                if not _check_pattern(line, pattern, ignore_pattern):
-                    continue
-                ret.append(line)
+        return hubblestack.utils.readfile.lines_as_list(path, pattern, ignore_pattern)
     except Exception:
         log.error('Error while processing readfile.config for file %s.', path, exc_info=True)
         return None
 
-    return ret
-
 
 def _lines_as_dict(path, pattern, ignore_pattern, dictsep, valsep, subsep):
     """
     Helper function for congig. Process lines as dict.
     """
-    ret = {}
-    found_keys = set()
-    processed_keys = set()
-
     try:
-        with open(path, 'r') as input_file:
-            for line in input_file:
-                line = line.strip()
-                if not _check_pattern(line, pattern, ignore_pattern):
-                    continue
-                key, val = _process_line(line, dictsep, valsep, subsep)
-                if key in found_keys and key not in processed_keys:
-                    # Duplicate keys, make it a list of values underneath
-                    # and add to list of values
-                    ret[key] = [ret[key]]
-                    ret[key].append(val)
-                    processed_keys.add(key)
-                elif key in found_keys and key in processed_keys:
-                    # Duplicate keys, add to list of values
-                    ret[key].append(val)
-                else:
-                    # First found, add to dict as normal
-                    ret[key] = val
-                    found_keys.add(key)
+        return hubblestack.utils.readfile.lines_as_dict(path, pattern, ignore_pattern, dictsep, valsep, subsep)
     except Exception:
         log.error('Error while processing readfile.config for file %s.', path, exc_info=True)
         return None
 
-    return ret
-
 
 def _check_pattern(line, pattern, ignore_pattern):
     """
     Check a given line against both a pattern and an ignore_pattern and return
     True or False based on whether that line should be used.
     """
-    keep = False
-
-    if pattern is None:
-        keep = True
-    elif re.match(pattern, line):
-        keep = True
-
-    if ignore_pattern is not None and re.match(ignore_pattern, line):
-        keep = False
-
-    return keep
+    return hubblestack.utils.readfile.check_pattern(line, pattern, ignore_pattern)
 
 
 def _process_line(line, dictsep, valsep, subsep):
@@ -576,37 +521,7 @@ def _process_line(line, dictsep, valsep, subsep):
     Process a given line of data using the dictsep, valsep, and subsep
     provided. For documentation, please see the docstring for ``config()``
     """
-    if dictsep is None:
-        return line, None
-
-    try:
-        key, val = line.split(dictsep, 1)
-    except (AttributeError, ValueError, TypeError):
-        return line, None
-
-    if valsep is not None:
-        # List of values
-        val = val.split(valsep)
-
-        # List of key-value pairs to form into a dict
-        if subsep is not None:
-            new_val = {}
-            for subval in val:
-                try:
-                    val_key, val_val = subval.split(subsep, 1)
-                except (AttributeError, ValueError, TypeError):
-                    val_key, val_val = subval, None
-                new_val[val_key] = val_val
-            val = new_val
-    elif subsep is not None:
-        # Single key-value pair to form into a dict
-        try:
-            val_key, val_val = val.split(subsep, 1)
-        except (AttributeError, ValueError, TypeError):
-            val_key, val_val = val, None
-        val = {val_key: val_val}
-
-    return key, val
+    return hubblestack.utils.readfile.process_line(line, dictsep, valsep, subsep)
 
 
 def _handle_string_file(block_id, block_dict, extra_args=None):
@@ -639,8 +554,7 @@ def _readfile_string(block_id, path, encode_b64=False, chained_param=None):
     if not os.path.isfile(path):
         log.error('Path %s not found.', path)
         return runner_utils.prepare_negative_result_for_module(block_id, 'file_not_found')
-    with open(path, 'r') as input_file:
-        ret = input_file.read()
+    ret = hubblestack.utils.readfile.read(path)
     status = bool(ret)
     if encode_b64:
         status, ret = encode_base64(ret, format_chained=False)
@@ -666,3 +580,23 @@ def get_filtered_params_to_log(block_id, block_dict, extra_args=None):
     # fetch required param
     filepath = runner_utils.get_param_for_module(block_id, block_dict, 'path')
     return {'path': filepath}
+
+
+def get_fingerprint(block_id, block_dict, extra_args=None):
+    """
+    Fingerprint of the inputs of this module, for incremental audits: the file
+    read. None when reading a chained path
+
+    :param block_id:
+        id of the block
+    :param block_dict:
+        parameter for this module
+    :param extra_args:
+        Extra argument dictionary, (If any)
+        Example: {'chaining_args': {'result': '/some/path', 'status': True},
+                  'caller': 'Audit'}
+    """
+    if runner_utils.get_chained_param(extra_args):
+        return None
+    path = runner_utils.get_param_for_module(block_id, block_dict, 'path')
+    return runner_utils.get_file_fingerprint(path)
@@ -132,6 +132,10 @@ where,
     enabled: whether services is enabled to start on boot time or not
              This flag will be used for systemctl module as alternate
 
+On systemd, the states of all units are read at once (``service.unit_states``)
+and shared by all checks of an audit run, rather than asking systemctl about
+every matched service.
+
 Output: (True, "Above dictionary")
 Note: Module returns a tuple
     First value being the status of module
@@ -185,8 +189,9 @@ main:
 import logging
 import fnmatch
 
+import hubblestack.module_runner.fact_cache as fact_cache
 import hubblestack.module_runner.runner_utils as runner_utils
-from hubblestack.exceptions import HubbleCheckValidationError
+from hubblestack.exceptions import CommandExecutionError, HubbleCheckValidationError
 
 log = logging.getLogger(__name__)
 
@@ -246,10 +251,16 @@ def execute(block_id, block_dict, extra_args=None):
         name = runner_utils.get_param_for_module(block_id, block_dict, 'name')
 
     result = []
-    matched_services = fnmatch.filter(__mods__['service.get_all'](), name)
+    matched_services = fnmatch.filter(fact_cache.call('service.get_all', __mods__['service.get_all']), name)
+    unit_states = fact_cache.call('service.unit_states', _get_unit_states) if matched_services else None
     for matched_service in matched_services:
-        service_status = __mods__['service.status'](matched_service)
-        is_enabled = __mods__['service.enabled'](matched_service)
+        state = _get_unit_state(unit_states, matched_service)
+        service_status = state['running']
+        if service_status is None:
+            service_status = fact_cache.call('service.status', __mods__['service.status'], matched_service)
+        is_enabled = state['enabled']
+        if is_enabled is None:
+            is_enabled = fact_cache.call('service.enabled', __mods__['service.enabled'], matched_service)
         result.append({
             "name": matched_service,
             "running": service_status,
@@ -259,6 +270,31 @@ def execute(block_id, block_dict, extra_args=None):
     return runner_utils.prepare_positive_result_for_module(block_id, result)
 
 
+def _get_unit_states():
+    """
+    Running/enabled states of all services, if the service module can list
+    them at once (systemd), else None
+    """
+    if 'service.unit_states' not in __mods__:
+        return None
+    try:
+        return __mods__['service.unit_states']()
+    except CommandExecutionError as exc:
+        log.warning('Could not list the unit states, asking for each service: %s', exc)
+        return None
+
+
+def _get_unit_state(unit_states, name):
+    """
+    The state of a service in unit_states; None for what has to be asked
+    """
+    state = None
+    if unit_states:
+        # service units are listed without their suffix, other units with it
+        state = unit_states.get(name + '.service') or unit_states.get(name)
+    return state or {'running': None, 'enabled': None}
+
+
 def get_filtered_params_to_log(block_id, block_dict, extra_args=None):
     """
     For getting params to log, in non-verbose logging
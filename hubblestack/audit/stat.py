@@ -197,6 +197,7 @@ main:
 import os
 import logging
 
+import hubblestack.module_runner.fact_cache as fact_cache
 import hubblestack.module_runner.runner_utils as runner_utils
 from hubblestack.exceptions import HubbleCheckValidationError
 
@@ -257,7 +258,7 @@ def execute(block_id, block_dict, extra_args=None):
     if not os.path.isfile(filepath):
         return runner_utils.prepare_negative_result_for_module(block_id, 'file_not_found')
 
-    stat_res = __mods__['file.stats'](filepath)
+    stat_res = fact_cache.call('file.stats', __mods__['file.stats'], filepath)
     return runner_utils.prepare_positive_result_for_module(block_id, stat_res)
 
 
@@ -280,3 +281,23 @@ def get_filtered_params_to_log(block_id, block_dict, extra_args=None):
     if not filepath:
         filepath = runner_utils.get_param_for_module(block_id, block_dict, 'path')
     return {'path': filepath}
+
+
+def get_fingerprint(block_id, block_dict, extra_args=None):
+    """
+    Fingerprint of the inputs of this module, for incremental audits: the file,
+    and the user and group databases its owner names come from
+
+    :param block_id:
+        id of the block
+    :param block_dict:
+        parameter for this module
+    :param extra_args:
+        Extra argument dictionary, (If any)
+        Example: {'chaining_args': {'result': "/some/path/file.txt", 'status': True},
+                  'caller': 'Audit'}
+    """
+    if runner_utils.get_chained_param(extra_args):
+        return None
+    filepath = runner_utils.get_param_for_module(block_id, block_dict, 'path')
+    return [runner_utils.get_file_fingerprint(path) for path in (filepath, '/etc/passwd', '/etc/group')]
@@ -114,7 +114,8 @@ In case of chaining, it expects a string from the chained parameter
 Module Arguments
 ----------------
 - name
-    name of kernel parameter
+    name of kernel parameter. It can be a glob pattern (applied to each
+    component of the name, e.g. net.ipv4.conf.*.rp_filter) on Linux
 
 Module Output
 -------------
@@ -124,6 +125,12 @@ Module Output
 
 Output: (True, {'vm.zone_reclaim_mode': '8'})
 
+For a pattern, the output has all the matching parameters:
+{
+    'net.ipv4.conf.all.rp_filter': '1',
+    'net.ipv4.conf.default.rp_filter': '1'
+}
+
 Note: Module returns a tuple
     First value being the status of module
     Second value is the actual output from module
@@ -170,7 +177,9 @@ main:
 """
 
 import logging
+import re
 
+import hubblestack.module_runner.fact_cache as fact_cache
 import hubblestack.module_runner.runner_utils as runner_utils
 from hubblestack.exceptions import HubbleCheckValidationError
 
@@ -230,7 +239,13 @@ def execute(block_id, block_dict, extra_args=None):
     if not name:
         name = runner_utils.get_param_for_module(block_id, block_dict, 'name')
 
-    sysctl_res = __mods__['sysctl.get'](name)
+    if 'sysctl.get_matching' in __mods__ and re.search(r'[*?\[]', name):
+        result = fact_cache.call('sysctl.get_matching', __mods__['sysctl.get_matching'], name)
+        if not result:
+            return runner_utils.prepare_negative_result_for_module(block_id, "Could not find attribute %s in the kernel" %(name))
+        return runner_utils.prepare_positive_result_for_module(block_id, dict(result))
+
+    sysctl_res = fact_cache.call('sysctl.get', __mods__['sysctl.get'], name)
     result = {name: sysctl_res}
     if not sysctl_res or "No such file or directory" in sysctl_res:
         return runner_utils.prepare_negative_result_for_module(block_id, "Could not find attribute %s in the kernel" %(name))
@@ -260,3 +275,26 @@ def get_filtered_params_to_log(block_id, block_dict, extra_args=None):
     if not name:
         name = runner_utils.get_param_for_module(block_id, block_dict, 'name')
     return {'name': name}
+
+
+def get_fingerprint(block_id, block_dict, extra_args=None):
+    """
+    Fingerprint of the inputs of this module, for incremental audits: the
+    value of the kernel parameter(s)
+
+    :param block_id:
+        id of the block
+    :param block_dict:
+        parameter for this module
+    :param extra_args:
+        Extra argument dictionary, (If any)
+        Example: {'chaining_args': {'result': "vm.zone_reclaim_mode", 'status': True},
+                  'caller': 'Audit'}
+    """
+    name = runner_utils.get_chained_param(extra_args)
+    if not name:
+        name = runner_utils.get_param_for_module(block_id, block_dict, 'name')
+
+    if 'sysctl.get_matching' in __mods__ and re.search(r'[*?\[]', name):
+        return fact_cache.call('sysctl.get_matching', __mods__['sysctl.get_matching'], name)
+    return fact_cache.call('sysctl.get', __mods__['sysctl.get'], name)
@@ -69,6 +69,23 @@ List comparator exposes various commands:
                 - name: xyz
                   running: true
 
+Matching dictionaries by key
+    match_any, match_all and match_any_if_keyvalue_matches pair the expected
+    dictionaries with the result dictionaries by the value of one key (the
+    match_key, or a key all expected dictionaries have with a plain value,
+    e.g. name), instead of comparing every one with every other, for large
+    lists or when the key is given with index_by. The results are the same
+    either way.
+
+    comparator:
+        type: "list"
+        index_by: name
+        match_all:
+            - name: abc
+              running: false
+            - name: xyz
+              running: true
+
 - "filter_compare"
     example (Filter a list, compare it with any other command of list comparator)
 
@@ -111,6 +128,10 @@ import hubblestack.module_runner.comparator
 
 log = logging.getLogger(__name__)
 
+# pair dicts by key (see "Matching dictionaries by key") when comparing more
+# than this many pairs of them
+INDEX_MIN_PAIRS = 256
+
 
 def size(audit_id, result_to_compare, args):
     """
@@ -191,38 +212,55 @@ def match_any(audit_id, result_to_compare, args):
         Comparator dictionary as mentioned in the check.
     """
     log.debug('Running list::match_any for check: {0}'.format(audit_id))
-
+    number_args = {"type": "number", "match_any": args['match_any']}
+    dict_args = {"type": "dict", "match_any": args['match_any']}
+    expected_values = None
+    expected_index = None
     for r_compare in result_to_compare:
         if is_integer(r_compare):
             ret_status, ret_val = hubblestack.module_runner.comparator.run(
                 audit_id,
-                {"type": "number", "match_any": args['match_any']},
+                number_args,
                 int(r_compare))
             if ret_status:
                 return True, "Check Passed"
         if isinstance(r_compare, dict):
-            # using dict::match_any
-            ret_status, ret_val = hubblestack.module_runner.comparator.run(
-                audit_id,
-                {"type": "dict", "match_any": args['match_any']},
-                r_compare)
+            if expected_index is None:
+                expected_index = _use_index(args, result_to_compare, args['match_any']) and \
+                    _get_expected_index(args, args['match_any'])
+            candidates = _get_candidates(expected_index, r_compare)
+            if candidates is None:
+                # using dict::match_any
+                ret_status, ret_val = hubblestack.module_runner.comparator.run(
+                    audit_id,
+                    dict_args,
+                    r_compare)
+            elif candidates:
+                # using dict::match_any, with only the dicts having the same key value
+                ret_status, ret_val = hubblestack.module_runner.comparator.run(
+                    audit_id,
+                    {"type": "dict", "match_any": candidates},
+                    r_compare)
+            else:
+                # no expected dict can match this one
+                ret_status = False
             if ret_status:
                 return True, "Check Passed"
         else:
             # direct compare
-            for to_compare in args['match_any']:
+            if expected_values is None:
+                expected_values = _get_expected_values(args['match_any'])
+            for to_compare, comparator_args in expected_values:
                 # check if it has specified any custom comparator
-                if isinstance(to_compare, dict):
-                    dict_key = list(to_compare.keys())[0]
-                    if 'type' in to_compare[dict_key]:
-                        # Lets hand-over this new specific comparison to comparator orchestrator
-                        ret_status, ret_val = hubblestack.module_runner.comparator.run(
-                            audit_id,
-                            to_compare[dict_key],
-                            r_compare)
-                        if ret_status:
-                            return True, "Check Passed"
-                else:
+                if comparator_args is not None:
+                    # Lets hand-over this new specific comparison to comparator orchestrator
+                    ret_status, ret_val = hubblestack.module_runner.comparator.run(
+                        audit_id,
+                        comparator_args,
+                        r_compare)
+                    if ret_status:
+                        return True, "Check Passed"
+                elif not isinstance(to_compare, dict):
                     # primitive datatype comparison
                     if to_compare == r_compare:
                         return True, "Check Passed"
@@ -230,6 +268,22 @@ def match_any(audit_id, result_to_compare, args):
     return False, "list::match_any failure. Got={0}".format(result_to_compare)
 
 
+def _get_expected_values(expected_list):
+    """
+    Pair each expected value with its custom comparator dict (or None), so
+    that is worked out once rather than for every element of the result
+    """
+    ret = []
+    for to_compare in expected_list:
+        comparator_args = None
+        if isinstance(to_compare, dict):
+            dict_key = list(to_compare.keys())[0]
+            if 'type' in to_compare[dict_key]:
+                comparator_args = to_compare[dict_key]
+        ret.append((to_compare, comparator_args))
+    return ret
+
+
 def match_all(audit_id, result_to_compare, args):
     """
     Match all of dictionary mentioned. Match only mentioned attributes
@@ -243,16 +297,29 @@ def match_all(audit_id, result_to_compare, args):
     """
     log.debug('Running list::match_all for check: {0}'.format(audit_id))
 
+    result_index = None
+    if _use_index(args, result_to_compare, args['match_all']) and \
+            all(isinstance(r_compare, dict) for r_compare in result_to_compare):
+        index_key = _get_index_key(args, args['match_all'])
+        if index_key is not None:
+            result_index = _build_index(result_to_compare, index_key)
+
     for to_compare in args['match_all']:
         found_match = False
-        for r_compare in result_to_compare:
+        dict_args = {"type": "dict", "match": to_compare}
+        candidates = result_to_compare
+        if result_index is not None and isinstance(to_compare, dict) and _is_plain(to_compare.get(index_key)) \
+                and index_key in to_compare:
+            # only the results with the same key value can match
+            candidates = _lookup(result_index, to_compare[index_key])
+        for r_compare in candidates:
             ret_status = False
 
             if isinstance(r_compare, dict):
                 # using dict::match
                 ret_status, ret_val = hubblestack.module_runner.comparator.run(
                     audit_id,
-                    {"type": "dict", "match": to_compare},
+                    dict_args,
                     r_compare)
             elif isinstance(to_compare, dict):
                 dict_key = list(to_compare.keys())[0]
@@ -314,11 +381,35 @@ def match_any_if_keyvalue_matches(audit_id, result_to_compare, args):
 
     key_name = args['match_any_if_keyvalue_matches']['match_key']
     failed_once = False
+    dict_args = {"type": "dict", "match_any_if_keyvalue_matches": args['match_any_if_keyvalue_matches']}
+    expected_index = None
+    expected_list = args['match_any_if_keyvalue_matches'].get('args')
+    if isinstance(expected_list, list) and _use_index(args, result_to_compare, expected_list) and \
+            all(isinstance(to_match, dict) and to_match.get(key_name) for to_match in expected_list):
+        expected_index = _build_index(expected_list, key_name)
+        if expected_index[1]:
+            # not all of the key values can be indexed
+            expected_index = None
     for r_compare in result_to_compare:
-        ret_status, ret_val = hubblestack.module_runner.comparator.run(
-            audit_id,
-            {"type": "dict", "match_any_if_keyvalue_matches": args['match_any_if_keyvalue_matches']},
-            r_compare)
+        if expected_index is not None and isinstance(r_compare, dict) and key_name in r_compare:
+            try:
+                candidates = expected_index[0].get(r_compare[key_name])
+            except TypeError:
+                candidates = expected_list
+            if not candidates:
+                # dict::match_any_if_keyvalue_matches passes when no expected dict has the key value
+                ret_status, ret_val = True, "pass_as_keyvalue_not_found"
+            else:
+                candidate_args = dict(args['match_any_if_keyvalue_matches'], args=candidates)
+                ret_status, ret_val = hubblestack.module_runner.comparator.run(
+                    audit_id,
+                    {"type": "dict", "match_any_if_keyvalue_matches": candidate_args},
+                    r_compare)
+        else:
+            ret_status, ret_val = hubblestack.module_runner.comparator.run(
+                audit_id,
+                dict_args,
+                r_compare)
         if ret_status and ret_val != "pass_as_key_not_found":
             return True, "Check Passed"
         if not ret_status:
@@ -344,10 +435,11 @@ def filter_compare(audit_id, result_to_compare, args):
 
     filter_dict_args = args['filter_compare']['filter']
     filtered_list = []
+    filter_args = {"type": "dict", "match": filter_dict_args}
     for r_compare in result_to_compare:
         ret_status, ret_val = hubblestack.module_runner.comparator.run(
             audit_id,
-            {"type": "dict", "match": filter_dict_args},
+            filter_args,
             r_compare)
         if ret_status:
             filtered_list.append(r_compare)
@@ -359,3 +451,94 @@ def filter_compare(audit_id, result_to_compare, args):
         audit_id,
         filter_comparator_args,
         filtered_list)
+
+
+def _use_index(args, result_to_compare, expected_list):
+    """
+    Whether to pair the dicts by key rather than compare all pairs
+    """
+    if args.get('index_by') is not None:
+        return True
+    return len(result_to_compare) * len(expected_list) > INDEX_MIN_PAIRS
+
+
+def _is_plain(value):
+    """
+    Whether value is compared as is by dict::match (and can be indexed)
+    """
+    return isinstance(value, (str, int, float))
+
+
+def _get_index_key(args, expected_list):
+    """
+    The key to pair expected and result dicts by: index_by if given, else
+    the first key of the first expected dict which all of them have with a
+    plain value. None if there is none.
+    """
+    if args.get('index_by') is not None:
+        return args['index_by']
+    if not expected_list or not all(isinstance(to_compare, dict) for to_compare in expected_list):
+        return None
+    for key in expected_list[0]:
+        if all(key in to_compare and _is_plain(to_compare[key]) for to_compare in expected_list):
+            return key
+    return None
+
+
+def _build_index(dicts, key):
+    """
+    Index dicts by their value of key. Returns the index and the dicts that
+    couldn't be indexed (having an unhashable value); dicts without the key
+    are left out.
+    """
+    index = {}
+    unindexed = []
+    for item in dicts:
+        if key not in item:
+            continue
+        try:
+            index.setdefault(item[key], []).append(item)
+        except TypeError:
+            unindexed.append(item)
+    return index, unindexed
+
+
+def _lookup(index, value):
+    """
+    The indexed dicts which may have value as their key value
+    """
+    return index[0].get(value, []) + index[1]
+
+
+def _get_expected_index(args, expected_list):
+    """
+    Index the expected dicts of match_any by key, or False if they can't be
+    """
+    index_key = _get_index_key(args, expected_list)
+    if index_key is None or not all(isinstance(to_compare, dict) for to_compare in expected_list):
+        return False
+    index = {}
+    unindexed = []
+    for to_compare in expected_list:
+        if index_key in to_compare and _is_plain(to_compare[index_key]):
+            index.setdefault(to_compare[index_key], []).append(to_compare)
+        else:
+            # may match whatever the key value of the result is
+            unindexed.append(to_compare)
+    return index_key, index, unindexed
+
+
+def _get_candidates(expected_index, r_compare):
+    """
+    The expected dicts of match_any which may match r_compare, or None if
+    all of them have to be tried
+    """
+    if not expected_index:
+        return None
+    index_key, index, unindexed = expected_index
+    if index_key not in r_compare:
+        return unindexed
+    try:
+        return index.get(r_compare[index_key], []) + unindexed
+    except TypeError:
+        return None
@@ -40,12 +40,24 @@ Complete Example
             user: root
 """
 
+import functools
 import logging
+import operator
 
 from hubblestack.exceptions import HubbleCheckValidationError
 
 log = logging.getLogger(__name__)
 
+# checked in order, so '<=' is found before '<'
+_OPERATORS = (
+    ('<=', operator.le),
+    ('>=', operator.ge),
+    ('<', operator.lt),
+    ('>', operator.gt),
+    ('==', operator.eq),
+    ('!=', operator.ne),
+)
+
 
 def match(audit_id, result_to_compare, args):
     """
@@ -99,19 +111,19 @@ def _match(result_to_compare, expected_result):
         return result_to_compare == expected_result
 
     # got string having some comparison operators
+    compare, expected_number = _parse_expected(expected_result)
+    return compare(result_to_compare, expected_number)
+
+
+@functools.lru_cache(maxsize=1024)
+def _parse_expected(expected_result):
+    """
+    Parse an expected value like "> 10" into its comparison function and
+    number, once for all the checks using it
+    """
     expected_result_value = expected_result.strip()
-    if expected_result_value.startswith('<='):
-        return result_to_compare <= int(expected_result_value[2:].strip())
-    elif expected_result_value.startswith('>='):
-        return result_to_compare >= int(expected_result_value[2:].strip())
-    elif expected_result_value.startswith('<'):
-        return result_to_compare < int(expected_result_value[1:].strip())
-    elif expected_result_value.startswith('>'):
-        return result_to_compare > int(expected_result_value[1:].strip())
-    elif expected_result_value.startswith('=='):
-        return result_to_compare == int(expected_result_value[2:].strip())
-    elif expected_result_value.startswith('!='):
-        return result_to_compare != int(expected_result_value[2:].strip())
-    else:
-        raise HubbleCheckValidationError('Unknown operator in number::match arg: {0}'
-                                         .format(expected_result_value))
+    for prefix, compare in _OPERATORS:
+        if expected_result_value.startswith(prefix):
+            return compare, int(expected_result_value[len(prefix):].strip())
+    raise HubbleCheckValidationError('Unknown operator in number::match arg: {0}'
+                                     .format(expected_result_value))
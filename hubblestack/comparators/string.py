@@ -26,6 +26,7 @@ String comparator exposes various commands:
         is_regex: true # Optional, default False
         is_multiline: false # Optional. Works only when is_regex=True
 """
+import functools
 import logging
 import re
 
@@ -79,7 +80,15 @@ def _compare(result_to_compare, expected_string, args):
     if is_regex:
         is_multiline = args.get('is_multiline', True)
         if is_multiline:
-            return re.search(expected_string, result_to_compare, re.MULTILINE)
-        return re.search(expected_string, result_to_compare)
+            return _compile_regex(expected_string, re.MULTILINE).search(result_to_compare)
+        return _compile_regex(expected_string, 0).search(result_to_compare)
     else:
         return result_to_compare == expected_string
+
+
+@functools.lru_cache(maxsize=1024)
+def _compile_regex(pattern, flags):
+    """
+    Compile a regex once for all the checks using it
+    """
+    return re.compile(pattern, flags)
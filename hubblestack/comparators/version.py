@@ -47,11 +47,23 @@ Complete Example
                 match: 3.28.0-1.el7
 """
 
+import functools
 import logging
+import operator
 from distutils.version import LooseVersion
 
 log = logging.getLogger(__name__)
 
+# checked in order, so '<=' is found before '<'
+_OPERATORS = (
+    ('<=', operator.le),
+    ('>=', operator.ge),
+    ('<', operator.lt),
+    ('>', operator.gt),
+    ('==', operator.eq),
+    ('!=', operator.ne),
+)
+
 
 def match(audit_id, result_to_compare, args):
     """
@@ -93,22 +105,25 @@ def _match(result_to_compare, expected_result):
     """
     compare versions
     """
+    compare, expected_version = _parse_expected(expected_result)
+    return compare(_parse_version(result_to_compare), expected_version)
+
+
+@functools.lru_cache(maxsize=1024)
+def _parse_expected(expected_result):
+    """
+    Parse an expected value like ">= 1.2.3" into its comparison function and
+    version, once for all the checks using it
+    """
     # got string having some comparison operators
     expected_result_value = expected_result.strip()
-    result_version_to_compare = LooseVersion(result_to_compare)
-
-    if expected_result_value.startswith('<='):
-        return result_version_to_compare <= LooseVersion(expected_result_value[2:].strip())
-    elif expected_result_value.startswith('>='):
-        return result_version_to_compare >= LooseVersion(expected_result_value[2:].strip())
-    elif expected_result_value.startswith('<'):
-        return result_version_to_compare < LooseVersion(expected_result_value[1:].strip())
-    elif expected_result_value.startswith('>'):
-        return result_version_to_compare > LooseVersion(expected_result_value[1:].strip())
-    elif expected_result_value.startswith('=='):
-        return result_version_to_compare == LooseVersion(expected_result_value[2:].strip())
-    elif expected_result_value.startswith('!='):
-        return result_version_to_compare != LooseVersion(expected_result_value[2:].strip())
-    else:
-        # direct comparison
-        return result_version_to_compare == LooseVersion(expected_result_value.strip())
+    for prefix, compare in _OPERATORS:
+        if expected_result_value.startswith(prefix):
+            return compare, LooseVersion(expected_result_value[len(prefix):].strip())
+    # direct comparison
+    return operator.eq, LooseVersion(expected_result_value.strip())
+
+
+@functools.lru_cache(maxsize=4096)
+def _parse_version(version):
+    return LooseVersion(version)
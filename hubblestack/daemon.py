@@ -18,6 +18,7 @@ import signal
 import socket
 import sys
 import time
+import types
 import uuid
 from datetime import datetime
 
@@ -27,6 +28,7 @@ import hubblestack.modules.cmdmod
 import hubblestack.utils
 import hubblestack.utils.platform
 import hubblestack.utils.jid
+import hubblestack.utils.osquery_lib
 import hubblestack.utils.gitfs
 import hubblestack.utils.path
 from croniter import croniter
@@ -353,21 +355,33 @@ def _execute_function(jobdata, func, returners, args, kwargs):
     """ Run the scheduled function """
     log.debug('Executing scheduled function %s', func)
     jobdata['last_run'] = time.time()
-    ret = __mods__[func](*args, **kwargs)
-    if __opts__['log_level'] == 'debug':
-        log.debug('Job returned:\n%s', ret)
-    for returner in returners:
-        returner = '{0}.returner'.format(returner)
-        if returner not in __returners__:
-            log.error('Could not find %s returner.', returner)
-            continue
-        log.debug('Returning job data to %s', returner)
-        returner_ret = {'id': __grains__['id'],
-                        'jid': hubblestack.utils.jid.gen_jid(__opts__),
-                        'fun': func,
-                        'fun_args': args + ([kwargs] if kwargs else []),
-                        'return': ret}
-        __returners__[returner](returner_ret)
+    for ret in _job_returns(__mods__[func](*args, **kwargs)):
+        if __opts__['log_level'] == 'debug':
+            log.debug('Job returned:\n%s', ret)
+        for returner in returners:
+            returner = '{0}.returner'.format(returner)
+            if returner not in __returners__:
+                log.error('Could not find %s returner.', returner)
+                continue
+            log.debug('Returning job data to %s', returner)
+            returner_ret = {'id': __grains__['id'],
+                            'jid': hubblestack.utils.jid.gen_jid(__opts__),
+                            'fun': func,
+                            'fun_args': args + ([kwargs] if kwargs else []),
+                            'return': ret}
+            __returners__[returner](returner_ret)
+
+
+def _job_returns(ret):
+    """
+    Functions may return a generator of chunks (e.g. nebula.osqueryd_log_parser
+    with chunk_size set) so that large results are handed to the returners
+    piecewise; each chunk is then returned as if it was a whole job return.
+    Anything else is a single return.
+    """
+    if isinstance(ret, types.GeneratorType):
+        return ret
+    return [ret]
 
 
 def _process_job(jobdata, splay, seconds, min_splay, base):
@@ -419,22 +433,29 @@ def run_function():
     log.debug('Parsed args: %s | Parsed kwargs: %s', args, kwargs)
     log.info('Executing user-requested function %s', __opts__['function'])
     try:
-        ret = __mods__[__opts__['function']](*args, **kwargs)
+        job_ret = __mods__[__opts__['function']](*args, **kwargs)
     except KeyError:
         log.error('Function %s is not available, or not valid.', __opts__['function'])
         sys.exit(1)
-    if __opts__['return']:
-        returner = '{0}.returner'.format(__opts__['return'])
-        if returner not in __returners__:
-            log.error('Could not find %s returner.', returner)
-        else:
-            log.info('Returning job data to %s', returner)
-            returner_ret = {'id': __grains__['id'],
-                            'jid': hubblestack.utils.jid.gen_jid(__opts__),
-                            'fun': __opts__['function'],
-                            'fun_args': args + ([kwargs] if kwargs else []),
-                            'return': ret}
-            __returners__[returner](returner_ret)
+    chunked = isinstance(job_ret, types.GeneratorType)
+    all_ret = []
+    for ret in _job_returns(job_ret):
+        if chunked:
+            all_ret.extend(ret)
+        if __opts__['return']:
+            returner = '{0}.returner'.format(__opts__['return'])
+            if returner not in __returners__:
+                log.error('Could not find %s returner.', returner)
+            else:
+                log.info('Returning job data to %s', returner)
+                returner_ret = {'id': __grains__['id'],
+                                'jid': hubblestack.utils.jid.gen_jid(__opts__),
+                                'fun': __opts__['function'],
+                                'fun_args': args + ([kwargs] if kwargs else []),
+                                'return': ret}
+                __returners__[returner](returner_ret)
+    if chunked:
+        ret = all_ret
     # TODO instantiate the salt outputter system?
     if __opts__['json_print']:
         print(json.dumps(ret))
@@ -759,12 +780,15 @@ def refresh_grains(initial=False):
     hubblestack.status.__opts__ = __opts__
     hubblestack.status.__mods__ = __mods__
 
+    hubblestack.utils.osquery_lib.__opts__ = __opts__
+
     hubblestack.utils.signing.__opts__ = __opts__
     hubblestack.utils.signing.__mods__ = __mods__
 
     hubblestack.module_runner.runner.__mods__ = __mods__
     hubblestack.module_runner.runner.__grains__ = __grains__
     hubblestack.module_runner.runner.__opts__ = __opts__
+    hubblestack.module_runner.runner.GRAINS_GENERATION += 1
 
     hubblestack.module_runner.audit_runner.__mods__ = __mods__
     hubblestack.module_runner.audit_runner.__grains__ = __grains__
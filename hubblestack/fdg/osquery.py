@@ -10,6 +10,8 @@ import json
 import logging
 import os
 
+import hubblestack.utils.osquery_lib
+
 log = logging.getLogger(__name__)
 
 
@@ -86,7 +88,8 @@ def _osquery(query_sql, osquery_path=None, args=None):
         cmd.extend(args)
 
     # Run the command
-    res = __mods__['cmd.run_all'](cmd, timeout=10000, python_shell=False)
+    res = hubblestack.utils.osquery_lib.run_all_cached(cmd, query_sql, run_all=__mods__['cmd.run_all'],
+                                                       timeout=10000, python_shell=False)
 
     if res['retcode'] == 0:
         ret = json.loads(res['stdout'])
@@ -7,13 +7,10 @@ options for format and filtering.
 """
 
 
-import json as _json
 import logging
 import os
-import re
-
-import yaml as _yaml
 
+import hubblestack.utils.readfile
 from hubblestack.utils.encoding import encode_base64
 
 log = logging.getLogger(__name__)
@@ -54,8 +51,7 @@ def json(path, subkey=None, sep=None, chained=None, chained_status=None):
 
     ret = None
     try:
-        with open(path, 'r') as jfile:
-            ret = _json.load(jfile)
+        ret = hubblestack.utils.readfile.load(path, 'json')
     except Exception:
         log.error('Error reading file %s.', path, exc_info=True)
 
@@ -113,8 +109,7 @@ def yaml(path, subkey=None, sep=None, chained=None, chained_status=None):
 
     ret = None
     try:
-        with open(path, 'r') as yaml_file:
-            ret = _yaml.safe_load(yaml_file)
+        ret = hubblestack.utils.readfile.load(path, 'yaml')
     except Exception:
         log.error('Error reading file %s.', path, exc_info=True)
 
@@ -251,78 +246,29 @@ def _lines_as_list(path, pattern, ignore_pattern):
     Helper function for config. Process lines as list of strings.
     """
     try:
-        # All lines as list of strings
-        if not pattern and not ignore_pattern:
-            with open(path, 'r') as input_file:
-                ret = input_file.readlines()
-                ret = [s.strip() for s in ret]
-                return ret
-        # Some lines as a list of strings
-        ret = []
-        with open(path, 'r') as input_file:
-            for line in input_file:
-                line = line.strip()
-                if not _check_pattern(line, pattern, ignore_pattern):
-                    continue
-                ret.append(line)
+        return hubblestack.utils.readfile.lines_as_list(path, pattern, ignore_pattern)
     except Exception:
         log.error('Error while processing readfile.config for file %s.', path, exc_info=True)
         return None
 
-    return ret
-
 
 def _lines_as_dict(path, pattern, ignore_pattern, dictsep, valsep, subsep):
     """
     Helper function for congig. Process lines as dict.
     """
-    ret = {}
-    found_keys = set()
-    processed_keys = set()
-
     try:
-        with open(path, 'r') as input_file:
-            for line in input_file:
-                line = line.strip()
-                if not _check_pattern(line, pattern, ignore_pattern):
-                    continue
-                key, val = _process_line(line, dictsep, valsep, subsep)
-                if key in found_keys and key not in processed_keys:
-                    # Duplicate keys, make it a list of values underneath
-                    # and add to list of values
-                    ret[key] = [ret[key]]
-                    ret[key].append(val)
-                    processed_keys.add(key)
-                elif key in found_keys and key in processed_keys:
-                    # Duplicate keys, add to list of values
-                    ret[key].append(val)
-                else:
-                    # First found, add to dict as normal
-                    ret[key] = val
-                    found_keys.add(key)
+        return hubblestack.utils.readfile.lines_as_dict(path, pattern, ignore_pattern, dictsep, valsep, subsep)
     except Exception:
         log.error('Error while processing readfile.config for file %s.', path, exc_info=True)
         return None
 
-    return ret
-
 
 def _check_pattern(line, pattern, ignore_pattern):
     """
     Check a given line against both a pattern and an ignore_pattern and return
     True or False based on whether that line should be used.
     """
-    keep = False
-
-    if pattern is None:
-        keep = True
-    elif re.match(pattern, line):
-        keep = True
-
-    if ignore_pattern is not None and re.match(ignore_pattern, line):
-        keep = False
-
-    return keep
+    return hubblestack.utils.readfile.check_pattern(line, pattern, ignore_pattern)
 
 
 def _process_line(line, dictsep, valsep, subsep):
@@ -330,37 +276,7 @@ def _process_line(line, dictsep, valsep, subsep):
     Process a given line of data using the dictsep, valsep, and subsep
     provided. For documentation, please see the docstring for ``config()``
     """
-    if dictsep is None:
-        return line, None
-
-    try:
-        key, val = line.split(dictsep, 1)
-    except (AttributeError, ValueError, TypeError):
-        return line, None
-
-    if valsep is not None:
-        # List of values
-        val = val.split(valsep)
-
-        # List of key-value pairs to form into a dict
-        if subsep is not None:
-            new_val = {}
-            for subval in val:
-                try:
-                    val_key, val_val = subval.split(subsep, 1)
-                except (AttributeError, ValueError, TypeError):
-                    val_key, val_val = subval, None
-                new_val[val_key] = val_val
-            val = new_val
-    elif subsep is not None:
-        # Single key-value pair to form into a dict
-        try:
-            val_key, val_val = val.split(subsep, 1)
-        except (AttributeError, ValueError, TypeError):
-            val_key, val_val = val, None
-        val = {val_key: val_val}
-
-    return key, val
+    return hubblestack.utils.readfile.process_line(line, dictsep, valsep, subsep)
 
 
 def readfile_string(path, encode_b64=False, chained=None, chained_status=None):
@@ -390,8 +306,7 @@ def readfile_string(path, encode_b64=False, chained=None, chained_status=None):
         log.error('Path %s not found.', path)
         return False, None
     try:
-        with open(path, 'r') as input_file:
-            ret = input_file.read()
+        ret = hubblestack.utils.readfile.read(path)
     except Exception:
         log.error('Error reading file %s', path, exc_info=True)
         return False, None
@@ -1296,15 +1296,27 @@ class FilterDictWrapper(MutableMapping):
                 yield key.replace(self.suffix, '')
 
 
+# the (opts, loader) of the last matchers() call
+_MATCHERS = (None, None)
+
+
 def matchers(opts):
     '''
     Return the matcher services plugins
+
+    The loader is reused as long as the same opts are passed in.
     '''
-    return LazyLoader(
+    global _MATCHERS
+    cached_opts, loader = _MATCHERS
+    if cached_opts is opts:
+        return loader
+    loader = LazyLoader(
         _module_dirs(opts, 'matchers'),
         opts,
         tag='matchers'
     )
+    _MATCHERS = (opts, loader)
+    return loader
 
 def _nova_funcname_filter(funcname, mod):
     """
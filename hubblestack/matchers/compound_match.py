@@ -3,7 +3,9 @@
 This is the default compound matcher function.
 """
 
+import functools
 import logging
+import threading
 
 import hubblestack.loader
 import hubblestack.utils.minions  # pylint: disable=3rd-party-module-not-gated
@@ -18,13 +20,55 @@ except ImportError:
 
 log = logging.getLogger(__name__)
 
+# results of earlier matches; only valid for the opts, grains and pillar they were made with
+_RESULTS = {'opts': None, 'grains': None, 'pillar': None, 'results': {}}
+_RESULTS_LOCK = threading.Lock()
+
+
+@functools.lru_cache(maxsize=4096)
+def _parse_target(word):
+    """
+    Parse a word of a compound target (cached, the returned dict must not be modified)
+    """
+    return hubblestack.utils.minions.parse_target(word)
+
 
 def match(tgt, opts=None):
     """
     Runs the compound target check
+
+    The result is remembered until the grains (or pillar, or opts) are
+    replaced, e.g. by a grains refresh, so the same target is only evaluated
+    once per grains generation.
     """
     if not opts:
         opts = __opts__
+    if isinstance(tgt, str):
+        key = tgt
+    elif isinstance(tgt, (list, tuple)):
+        key = tuple(tgt)
+    else:
+        key = None
+    # range lookups are made against an external service, don't remember them
+    if key is None or 'R@' in str(key):
+        return _match(tgt, opts)
+
+    grains, pillar = opts.get('grains'), opts.get('pillar')
+    with _RESULTS_LOCK:
+        if _RESULTS['opts'] is not opts or _RESULTS['grains'] is not grains or _RESULTS['pillar'] is not pillar:
+            _RESULTS.update(opts=opts, grains=grains, pillar=pillar, results={})
+        results = _RESULTS['results']
+        if key in results:
+            return results[key]
+    ret = _match(tgt, opts)
+    results[key] = ret
+    return ret
+
+
+def _match(tgt, opts):
+    """
+    Evaluate the compound target
+    """
     nodegroups = opts.get("nodegroups", {})
     matchers = hubblestack.loader.matchers(opts)
     minion_id = opts.get("minion_id", opts["id"])
@@ -57,7 +101,7 @@ def match(tgt, opts=None):
 
     while words:
         word = words.pop(0)
-        target_info = hubblestack.utils.minions.parse_target(word)
+        target_info = _parse_target(word)
 
         # Easy check first
         if word in opers:
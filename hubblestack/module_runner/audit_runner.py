@@ -1,7 +1,13 @@
 import os
+import time
+import queue
 import logging
 import fnmatch
+import threading
+import collections
 
+import hubblestack.module_runner.fact_cache as fact_cache
+import hubblestack.module_runner.incremental as incremental
 import hubblestack.module_runner.runner
 from hubblestack.module_runner.runner import Caller
 
@@ -11,6 +17,8 @@ from hubblestack.exceptions import HubbleCheckVersionIncompatibleError
 from hubblestack.exceptions import HubbleCheckValidationError
 
 log = logging.getLogger(__name__)
+# audit file => (compile key, compiled profile); see AuditRunner._get_compiled_profile
+COMPILED_PROFILES = {}
 CHECK_STATUS = {
     'Success': 'Success',
     'Failure': 'Failure',
@@ -27,18 +35,81 @@ class AuditRunner(hubblestack.module_runner.runner.Runner):
     def __init__(self):
         super().__init__(Caller.AUDIT)
 
+    def execute(self, file, args={}):
+        """
+        Execute a profile file; facts looked up by the audit modules are cached
+        for the profile, or for the enclosing fact_cache.scope() (if any)
+        """
+        with fact_cache.scope():
+            return super().execute(file, args)
+
     # overridden method
     def _execute(self, audit_data_dict, audit_file, args):
         # got data for one audit file
-        # lets parse, validate and execute one by one
-        tags = args.get('tags', '*')
-        labels = args.get('labels', None)
+        # the compiled profile has the matched and validated checks; lets execute them one by one
         verbose = args.get('verbose', None)
+        max_workers = args.get('max_workers', 1) or 1
+        check_timeout = args.get('check_timeout', None)
+        # see hubblestack.module_runner.incremental
+        result_store = args.get('result_store', None)
         result_list = []
+        check_list = []
         boolean_expr_check_list = []
         audit_profile = os.path.splitext(os.path.basename(audit_file))[0]
+        for entry in self._get_compiled_profile(audit_data_dict, audit_file, args):
+            if 'result' in entry:
+                # error/skipped result, known at compile time
+                result_list.append(dict(entry['result']))
+            elif self._is_boolean_expression(entry['audit_impl']):
+                boolean_expr_check_list.append(entry)
+            elif max_workers > 1:
+                # keep a slot for the result, so results keep the profile order
+                check_list.append((len(result_list), entry))
+                result_list.append(None)
+            else:
+                # handover to module
+                result_list.append(self._execute_check(entry, verbose, audit_profile, result_store=result_store))
+
+        if check_list:
+            check_results = self._execute_parallel([check for _, check in check_list], verbose, audit_profile,
+                                                   max_workers, check_timeout, result_store)
+            for (index, _), check_result in zip(check_list, check_results):
+                result_list[index] = check_result
+        result_list = [result for result in result_list if result is not None]
+
+        # Evaluate boolean expressions
+        boolean_expr_result_list = self._evaluate_boolean_expression(
+            boolean_expr_check_list, verbose, audit_profile, result_list)
+        result_list = result_list + boolean_expr_result_list
+
+        # return list of results for a file
+        return result_list
+
+    def _get_compiled_profile(self, audit_data_dict, audit_file, args):
+        """
+        Return the compiled profile for audit_file: a list, in profile order, of
+        the checks whose implementation matched (with validated params), and
+        of the error/skipped results for checks that failed validation.
+
+        This only depends on the profile contents, the tags and labels asked
+        for, the grains and the hubble version; so it's kept until one of
+        those changes.
+        """
+        tags = args.get('tags', '*')
+        labels = args.get('labels', None)
+        profile_digest = args.get('profile_digest')
+        key = (profile_digest, hubblestack.module_runner.runner.GRAINS_GENERATION,
+               __grains__.get('hubble_version'), tags, tuple(labels) if labels else None)
+        if profile_digest is not None:
+            cached = COMPILED_PROFILES.get(audit_file)
+            if cached is not None and cached[0] == key:
+                log.debug('Using compiled audit profile: %s', audit_file)
+                return cached[1]
+
+        compiled_profile = []
+        audit_profile = os.path.splitext(os.path.basename(audit_file))[0]
         for audit_id, audit_data in audit_data_dict.items():
-            log.debug('Executing check-id: %s in audit profile: %s', audit_id, audit_profile)
+            log.debug('Compiling check-id: %s in audit profile: %s', audit_id, audit_profile)
             audit_impl = self._get_matched_implementation(audit_id, audit_data, tags, labels)
             if not audit_impl:
                 # no matched impl found
@@ -54,41 +125,174 @@ class AuditRunner(hubblestack.module_runner.runner.Runner):
                 if not self._is_hubble_version_compatible(audit_id, audit_impl):
                     raise HubbleCheckVersionIncompatibleError('Version not compatible')
 
+                entry = {
+                    'check_id': audit_id,
+                    'audit_impl': audit_impl,
+                    'audit_data': audit_data
+                }
                 if self._is_boolean_expression(audit_impl):
                     # Check is boolean expression.
-                    # Gather boolean expressions in separate list and evaluate after evaluating all other checks.
+                    # It is evaluated after all other checks, so its validation errors are reported there.
                     log.debug('Boolean expression found. Gathering it to evaluate later.')
-                    boolean_expr_check_list.append({
-                        'check_id': audit_id,
-                        'audit_impl': audit_impl,
-                        'audit_data': audit_data
-                    })
+                    try:
+                        entry['run_config'] = self._compile_audit(audit_id, audit_impl, audit_data)
+                    except HubbleCheckValidationError as herror:
+                        entry['error'] = herror
                 else:
-                    # handover to module
-                    audit_result = self._execute_audit(audit_id, audit_impl, audit_data, verbose, audit_profile)
-                    result_list.append(audit_result)
+                    entry['run_config'] = self._compile_audit(audit_id, audit_impl, audit_data)
+                compiled_profile.append(entry)
             except (HubbleCheckValidationError, HubbleCheckVersionIncompatibleError) as herror:
                 # add into error/skipped section
-                result_list.append({
-                    'check_id': audit_id,
-                    'tag': audit_data['tag'],
-                    'description': audit_data['description'],
-                    'sub_check': audit_data.get('sub_check', False),
-                    'check_result': CHECK_STATUS['Error'] if isinstance(herror, HubbleCheckValidationError) else
-                    CHECK_STATUS['Skipped'],
-                    'audit_profile': audit_profile
-                })
+                compiled_profile.append(
+                    {'result': self._get_check_error_result(audit_id, audit_data, audit_profile, herror)})
                 log.error(herror)
             except Exception as exc:
                 log.error(exc)
 
-        # Evaluate boolean expressions
-        boolean_expr_result_list = self._evaluate_boolean_expression(
-            boolean_expr_check_list, verbose, audit_profile, result_list)
-        result_list = result_list + boolean_expr_result_list
+        if profile_digest is not None:
+            COMPILED_PROFILES[audit_file] = (key, compiled_profile)
+        return compiled_profile
 
-        # return list of results for a file
-        return result_list
+    def _get_check_error_result(self, audit_id, audit_data, audit_profile, herror):
+        """
+        Result for a check that could not be evaluated: Error for validation
+        errors and timeouts, Skipped for incompatible versions
+        """
+        return {
+            'check_id': audit_id,
+            'tag': audit_data['tag'],
+            'description': audit_data['description'],
+            'sub_check': audit_data.get('sub_check', False),
+            'check_result': CHECK_STATUS['Skipped'] if isinstance(herror, HubbleCheckVersionIncompatibleError) else
+            CHECK_STATUS['Error'],
+            'audit_profile': audit_profile
+        }
+
+    def _execute_check(self, check, verbose, audit_profile, result_list=None, result_store=None,
+                       timed_out=None):
+        """
+        Execute one gathered check, returning its result, an error result,
+        or None if the check failed unexpectedly.
+
+        With a result_store, the stored result of the check is returned
+        instead, if the check and its inputs are unchanged since it was stored.
+        The result is not stored if the timed_out event is set by then (the
+        check has been reported as timed out).
+        """
+        try:
+            if 'error' in check:
+                raise check['error']
+            check_digest = None
+            if result_store is not None:
+                check_digest = self._get_check_digest(check, verbose)
+                if check_digest is not None:
+                    stored_result = result_store.get(audit_profile, check['check_id'], check_digest)
+                    if stored_result is not None:
+                        log.debug('Reusing the result of check-id: %s in audit profile: %s',
+                                  check['check_id'], audit_profile)
+                        return stored_result
+            audit_result = self._execute_audit(check['check_id'], check['audit_impl'], check['audit_data'],
+                                               verbose, audit_profile, result_list,
+                                               run_config=check.get('run_config'))
+            if check_digest is not None and not (timed_out is not None and timed_out.is_set()):
+                result_store.put(audit_profile, check['check_id'], check_digest, audit_result)
+            return audit_result
+        except (HubbleCheckValidationError, HubbleCheckVersionIncompatibleError) as herror:
+            log.error(herror)
+            return self._get_check_error_result(check['check_id'], check['audit_data'], audit_profile, herror)
+        except Exception as exc:
+            log.error(exc)
+        return None
+
+    def _execute_parallel(self, check_list, verbose, audit_profile, max_workers, check_timeout=None,
+                          result_store=None):
+        """
+        Execute the (independent) checks in check_list on up to max_workers
+        threads at a time. A check that runs longer than check_timeout seconds
+        (counted from when its thread started) gets an Error result, and its
+        thread is abandoned rather than waited for: the next check starts on a
+        new thread instead. Python threads can't be stopped, so the abandoned
+        check keeps running in the background until its module returns: until
+        then it holds on to whatever it holds (e.g. the fact cache lock of a fact
+        it is looking up, which later checks needing that fact wait for), and
+        its result is not stored for incremental runs.
+
+        Returns the results in the order of check_list
+        """
+        log.debug('Executing %d checks of audit profile: %s on %d threads',
+                  len(check_list), audit_profile, max_workers)
+        timed_out_events = [threading.Event() for _ in check_list]
+        done = queue.Queue()
+
+        def _run(index, check):
+            result = None
+            try:
+                result = self._execute_check(check, verbose, audit_profile, result_store=result_store,
+                                             timed_out=timed_out_events[index])
+            finally:
+                done.put((index, result))
+
+        ret = [None] * len(check_list)
+        waiting = collections.deque(enumerate(check_list))
+        # index of a running check => the time it started
+        running = {}
+        while waiting or running:
+            while waiting and len(running) < max_workers:
+                index, check = waiting.popleft()
+                running[index] = time.time()
+                thread = threading.Thread(target=_run, args=(index, check),
+                                          name='audit-check-{0}'.format(check['check_id']))
+                thread.daemon = True
+                thread.start()
+            timeout = None
+            if check_timeout:
+                timeout = max(0, min(running.values()) + check_timeout - time.time())
+            try:
+                index, result = done.get(timeout=timeout)
+                # results of abandoned checks are dropped
+                if running.pop(index, None) is not None:
+                    ret[index] = result
+            except queue.Empty:
+                pass
+            if not check_timeout:
+                continue
+            now = time.time()
+            for index, start in list(running.items()):
+                if now - start < check_timeout:
+                    continue
+                del running[index]
+                timed_out_events[index].set()
+                check = check_list[index]
+                log.error('check-id: %s in audit profile: %s timed out after %s seconds',
+                          check['check_id'], audit_profile, check_timeout)
+                result = self._get_check_error_result(check['check_id'], check['audit_data'],
+                                                      audit_profile, None)
+                result['failure_reason'] = 'Check timed out after {0} seconds'.format(check_timeout)
+                ret[index] = result
+        return ret
+
+    def _get_check_digest(self, check, verbose):
+        """
+        Digest of a check and of the fingerprints of its inputs, given by the
+        get_fingerprint() of its module for each item. None if the module (or
+        one of the items) has no fingerprint, and the check has to execute.
+        """
+        audit_impl = check['audit_impl']
+        fingerprints = []
+        for audit_check in audit_impl.get('items') or []:
+            try:
+                fingerprint = self._get_fingerprint(audit_impl['module'], check['check_id'], audit_check)
+            except Exception as exc:
+                log.debug('Could not fingerprint check-id: %s: %s', check['check_id'], exc)
+                fingerprint = None
+            if fingerprint is None:
+                return None
+            fingerprints.append(fingerprint)
+        if 'digest' not in check:
+            # the check itself only changes with the compiled profile
+            check['digest'] = incremental.digest([check['audit_data'], audit_impl,
+                                                  __grains__.get('hubble_version')])
+        return incremental.digest([check['digest'], verbose, fingerprints])
 
     # overridden method
     def _validate_yaml_dictionary(self, yaml_dict):
@@ -135,7 +339,60 @@ class AuditRunner(hubblestack.module_runner.runner.Runner):
     def _is_boolean_expression(self, audit_impl):
         return audit_impl.get('module', '') == 'bexpr'
 
-    def _execute_audit(self, audit_id, audit_impl, audit_data, verbose, audit_profile, result_list=None):
+    def _compile_audit(self, audit_id, audit_impl, audit_data):
+        """
+        Validate a check implementation and work out its run configuration
+        (everything that doesn't depend on executing the module)
+        :param audit_id:
+        :param audit_impl:
+        :param audit_data:
+        :return: dictionary of the run configuration
+        """
+        invert_result = audit_data.get('invert_result', False)
+        # check if the type of invert_result is boolean
+        if not isinstance(invert_result, bool):
+            raise HubbleCheckValidationError('value of invert_result is not a boolean in audit_id: {0}'.format(audit_id))
+
+        return_no_exec = audit_impl.get('return_no_exec', False)
+        # check if the type of invert_result is boolean
+        if not isinstance(return_no_exec, bool):
+            raise HubbleCheckValidationError('value of return_no_exec is not a boolean in audit_id: {0}'.format(audit_id))
+        check_eval_logic = audit_impl.get('check_eval_logic', 'and')
+        if check_eval_logic:
+            check_eval_logic = check_eval_logic.lower().strip()
+
+        run_config = {
+            'failure_reason': audit_data.get('failure_reason', ''),
+            'invert_result': invert_result,
+            'return_no_exec': return_no_exec,
+            'check_eval_logic': check_eval_logic,
+        }
+        if return_no_exec:
+            return run_config
+
+        # Check presence of implementation checks
+        if 'items' not in audit_impl:
+            raise HubbleCheckValidationError('No checks are present in audit_id: {0}'.format(audit_id))
+        if check_eval_logic not in ['and', 'or']:
+            raise HubbleCheckValidationError(
+                "Incorrect value provided for parameter 'check_eval_logic': %s" % check_eval_logic)
+
+        # Execute module validation of params
+        for audit_check in audit_impl['items']:
+            self._validate_module_params(audit_impl['module'], audit_id, audit_check)
+
+        # params logged in non verbose mode
+        run_config['params_to_log'] = [
+            self._get_filtered_params_to_log(audit_impl['module'], audit_id, audit_check) or {}
+            for audit_check in audit_impl['items']]
+        run_config['comparators'] = [
+            hubblestack.module_runner.comparator.compile_plan(audit_check['comparator'])
+            if 'comparator' in audit_check else None
+            for audit_check in audit_impl['items']]
+        return run_config
+
+    def _execute_audit(self, audit_id, audit_impl, audit_data, verbose, audit_profile, result_list=None,
+                       run_config=None):
         """
         Function to execute the module and return the result
         :param audit_id:
@@ -143,8 +400,13 @@ class AuditRunner(hubblestack.module_runner.runner.Runner):
         :param audit_data:
         :param verbose:
         :param audit_profile:
+        :param result_list:
+        :param run_config:
+            The (compiled) run configuration of the check, see _compile_audit
         :return:
         """
+        if run_config is None:
+            run_config = self._compile_audit(audit_id, audit_impl, audit_data)
         audit_result = {
             "check_id": audit_id,
             "description": audit_data['description'],
@@ -157,26 +419,16 @@ class AuditRunner(hubblestack.module_runner.runner.Runner):
             }
         }
 
-        failure_reason = audit_data.get('failure_reason', '')
-        invert_result = audit_data.get('invert_result', False)
-        # check if the type of invert_result is boolean
-        if not isinstance(invert_result, bool):
-            raise HubbleCheckValidationError('value of invert_result is not a boolean in audit_id: {0}'.format(audit_id))
-
-        return_no_exec = audit_impl.get('return_no_exec', False)
-        # check if the type of invert_result is boolean
-        if not isinstance(return_no_exec, bool):
-            raise HubbleCheckValidationError('value of return_no_exec is not a boolean in audit_id: {0}'.format(audit_id))
-        check_eval_logic = audit_impl.get('check_eval_logic', 'and')
-        if check_eval_logic:
-            check_eval_logic = check_eval_logic.lower().strip()
+        failure_reason = run_config['failure_reason']
+        invert_result = run_config['invert_result']
+        check_eval_logic = run_config['check_eval_logic']
 
         # check for check_eval_logic in check implementation. If not present default is 'and'
         audit_result['run_config']['check_eval_logic'] = check_eval_logic
         audit_result['invert_result'] = invert_result
 
         # check if return_no_exec is true
-        if return_no_exec:
+        if run_config['return_no_exec']:
             audit_result['run_config']['return_no_exec'] = True
             check_result = CHECK_STATUS['Success']
             if invert_result:
@@ -185,17 +437,6 @@ class AuditRunner(hubblestack.module_runner.runner.Runner):
             audit_result['check_result'] = check_result
             return audit_result
 
-        # Check presence of implementation checks
-        if 'items' not in audit_impl:
-            raise HubbleCheckValidationError('No checks are present in audit_id: {0}'.format(audit_id))
-        if check_eval_logic not in ['and', 'or']:
-            raise HubbleCheckValidationError(
-                "Incorrect value provided for parameter 'check_eval_logic': %s" % check_eval_logic)
-
-        # Execute module validation of params
-        for audit_check in audit_impl['items']:
-            self._validate_module_params(audit_impl['module'], audit_id, audit_check)
-
         # validate succeeded, lets execute it and prepare result dictionary
         audit_result['run_config']['items'] = []
 
@@ -204,12 +445,15 @@ class AuditRunner(hubblestack.module_runner.runner.Runner):
         # If check_eval_logic is 'or', any passed subcheck will result in success.
         overall_result = check_eval_logic == 'and'
         failure_reasons = []
-        for audit_check in audit_impl['items']:
+        comparators = run_config.get('comparators') or [None] * len(audit_impl['items'])
+        for audit_check, params_to_log, comparator in zip(audit_impl['items'], run_config['params_to_log'],
+                                                          comparators):
             mod_status, module_result_local = self._execute_module(audit_impl['module'], audit_id, audit_check,
                                                                    extra_args=result_list)
             # Invoke Comparator
-            comparator_status, comparator_result = hubblestack.module_runner.comparator.run(
-                audit_id, audit_check['comparator'], module_result_local, mod_status)
+            if comparator is None:
+                comparator = hubblestack.module_runner.comparator.compile_plan(audit_check['comparator'])
+            comparator_status, comparator_result = comparator(audit_id, module_result_local, mod_status)
 
             audit_result_local = {}
             if comparator_status:
@@ -222,9 +466,7 @@ class AuditRunner(hubblestack.module_runner.runner.Runner):
             module_logs = {}
             if not verbose:
                 log.debug('Non verbose mode')
-                module_logs = self._get_filtered_params_to_log(audit_impl['module'], audit_id, audit_check)
-                if not module_logs:
-                    module_logs = {}
+                module_logs = params_to_log
             else:
                 log.debug('verbose mode')
                 module_logs = audit_check
@@ -256,28 +498,58 @@ class AuditRunner(hubblestack.module_runner.runner.Runner):
                     audit_result['failure_reason'] = ', '.join(failure_reasons)
         return audit_result
 
+    def _get_referred_checks(self, boolean_expr):
+        """
+        Return the check ids referred in the expressions of a boolean expression check
+        """
+        keyword_list = ['AND', 'OR', 'NOT']
+        referred_checks = set()
+        for item in boolean_expr['audit_impl'].get('items') or []:
+            expr = (item.get('args') or {}).get('expr') if isinstance(item, dict) else None
+            if not isinstance(expr, str):
+                continue
+            for token in expr.replace('(', ' ').replace(')', ' ').split():
+                if token.upper() not in keyword_list:
+                    referred_checks.add(token)
+        return referred_checks
+
+    def _order_boolean_expressions(self, boolean_expr_check_list):
+        """
+        Order the boolean expression checks so that a check referring to other
+        boolean expression checks comes after them. Checks in a reference
+        cycle are left in profile order at the end (and will error out, as
+        their referred results are not available).
+        """
+        bexpr_ids = set(boolean_expr['check_id'] for boolean_expr in boolean_expr_check_list)
+        depends = {}
+        for boolean_expr in boolean_expr_check_list:
+            depends[boolean_expr['check_id']] = self._get_referred_checks(boolean_expr) & bexpr_ids
+        ordered = []
+        done = set()
+        remaining = list(boolean_expr_check_list)
+        while remaining:
+            ready = [boolean_expr for boolean_expr in remaining if depends[boolean_expr['check_id']] <= done]
+            if not ready:
+                log.error('Boolean expression checks: %s refer to each other',
+                          ', '.join(boolean_expr['check_id'] for boolean_expr in remaining))
+                ordered.extend(remaining)
+                break
+            ordered.extend(ready)
+            done.update(boolean_expr['check_id'] for boolean_expr in ready)
+            remaining = [boolean_expr for boolean_expr in remaining if boolean_expr['check_id'] not in done]
+        return ordered
+
     def _evaluate_boolean_expression(self, boolean_expr_check_list, verbose, audit_profile, result_list):
-        boolean_expr_result_list = []
+        boolean_expr_results = {}
         if boolean_expr_check_list:
             log.debug("Evaluating boolean expression checks")
-            for boolean_expr in boolean_expr_check_list:
-                try:
-                    check_result = self._execute_audit(boolean_expr['check_id'], boolean_expr['audit_impl'],
-                                                       boolean_expr['audit_data'], verbose, audit_profile, result_list)
-                    boolean_expr_result_list.append(check_result)
-                except (HubbleCheckValidationError, HubbleCheckVersionIncompatibleError) as herror:
-                    # add into error section
-                    boolean_expr_result_list.append({
-                        'check_id': boolean_expr['check_id'],
-                        'tag': boolean_expr['audit_data']['tag'],
-                        'sub_check': boolean_expr['audit_data'].get('sub_check', False),
-                        'description': boolean_expr['audit_data']['description'],
-                        'check_result': CHECK_STATUS['Error'] if isinstance(herror, HubbleCheckValidationError) else
-                        CHECK_STATUS['Skipped'],
-                        'audit_profile': audit_profile
-                    })
-                    log.error(herror)
-                except Exception as exc:
-                    log.error(exc)
-
-        return boolean_expr_result_list
+            available_results = list(result_list)
+            for boolean_expr in self._order_boolean_expressions(boolean_expr_check_list):
+                check_result = self._execute_check(boolean_expr, verbose, audit_profile, available_results)
+                if check_result is not None:
+                    boolean_expr_results[boolean_expr['check_id']] = check_result
+                    available_results.append(check_result)
+
+        # results are returned in profile order
+        return [boolean_expr_results[boolean_expr['check_id']] for boolean_expr in boolean_expr_check_list
+                if boolean_expr['check_id'] in boolean_expr_results]
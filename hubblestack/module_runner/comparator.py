@@ -10,12 +10,51 @@ from hubblestack.exceptions import HubbleCheckFailedError
 
 log = logging.getLogger(__name__)
 
+# (comparator loader, {(type, keys of the comparator dict): comparator method name})
+_METHOD_CACHE = (None, {})
+
+
+class ComparatorPlan(object):
+    """
+    A comparator dict compiled for repeated use: the comparator command is
+    looked up once, and the comparators parse their expected values (regexes,
+    versions, numbers) once. Calling the plan is the same as calling run()
+    with its comparator dict.
+    """
+
+    def __init__(self, args):
+        self.args = args
+        self._method = (None, None)
+
+    def __call__(self, audit_id, module_result, module_status=True):
+        return _run(audit_id, self.args, module_result, module_status, self._get_method)
+
+    def _get_method(self, args):
+        comparators, method_name = self._method
+        if comparators is not __comparator__ or method_name is None:
+            method_name = _get_comparator_command(args)
+            self._method = (__comparator__, method_name)
+        return method_name
+
+
+def compile_plan(args):
+    """
+    Compile the comparator dict of a check into a ComparatorPlan
+    """
+    return ComparatorPlan(args)
+
 
 def run(audit_id, args, module_result, module_status=True):
     """
     Start the comparator execution
     """
+    return _run(audit_id, args, module_result, module_status, _get_comparator_command)
+
 
+def _run(audit_id, args, module_result, module_status, get_method):
+    """
+    Run the comparator of args; get_method(args) finds its command
+    """
     # First check if module failed, and is failed with whitelisted errors
     if 'success_on_error' in args and not module_status:
         if module_result['error'] in args['success_on_error']:
@@ -32,9 +71,7 @@ def run(audit_id, args, module_result, module_status=True):
         log.error(error_msg)
         return False, error_msg
 
-    global __comparator__
-
-    comparator_command_method_name = _find_comparator_command(args)
+    comparator_command_method_name = get_method(args)
     if not comparator_command_method_name:
         # raise error when no matched command found
         raise HubbleCheckFailedError('Unknown comparator or command for: {0}'.format(args['type']))
@@ -48,6 +85,22 @@ def run(audit_id, args, module_result, module_status=True):
     return comparator_result
 
 
+def _get_comparator_command(args):
+    """
+    Find matched comparator's command, remembering it for comparator dicts
+    with the same type and keys
+    """
+    global _METHOD_CACHE
+    comparators, methods = _METHOD_CACHE
+    if comparators is not __comparator__:
+        methods = {}
+        _METHOD_CACHE = (__comparator__, methods)
+    key = (args.get('type'), tuple(args))
+    if key not in methods:
+        methods[key] = _find_comparator_command(args)
+    return methods[key]
+
+
 def _find_comparator_command(args):
     """
     Find matched comparator's command
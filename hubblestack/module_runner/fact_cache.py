@@ -0,0 +1,138 @@
+"""
+A run-scoped cache of facts (package lists, service states, file stats, ...)
+for the audit modules.
+
+Within one audit run, many checks ask the same questions. Modules look the
+facts up through call(), which memoizes the result while a scope() is active
+and simply calls the function otherwise:
+
+    installed_pkgs_dict = fact_cache.call('pkg.list_pkgs', __mods__['pkg.list_pkgs'])
+
+The cached values are shared between callers and must not be modified.
+"""
+
+import contextlib
+import logging
+import threading
+
+log = logging.getLogger(__name__)
+
+# the FactCache of the active scope, if any
+_CURRENT = None
+# stats of the last scope that ended
+LAST_STATS = {}
+
+
+class FactCache(object):
+    """
+    Memoizes the results of fact lookups, keyed by (fact name, args)
+    """
+
+    def __init__(self):
+        self._facts = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+        self.hits = {}
+        self.misses = {}
+
+    def call(self, name, func, *args):
+        """
+        Return the remembered result of func(*args), or call it and remember
+        its result. Concurrent lookups of the same fact call func only once.
+        """
+        key = (name, args)
+        with self._lock:
+            if key in self._facts:
+                self.hits[name] = self.hits.get(name, 0) + 1
+                return self._facts[key]
+            key_lock = self._locks.setdefault(key, threading.Lock())
+        with key_lock:
+            with self._lock:
+                if key in self._facts:
+                    self.hits[name] = self.hits.get(name, 0) + 1
+                    return self._facts[key]
+                self.misses[name] = self.misses.get(name, 0) + 1
+            ret = func(*args)
+            with self._lock:
+                self._facts[key] = ret
+                self._locks.pop(key, None)
+            return ret
+
+    def invalidate(self, name=None, *args):
+        """
+        Forget the facts called name (only the one for args, if given), or
+        everything if no name is given
+        """
+        with self._lock:
+            if name is None:
+                self._facts.clear()
+                return
+            for key in list(self._facts):
+                if key[0] == name and (not args or key[1] == args):
+                    del self._facts[key]
+
+    def stats(self):
+        """
+        Hits, misses and hit rate per fact name, and in total
+        """
+        with self._lock:
+            ret = {}
+            for name in set(self.hits) | set(self.misses):
+                ret[name] = _rates(self.hits.get(name, 0), self.misses.get(name, 0))
+            ret['total'] = _rates(sum(self.hits.values()), sum(self.misses.values()))
+            return ret
+
+
+def _rates(hits, misses):
+    lookups = hits + misses
+    return {'hits': hits, 'misses': misses,
+            'hit_rate': round(float(hits) / lookups, 3) if lookups else 0.0}
+
+
+@contextlib.contextmanager
+def scope():
+    """
+    Cache facts until the end of the outermost scope; nested scopes share
+    the cache of the outer one. The hit rates are logged when the cache ends.
+    """
+    global _CURRENT
+    global LAST_STATS
+    if _CURRENT is not None:
+        yield _CURRENT
+        return
+    _CURRENT = cache = FactCache()
+    try:
+        yield cache
+    finally:
+        _CURRENT = None
+        LAST_STATS = cache.stats()
+        if LAST_STATS['total']['hits'] or LAST_STATS['total']['misses']:
+            log.info('audit fact cache: %s', ', '.join(
+                '{0} {1}/{2} hits'.format(name, stats['hits'], stats['hits'] + stats['misses'])
+                for name, stats in sorted(LAST_STATS.items())))
+
+
+def current():
+    """
+    The FactCache of the active scope, or None
+    """
+    return _CURRENT
+
+
+def call(name, func, *args):
+    """
+    func(*args), remembered for the active scope (if any) as the fact name
+    """
+    cache = _CURRENT
+    if cache is None:
+        return func(*args)
+    return cache.call(name, func, *args)
+
+
+def invalidate(name=None, *args):
+    """
+    Forget facts of the active scope, see FactCache.invalidate
+    """
+    cache = _CURRENT
+    if cache is not None:
+        cache.invalidate(name, *args)
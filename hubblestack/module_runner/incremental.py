@@ -0,0 +1,116 @@
+"""
+Incremental audit evaluation: the results of the checks of an audit run are
+stored with a digest of the check and of the fingerprints of its inputs (see
+the get_fingerprint functions of the audit modules: file stats, the package
+database, sysctl values, ...). The next runs reuse a stored result as long as
+the digest is unchanged, instead of executing the check again.
+
+Checks of modules without fingerprints always execute, and every
+full_run_every'th run executes all the checks (still storing the results).
+"""
+
+import copy
+import hashlib
+import json
+import logging
+import os
+import threading
+
+import hubblestack.utils.atomicfile
+import hubblestack.utils.files
+
+log = logging.getLogger(__name__)
+
+# only these results are stored; errors are retried on the next run
+STORED_RESULTS = ('Success', 'Failure')
+
+
+def digest(data):
+    """
+    sha256 of (json serializable) data; anything json can't serialize is
+    identified by its str()
+    """
+    return hashlib.sha256(json.dumps(data, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+class ResultStore(object):
+    """
+    The check results of the last run, keyed by (audit profile, check id)
+    """
+
+    def __init__(self, path=None, full_run_every=24, runs=0, results=None):
+        self.path = path
+        self.full_run_every = full_run_every
+        # runs since the last full run; 0 if there was none
+        self.runs = runs
+        self._results = results or {}
+        self._new = {}
+        self._lock = threading.Lock()
+        self.reused = 0
+        self.executed = 0
+
+    @classmethod
+    def load(cls, path, full_run_every=24):
+        """
+        The store saved at path, or an empty one if it can't be read
+        """
+        if not path:
+            return cls(path, full_run_every)
+        try:
+            with hubblestack.utils.files.fopen(path, 'r') as handle:
+                data = json.load(handle)
+            return cls(path, full_run_every, int(data['runs']), dict(data['results']))
+        except (IOError, OSError, ValueError, KeyError, TypeError) as exc:
+            log.debug('Starting incremental audit results at %s: %s', path, exc)
+            return cls(path, full_run_every)
+
+    @property
+    def full_run(self):
+        """
+        Whether all the checks have to execute in this run
+        """
+        return self.runs == 0 or bool(self.full_run_every) and self.runs >= self.full_run_every
+
+    @staticmethod
+    def _key(audit_profile, check_id):
+        return '{0}|{1}'.format(audit_profile, check_id)
+
+    def get(self, audit_profile, check_id, check_digest):
+        """
+        The stored result of the check if it had the same digest, else None
+        """
+        key = self._key(audit_profile, check_id)
+        with self._lock:
+            stored = None if self.full_run else self._results.get(key)
+            if stored is None or stored[0] != check_digest:
+                self.executed += 1
+                return None
+            self._new[key] = stored
+            self.reused += 1
+            return copy.deepcopy(stored[1])
+
+    def put(self, audit_profile, check_id, check_digest, result):
+        """
+        Store the result of the check, executed with check_digest
+        """
+        if not result or result.get('check_result') not in STORED_RESULTS:
+            return
+        with self._lock:
+            self._new[self._key(audit_profile, check_id)] = (check_digest, copy.deepcopy(result))
+
+    def save(self):
+        """
+        Save the results of this run (only), for the next run
+        """
+        log.info('Incremental audit: reused %d and executed %d check results%s', self.reused, self.executed,
+                 ' (full run)' if self.full_run else '')
+        if not self.path:
+            return
+        runs = 1 if self.full_run else self.runs + 1
+        try:
+            if not os.path.isdir(os.path.dirname(self.path)):
+                os.makedirs(os.path.dirname(self.path))
+            with hubblestack.utils.atomicfile.atomic_open(self.path, 'w') as handle:
+                json.dump({'runs': runs, 'results': self._new}, handle, default=str)
+        except (IOError, OSError, TypeError, ValueError) as exc:
+            log.warning('Could not save the incremental audit results to %s: %s', self.path, exc)
@@ -4,6 +4,7 @@ A base class for Audit/FDG module runner.
 
 """
 import os
+import hashlib
 import logging
 import yaml
 from abc import ABC, abstractmethod
@@ -17,6 +18,12 @@ from hubblestack.exceptions import HubbleCheckValidationError
 log = logging.getLogger(__name__)
 __hmods__ = {}
 __comparator__ = {}
+# bumped on every grains refresh, to invalidate what was worked out from the old grains
+GRAINS_GENERATION = 0
+# cached profile file => (digest, loaded and validated yaml data)
+PROFILE_CACHE = {}
+# modules found to have no get_fingerprint(); looking it up again would rescan the module dirs
+NO_FINGERPRINT_MODULES = set()
 
 
 class Caller:
@@ -63,11 +70,18 @@ class Runner(ABC):
             raise CommandExecutionError('There was a problem caching the file: {0}'
                                         .format(file))
 
-        # load yaml and validate
-        yaml_data_dict = self._load_yaml(cached_file, file)
-        self._validate_yaml_dictionary(yaml_data_dict)
+        # load yaml and validate, unless the file is unchanged since the last time
+        digest = self._get_file_digest(cached_file)
+        cached = PROFILE_CACHE.get(cached_file)
+        if digest is not None and cached is not None and cached[0] == digest:
+            yaml_data_dict = cached[1]
+        else:
+            yaml_data_dict = self._load_yaml(cached_file, file)
+            self._validate_yaml_dictionary(yaml_data_dict)
+            if digest is not None:
+                PROFILE_CACHE[cached_file] = (digest, yaml_data_dict)
 
-        return self._execute(yaml_data_dict, file, args)
+        return self._execute(yaml_data_dict, file, dict(args, profile_digest=digest))
 
     def get_caller_name(self):
         return self._caller
@@ -148,6 +162,21 @@ class Runner(ABC):
                                                                    'extra_args': extra_args,
                                                                    'caller': self._caller})
 
+    def _get_fingerprint(self, module_name, profile_id, module_args, extra_args=None, chaining_args=None):
+        """
+        Helper method to execute a Module's get_fingerprint() method.
+        None if the module has none.
+        """
+        fingerprint_method = '{0}.get_fingerprint'.format(module_name)
+        if module_name in NO_FINGERPRINT_MODULES:
+            return None
+        if fingerprint_method not in __hmods__:
+            NO_FINGERPRINT_MODULES.add(module_name)
+            return None
+        return __hmods__[fingerprint_method](profile_id, module_args, {'chaining_args': chaining_args,
+                                                                       'extra_args': extra_args,
+                                                                       'caller': self._caller})
+
     def _make_file_available(self, file):
         """
         Cache file if path is salt://...
@@ -156,6 +185,16 @@ class Runner(ABC):
             return __mods__['cp.cache_file'](file)
         return file
 
+    def _get_file_digest(self, filepath):
+        """
+        sha256 of the file contents, or None if it can't be read
+        """
+        try:
+            with open(filepath, 'rb') as file_handle:
+                return hashlib.sha256(file_handle.read()).hexdigest()
+        except (IOError, OSError, TypeError):
+            return None
+
     def _load_yaml(self, filepath, filename):
         """
         Load and validate yaml file
@@ -4,6 +4,7 @@ It has utility methods to prepare return results as well. So that, the result fo
 """
 
 import logging
+import os
 
 log = logging.getLogger(__name__)
 
@@ -74,3 +75,19 @@ def prepare_positive_result_for_module(block_id, result):
     log.debug('Preparing return result for id: {0}'.format(block_id))
 
     return True, {'result': result}
+
+
+def get_file_fingerprint(path):
+    """
+    A fingerprint of the file at path, for a module's get_fingerprint():
+    its inode, size, mtime and ctime (which changes with its mode and owner
+    too), or 'missing' if there is no such file.
+
+    :param path:
+        Path of the file
+    """
+    try:
+        stat = os.stat(path)
+    except (IOError, OSError, TypeError, ValueError):
+        return 'missing'
+    return [stat.st_ino, stat.st_size, stat.st_mtime_ns, stat.st_ctime_ns]
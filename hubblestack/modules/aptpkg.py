@@ -20,6 +20,7 @@ import time
 
 import hubblestack.utils.data
 import hubblestack.utils.pkg
+import hubblestack.utils.pkg.deb
 import hubblestack.utils.systemd
 import hubblestack.utils.environment
 from hubblestack.exceptions import (
@@ -129,17 +130,13 @@ def list_pkgs(versions_as_list=False,
         return ret
 
     ret = {'installed': {}, 'removed': {}, 'purge_desired': {}}
-    cmd = ['dpkg-query', '--showformat',
-           '${Status} ${Package} ${Version} ${Architecture}\n', '-W']
-
-    out = __mods__['cmd.run_stdout'](
-            cmd,
-            output_loglevel='trace',
-            python_shell=False)
+    lines = hubblestack.utils.pkg.read_db(__opts__, 'dpkg',
+                                          hubblestack.utils.pkg.deb.DPKG_STATUS,
+                                          _read_dpkg_status)
     # Typical lines of output:
     # install ok installed zsh 4.3.17-1ubuntu1 amd64
     # deinstall ok config-files mc 3:4.8.1-2ubuntu1 amd64
-    for line in out.splitlines():
+    for line in lines:
         cols = line.split()
         try:
             linetype, status, name, version_num, arch = \
@@ -180,6 +177,23 @@ def list_pkgs(versions_as_list=False,
         __mods__['pkg_resource.stringify'](ret)
     return ret
 
+def _read_dpkg_status():
+    '''
+    The packages in the dpkg database as lines of ``dpkg-query -W``, read
+    from the status file directly if possible
+    '''
+    try:
+        return hubblestack.utils.pkg.deb.read_status()
+    except (IOError, OSError) as exc:
+        log.debug('Could not read the dpkg status file, running dpkg-query: %s', exc)
+    cmd = ['dpkg-query', '--showformat',
+           '${Status} ${Package} ${Version} ${Architecture}\n', '-W']
+    out = __mods__['cmd.run_stdout'](
+            cmd,
+            output_loglevel='trace',
+            python_shell=False)
+    return out.splitlines()
+
 def version(*names, **kwargs):
     '''
     Returns a string representing the package version or an empty string if not
@@ -86,13 +86,36 @@ The output of this module is dict containing result of execution of checks. It c
 3. Success - A check is executed and results in a success
 4. Failure - A check is executed and results in failure
 There are additional features as verbose logging, compliance and debug which can be passed as flags.
+
+The checks of a profile run one after another by default. Set
+hubblestack:nova:max_workers in the hubble config to run them on that many
+threads, and hubblestack:nova:check_timeout to give each check that many
+seconds before it results in an Error. A timed out check can't be stopped: it
+keeps running in the background until its module returns, while the next
+checks start on new threads. Boolean expression
+(bexpr) checks are evaluated after the checks they refer to; results keep the
+profile order.
+
+Facts looked up by the checks (package lists, service states, file stats and
+sysctl values) are cached for the duration of an audit run. Set
+hubblestack:nova:share_fact_cache to False to only share them between the
+checks of the same profile.
+
+Set hubblestack:nova:incremental to True (or pass incremental=True to run) to
+reuse the results of the checks whose inputs (files, packages, sysctl values)
+did not change since the last run, instead of executing them again. Every
+hubblestack:nova:incremental_full_run_every'th run (default: 24) executes all
+the checks anyway.
 """
 
+import contextlib
 import logging
 import os
 
 import yaml
 
+import hubblestack.module_runner.fact_cache as fact_cache
+import hubblestack.module_runner.incremental as incremental_results
 import hubblestack.module_runner.runner_factory as runner_factory
 from hubblestack.exceptions import CommandExecutionError
 from hubblestack.status import HubbleStatus
@@ -115,7 +138,8 @@ def run(audit_files=None,
         tags='*',
         labels=None,
         verbose=None,
-        show_compliance=None):
+        show_compliance=None,
+        incremental=None):
     """
     :param audit_files:
         Profile to execute. Can have one or more files
@@ -130,6 +154,9 @@ def run(audit_files=None,
         and descriptions.
     :param show_compliance:
         Whether to show compliance with results or not
+    :param incremental:
+        Whether to reuse the results of the checks with unchanged inputs from
+        the last run (see above)
     :return:
         Returns dictionary with Success, Skipped, and Failure keys and the
         results of the checks
@@ -161,23 +188,42 @@ def run(audit_files=None,
             show_compliance = show_compliance.lower().strip() == 'true'
         if type(verbose) is str and verbose.lower().strip() in ['true', 'false']:
             verbose = verbose.lower().strip() == 'true'
+        if incremental is None:
+            incremental = __mods__['config.get']('hubblestack:nova:incremental', False)
+        if type(incremental) is str and incremental.lower().strip() in ['true', 'false']:
+            incremental = incremental.lower().strip() == 'true'
         if labels:
             if not isinstance(labels, list):
                 labels = labels.split(',')
+        # checks of a profile run on this many threads; each one may take up to check_timeout seconds
+        max_workers = _get_positive_config('hubblestack:nova:max_workers', int, 1)
+        check_timeout = _get_positive_config('hubblestack:nova:check_timeout', float, None)
         # validate and get list of filepaths
         audit_files = _get_audit_files(audit_files)
         if not audit_files:
             return result_dict
+        result_store = None
+        if incremental:
+            result_store = _get_result_store(audit_files, tags, labels)
 
         # initialize loader
         audit_runner.init_loader()
-        for audit_file in audit_files:
-            ret = audit_runner.execute(audit_file, {
-                'tags': tags,
-                'labels': labels,
-                'verbose': verbose
-            })
-            combined_dict[audit_file] = ret
+        with contextlib.ExitStack() as stack:
+            # share the facts (package lists, file stats, ...) looked up by the checks of all the files
+            if __mods__['config.get']('hubblestack:nova:share_fact_cache', True):
+                stack.enter_context(fact_cache.scope())
+            for audit_file in audit_files:
+                ret = audit_runner.execute(audit_file, {
+                    'tags': tags,
+                    'labels': labels,
+                    'verbose': verbose,
+                    'max_workers': max_workers,
+                    'check_timeout': check_timeout,
+                    'result_store': result_store
+                })
+                combined_dict[audit_file] = ret
+        if result_store is not None:
+            result_store.save()
 
         _evaluate_results(result_dict, combined_dict, show_compliance, verbose)
     except Exception as e:
@@ -186,6 +232,37 @@ def run(audit_files=None,
     return result_dict
 
 
+def _get_positive_config(key, cast, default):
+    """
+    The value of key in the config as a positive number (converted by cast),
+    or default if it is not set or not a positive number
+    """
+    value = __mods__['config.get'](key, default)
+    if value is None or value == default:
+        return default
+    try:
+        number = cast(value)
+    except (TypeError, ValueError):
+        number = None
+    if number is None or number <= 0:
+        log.error('Invalid value for %s: %r, using %s', key, value, default)
+        return default
+    return number
+
+
+def _get_result_store(audit_files, tags, labels):
+    """
+    The stored check results of the last incremental run of these audit
+    files (with these tags and labels)
+    """
+    full_run_every = __mods__['config.get']('hubblestack:nova:incremental_full_run_every', 24)
+    path = None
+    if __opts__.get('cachedir'):
+        name = incremental_results.digest([audit_files, tags, labels])[:16]
+        path = os.path.join(__opts__['cachedir'], 'audit_incremental', '{0}.json'.format(name))
+    return incremental_results.ResultStore.load(path, full_run_every)
+
+
 def _get_audit_files(audit_files):
     """Get audit files list, if valid
 
@@ -15,6 +15,7 @@ import time
 from collections import namedtuple
 
 # Import hubble libs
+import hubblestack.module_runner.fact_cache as fact_cache
 import hubblestack.utils.files
 import hubblestack.utils.hashutils
 import hubblestack.utils.path
@@ -932,10 +933,14 @@ def get_hash(path, form="sha256", chunk_size=65536):
     return hubblestack.utils.hashutils.get_hash(os.path.expanduser(path), form, chunk_size)
 
 
-def stats(path, hash_type=None, follow_symlinks=True):
+def stats(path, hash_type=None, follow_symlinks=True, extended=False):
     """
     Return a dict containing the stats for a given file
 
+    extended
+        Also return the link count, device, block usage and nanosecond
+        timestamps of the file
+
     CLI Example:
 
     .. code-block:: bash
@@ -944,12 +949,16 @@ def stats(path, hash_type=None, follow_symlinks=True):
     """
     path = os.path.expanduser(path)
 
-    ret = {}
-    if not os.path.exists(path):
+    try:
+        if follow_symlinks:
+            pstat = os.stat(path)
+            lstat = None
+        else:
+            pstat = lstat = os.lstat(path)
+    except OSError:
         try:
-            # Broken symlinks will return False for os.path.exists(), but still
-            # have a uid and gid
-            pstat = os.lstat(path)
+            # Broken symlinks can't be followed, but still have a uid and gid
+            pstat = lstat = os.lstat(path)
         except OSError:
             # Not a broken symlink, just a nonexistent path
             # NOTE: The file.directory state checks the content of the error
@@ -957,16 +966,24 @@ def stats(path, hash_type=None, follow_symlinks=True):
             # exception will reflect the file.directory state as well, and will
             # likely require changes there.
             raise CommandExecutionError("Path not found: {0}".format(path))
-    else:
-        if follow_symlinks:
-            pstat = os.stat(path)
-        else:
-            pstat = os.lstat(path)
+    return stats_from_result(path, pstat, hash_type=hash_type, extended=extended, lstat=lstat)
+
+
+def stats_from_result(path, pstat, hash_type=None, extended=False, lstat=None):
+    """
+    Return the stats of the file at path, like ``stats``, from the result of
+    an ``os.stat``/``os.lstat`` call the caller already made (e.g. while
+    walking a tree). Pass the ``os.lstat`` result as lstat too, if that's
+    what pstat is; it saves a syscall.
+
+    User and group names are looked up once per audit run.
+    """
+    ret = {}
     ret["inode"] = pstat.st_ino
     ret["uid"] = pstat.st_uid
     ret["gid"] = pstat.st_gid
-    ret["group"] = gid_to_group(pstat.st_gid)
-    ret["user"] = uid_to_user(pstat.st_uid)
+    ret["group"] = fact_cache.call("file.gid_to_group", gid_to_group, pstat.st_gid)
+    ret["user"] = fact_cache.call("file.uid_to_user", uid_to_user, pstat.st_uid)
     ret["atime"] = pstat.st_atime
     ret["mtime"] = pstat.st_mtime
     ret["ctime"] = pstat.st_ctime
@@ -989,10 +1006,39 @@ def stats(path, hash_type=None, follow_symlinks=True):
         ret["type"] = "pipe"
     if stat.S_ISSOCK(pstat.st_mode):
         ret["type"] = "socket"
-    ret["target"] = os.path.realpath(path)
+    ret["target"] = _realpath(path, lstat)
+    if extended:
+        ret["nlink"] = pstat.st_nlink
+        ret["dev"] = pstat.st_dev
+        ret["rdev"] = pstat.st_rdev
+        ret["blocks"] = pstat.st_blocks
+        ret["blksize"] = pstat.st_blksize
+        ret["atime_ns"] = pstat.st_atime_ns
+        ret["mtime_ns"] = pstat.st_mtime_ns
+        ret["ctime_ns"] = pstat.st_ctime_ns
     return ret
 
 
+def _realpath(path, lstat=None):
+    """
+    os.path.realpath(path), resolving the directory of path only once per
+    audit run
+    """
+    if not os.path.isabs(path) or os.path.normpath(path) != path:
+        return os.path.realpath(path)
+    dirname, basename = os.path.split(path)
+    if not basename:
+        return os.path.realpath(path)
+    try:
+        if lstat is None:
+            lstat = os.lstat(path)
+    except OSError:
+        return os.path.realpath(path)
+    if stat.S_ISLNK(lstat.st_mode):
+        return os.path.realpath(path)
+    return os.path.join(fact_cache.call("file.realpath", os.path.realpath, dirname), basename)
+
+
 def touch(name, atime=None, mtime=None):
     """
     .. versionadded:: 0.9.5
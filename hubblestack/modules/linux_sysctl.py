@@ -4,6 +4,7 @@ Module for viewing and modifying sysctl parameters
 """
 
 # Import python libs
+import glob
 import logging
 import os
 import re
@@ -19,6 +20,8 @@ log = logging.getLogger(__name__)
 # Define the module's virtual name
 __virtualname__ = "sysctl"
 
+PROC_SYS = "/proc/sys"
+
 # TODO: Add unpersist() to remove either a sysctl or sysctl/value combo from
 # the config
 
@@ -95,18 +98,70 @@ def show(config_file=False):
     return ret
 
 
+def _proc_sys_path(name):
+    """
+    The file under /proc/sys for the sysctl parameter name (a component of the
+    name containing dots has them written as slashes, e.g. eth0/1 for eth0.1)
+    """
+    path = os.path.normpath(os.path.join(PROC_SYS, name.translate("".maketrans("./", "/."))))
+    if not path.startswith(PROC_SYS + os.sep):
+        return None
+    return path
+
+
+def _read_proc_sys(path):
+    """
+    Read a sysctl parameter from its file under /proc/sys, formatted like
+    ``sysctl -n`` does. None if it can't be read.
+    """
+    try:
+        with hubblestack.utils.files.fopen(path, "r") as fp_:
+            return fp_.read().rstrip()
+    except (OSError, IOError, UnicodeDecodeError):
+        return None
+
+
 def get(name):
     """
-    Return a single sysctl parameter for this minion
+    Return a single sysctl parameter for this minion. The value is read from
+    /proc/sys, ``sysctl -n`` is only run if that fails (to report the error).
     CLI Example:
     .. code-block:: bash
         salt '*' sysctl.get net.ipv4.ip_forward
     """
+    path = _proc_sys_path(name)
+    if path is not None:
+        out = _read_proc_sys(path)
+        if out is not None:
+            return out
     cmd = "sysctl -n {0}".format(name)
     out = __mods__["cmd.run"](cmd, python_shell=False)
     return out
 
 
+def get_matching(pattern):
+    """
+    Return the readable sysctl parameters matching the glob pattern (applied
+    to each component of the name, e.g. ``net.ipv4.conf.*.rp_filter``) as a
+    dict, read from /proc/sys in one pass.
+    CLI Example:
+    .. code-block:: bash
+        salt '*' sysctl.get_matching 'net.ipv4.conf.*.rp_filter'
+    """
+    ret = {}
+    path_pattern = _proc_sys_path(pattern)
+    if path_pattern is None:
+        return ret
+    for path in sorted(glob.glob(path_pattern)):
+        if not os.path.isfile(path):
+            continue
+        value = _read_proc_sys(path)
+        if value is not None:
+            name = os.path.relpath(path, PROC_SYS).translate("".maketrans("./", "/."))
+            ret[name] = value
+    return ret
+
+
 def assign(name, value):
     """
     Assign a single sysctl parameter for this minion
@@ -26,6 +26,7 @@ nebula_osquery:
 import collections
 import copy
 import fnmatch
+import functools
 import glob
 import json
 import logging
@@ -38,8 +39,12 @@ import yaml
 import zlib
 import traceback
 from inspect import getfullargspec
+from multiprocessing.pool import ThreadPool
 
+import hubblestack.module_runner.runner
 import hubblestack.utils.files
+import hubblestack.utils.osquery_lib
+import hubblestack.utils.path
 import hubblestack.utils.platform
 
 from hubblestack.exceptions import CommandExecutionError
@@ -47,9 +52,23 @@ from hubblestack import __version__
 import hubblestack.log
 
 from hubblestack.status import HubbleStatus
+
+try:
+    import pyinotify
+    HAS_PYINOTIFY = True
+except ImportError:
+    HAS_PYINOTIFY = False
+
+try:
+    import resource
+except ImportError:
+    # windows
+    resource = None
+
 log = logging.getLogger(__name__)
 
 CRC_BYTES = 256
+YAML_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
 hubble_status = HubbleStatus(__name__, 'top', 'queries', 'osqueryd_monitor', 'osqueryd_log_parser')
 
 __virtualname__ = 'nebula'
@@ -90,6 +109,22 @@ def queries(query_group,
         Defaults to False. If set to True, passwords mentioned in the
         return object are masked.
 
+    Each query is run in a fresh osqueryi by default. If
+    ``hubblestack:nebula:persistent_session`` is set to True in the config,
+    queries are instead piped through one long-lived osqueryi shell (restarted
+    on timeout or exit), which saves the osqueryi startup cost per query.
+    A query may set ``timeout`` (seconds, default 600), and ``differential:
+    True`` to only return the rows added or removed since the previous run
+    (plus a periodic full snapshot; see ``_apply_differential``).
+
+    Set ``hubblestack:nebula:max_workers`` to run that many queries at once
+    (results are still returned in query order), and ``hubblestack:nebula:nice``
+    / ``hubblestack:nebula:ionice`` to lower the priority of the osqueryi
+    children.
+
+    If ``hubblestack:nebula:profile`` is True, the cost of each query is
+    recorded for ``nebula.profile``, and queries disabled there are skipped.
+
     CLI Examples:
 
     .. code-block:: bash
@@ -122,10 +157,21 @@ def queries(query_group,
 
     query_data = query_data.get(query_group, {})
 
+    profile_data = None
+    if __mods__['config.get']('hubblestack:nebula:profile', False):
+        profile_data = _load_profile()
+        for name in set(query_data) & set(profile_data['disabled']):
+            log.warning('Skipping osquery query %s, disabled by nebula.profile: %s',
+                        name, profile_data['disabled'][name])
+            query_data.pop(name)
+
     schedule_time = time.time()
 
     # run the osqueryi queries
-    success, timing, ret = _run_osquery_queries(query_data, verbose)
+    costs = {} if profile_data is not None else None
+    success, timing, ret = _run_osquery_queries(query_data, verbose, costs=costs)
+    if profile_data is not None:
+        _record_profile(profile_data, costs)
 
     if success is False and hubblestack.utils.platform.is_windows():
         log.error('osquery does not run on windows versions earlier than Server 2008 and Windows 7')
@@ -156,6 +202,112 @@ def queries(query_group,
     if mask_passwords:
         _mask_object(ret, topfile_for_mask)
 
+    ret = _apply_differential(ret, query_data, query_group)
+
+    return ret
+
+
+def _apply_differential(ret, query_data, query_group):
+    """
+    Replace the data of queries marked ``differential: True`` with only the
+    rows added or removed since the previous run. Each returned row gets an
+    ``_action`` of ``added`` or ``removed``.
+
+    The previous row set is kept (keyed by row hash, with the number of
+    identical rows) in the cachedir. The full row set is returned (with
+    ``_action: snapshot``) on the first run and then every
+    ``snapshot_interval`` seconds (default 86400). Columns listed in
+    ``differential_ignore`` (e.g. a ``_time`` column) are not considered when
+    comparing rows; rows only differing in those are counted as the same row.
+
+    Delivery is at most once: the new row set is stored when the results are
+    returned, before the returners get them, so changes a returner fails to
+    deliver are not reported again until the next snapshot.
+    """
+    for item in ret:
+        if 'query_result' in item:
+            name, query_ret = item.get('query_name'), item['query_result']
+        elif len(item) == 1:
+            name, query_ret = next(iter(item.items()))
+        else:
+            continue
+        query = query_data.get(name)
+        if not isinstance(query, dict) or not query.get('differential'):
+            continue
+        if not isinstance(query_ret, dict) or query_ret.get('result') is not True \
+                or not isinstance(query_ret.get('data'), list):
+            continue
+        try:
+            query_ret['data'] = _differential_rows('{0}-{1}'.format(query_group, name),
+                                                   query_ret['data'],
+                                                   query.get('snapshot_interval', 86400),
+                                                   query.get('differential_ignore', []))
+        except Exception:
+            log.error('Unable to compute differential results for %s, returning all rows',
+                      name, exc_info=True)
+    return ret
+
+
+def _differential_state_file(key):
+    """
+    Return the path of the file holding the previous rows for the given key
+    """
+    return os.path.join(__opts__.get('cachedir'), 'nebula', 'differential',
+                        re.sub(r'[^\w.-]', '_', key) + '.json.z')
+
+
+def _differential_rows(key, rows, snapshot_interval, ignore_columns):
+    """
+    Compare rows against the rows stored for key, store the new rows and
+    return the rows to report.
+    """
+    state_file = _differential_state_file(key)
+    previous = None
+    try:
+        with open(state_file, 'rb') as state_fh:
+            previous = json.loads(zlib.decompress(state_fh.read()).decode('utf-8'))
+    except (IOError, OSError):
+        pass
+    except Exception:
+        log.error('Discarding unreadable differential state %s', state_file, exc_info=True)
+
+    # digest => [row, number of rows with that digest]
+    current = {}
+    for row in rows:
+        hashed = {k: v for k, v in row.items() if k not in ignore_columns}
+        digest = hashlib.sha256(json.dumps(hashed, sort_keys=True, default=str)
+                                .encode('utf-8')).hexdigest()
+        if digest in current:
+            current[digest][1] += 1
+        else:
+            current[digest] = [row, 1]
+
+    now = time.time()
+    if not previous or now - previous.get('snapshot_time', 0) >= snapshot_interval:
+        snapshot_time = now
+        ret = [dict(row, _action='snapshot') for row in rows]
+    else:
+        snapshot_time = previous['snapshot_time']
+        previous_rows = previous.get('rows', {})
+        if previous.get('version', 1) < 2:
+            # state from before rows were counted
+            previous_rows = {digest: [row, 1] for digest, row in previous_rows.items()}
+        ret = []
+        for digest, (row, count) in current.items():
+            added = count - previous_rows.get(digest, [None, 0])[1]
+            ret.extend(dict(row, _action='added') for _ in range(added))
+        for digest, (row, count) in previous_rows.items():
+            removed = count - current.get(digest, [None, 0])[1]
+            ret.extend(dict(row, _action='removed') for _ in range(removed))
+
+    state_dir = os.path.dirname(state_file)
+    if not os.path.isdir(state_dir):
+        os.makedirs(state_dir)
+    tmp_file = state_file + '.tmp'
+    with open(tmp_file, 'wb') as state_fh:
+        state_fh.write(zlib.compress(json.dumps({'version': 2, 'snapshot_time': snapshot_time, 'rows': current},
+                                                default=str).encode('utf-8')))
+    os.replace(tmp_file, state_file)
     return ret
 
 
@@ -188,35 +340,121 @@ def _build_baseline_osquery_data(report_version_with_day):
     return ret
 
 
-def _run_osqueryi_query(query, query_sql, timing, verbose):
+def _osqueryi_cmd():
     """
-    Run the osqueryi query in query_sql and return the result
+    Build the osqueryi command line (without a query)
     """
     max_file_size = 104857600
     augeas_lenses = '/opt/osquery/lenses'
-    query_ret = {'result': True}
-
-    # Run the osqueryi query
-    cmd = [__grains__['osquerybinpath'], '--read_max', max_file_size, '--json',
-          '--augeas_lenses', augeas_lenses, query_sql]
-    
     if hubblestack.utils.platform.is_windows():
         # augeas_lenses are not available on windows
-        cmd = [__grains__['osquerybinpath'], '--read_max', max_file_size, '--json',
-                query_sql]
+        return [__grains__['osquerybinpath'], '--read_max', max_file_size, '--json']
+    return _osqueryi_priority_prefix() + \
+        [__grains__['osquerybinpath'], '--read_max', max_file_size, '--json',
+         '--augeas_lenses', augeas_lenses]
+
+
+def _osqueryi_priority_prefix():
+    """
+    Return the nice/ionice command prefix for osqueryi children, as configured
+    by ``hubblestack:nebula:nice`` (niceness, e.g. 10) and
+    ``hubblestack:nebula:ionice`` (io scheduling class, e.g. 3 for idle).
+    Both are unset by default; missing binaries are skipped.
+    """
+    prefix = []
+    niceness = __mods__['config.get']('hubblestack:nebula:nice', None)
+    if niceness is not None:
+        nice_bin = hubblestack.utils.path.which('nice')
+        if nice_bin:
+            prefix += [nice_bin, '-n', str(niceness)]
+    ionice_class = __mods__['config.get']('hubblestack:nebula:ionice', None)
+    if ionice_class is not None:
+        ionice_bin = hubblestack.utils.path.which('ionice')
+        if ionice_bin:
+            prefix += [ionice_bin, '-c', str(ionice_class)]
+    return prefix
+
+
+def _get_osqueryi_session():
+    """
+    Return the long-lived osqueryi session kept in __context__ if
+    ``hubblestack:nebula:persistent_session`` is set; otherwise None (and each
+    query will spawn its own osqueryi).
+    """
+    if not __mods__['config.get']('hubblestack:nebula:persistent_session', False):
+        return None
+    cmd = [str(x) for x in _osqueryi_cmd()]
+    session = __context__.get('nebula.osqueryi_session')
+    if session is None or session.cmd != cmd:
+        if session is not None:
+            session.stop()
+        session = hubblestack.utils.osquery_lib.OsqueryiSession(cmd)
+        __context__['nebula.osqueryi_session'] = session
+    try:
+        session.start()
+    except Exception:
+        log.error('Unable to start persistent osqueryi session, '
+                  'falling back to one osqueryi per query', exc_info=True)
+        return None
+    return session
+
+
+def _child_cpu():
+    """
+    Return the cpu seconds used by waited-for child processes so far, or None
+    if that is not known
+    """
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _run_osqueryi_query(query, query_sql, timing, verbose, session=None, costs=None, concurrent=False):
+    """
+    Run the osqueryi query in query_sql and return the result
+
+    If costs is a dict, the cost of the query is stored in it (see
+    ``_record_profile``). The cpu cost is the change of the cpu time of all
+    the waited-for children, so it is only recorded when the query has an
+    osqueryi of its own and no other query runs at the same time.
+    """
+    timeout = query.get('timeout', 600)
 
     time_start = time.time()
-    res = __mods__['cmd.run_all'](cmd, timeout=600)
+    cpu_start = None
+    if costs is not None and session is None and not concurrent:
+        cpu_start = _child_cpu()
+    if session is not None:
+        query_ret = session.query(query_sql, timeout=timeout)
+        if query_ret['result'] is False and 'Timed out' in query_ret['error']:
+            log.error('TIMEOUT during osqueryi execution name=%s', query['query_name'])
+        output_bytes = len(json.dumps(query_ret['data'])) if costs is not None \
+            and query_ret['result'] else 0
+    else:
+        query_ret = {'result': True}
+        # Run the osqueryi query
+        cmd = _osqueryi_cmd() + [query_sql]
+        res = __mods__['cmd.run_all'](cmd, timeout=timeout)
+        if res['retcode'] == 0:
+            query_ret['data'] = json.loads(res['stdout'])
+        else:
+            if 'Timed out' in res['stdout']:
+                # this is really the best way to tell without getting fancy
+                log.error('TIMEOUT during osqueryi execution name=%s', query['query_name'])
+            query_ret['result'] = False
+            query_ret['error'] = res['stderr']
+        output_bytes = len(res['stdout'] or '')
     time_end = time.time()
     timing[query['query_name']] = time_end - time_start
-    if res['retcode'] == 0:
-        query_ret['data'] = json.loads(res['stdout'])
-    else:
-        if 'Timed out' in res['stdout']:
-            # this is really the best way to tell without getting fancy
-            log.error('TIMEOUT during osqueryi execution name=%s', query['query_name'])
-        query_ret['result'] = False
-        query_ret['error'] = res['stderr']
+    if costs is not None:
+        rows = query_ret.get('data')
+        cost = {'wall': time_end - time_start,
+                'rows': len(rows) if isinstance(rows, list) else 0,
+                'bytes': output_bytes}
+        if cpu_start is not None:
+            cost['cpu'] = _child_cpu() - cpu_start
+        costs[query['query_name']] = cost
     if verbose:
         tmp = copy.deepcopy(query)
         tmp['query_result'] = query_ret
@@ -226,14 +464,17 @@ def _run_osqueryi_query(query, query_sql, timing, verbose):
     return tmp
 
 
-def _run_osquery_queries(query_data, verbose):
+def _run_osquery_queries(query_data, verbose, costs=None):
     """
     Go over the query data in the osquery query file, run each query
-    and return the aggregated results.
+    and return the aggregated results. If costs is a dict, the cost of each
+    query is stored in it.
+
+    Up to ``hubblestack:nebula:max_workers`` queries (default 1) are run at
+    the same time; the results keep the order of the query data either way.
     """
-    ret = []
     timing = {}
-    success = True
+    to_run = []
     for name, query in query_data.items():
         query['query_name'] = name
         query_sql = query.get('query')
@@ -244,16 +485,41 @@ def _run_osquery_queries(query_data, verbose):
                          'which contains either \'attach\' or \'curl\': %s',
                          name, query_sql)
             continue
+        to_run.append((query, query_sql))
+
+    try:
+        max_workers = int(__mods__['config.get']('hubblestack:nebula:max_workers', 1))
+    except (TypeError, ValueError):
+        max_workers = 1
+    max_workers = max(1, min(max_workers, len(to_run)))
+
+    if max_workers > 1:
+        # the persistent session is a single shell, so parallel queries each
+        # get their own osqueryi instead
+        def _run_one(args):
+            query, query_sql = args
+            return _run_osqueryi_query(query, query_sql, timing, verbose, costs=costs, concurrent=True)
+
+        pool = ThreadPool(max_workers)
+        try:
+            ret = pool.map(_run_one, to_run)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        session = _get_osqueryi_session()
+        ret = [_run_osqueryi_query(query, query_sql, timing, verbose, session=session,
+                                   costs=costs)
+               for query, query_sql in to_run]
 
-        # Run osquery query
-        query_ret = _run_osqueryi_query(query, query_sql, timing, verbose)
+    success = True
+    for (query, _), query_ret in zip(to_run, ret):
         try:
             if query_ret['query_result']['result'] is False or \
-               query_ret[name]['result'] is False:
+               query_ret[query['query_name']]['result'] is False:
                 success = False
         except KeyError:
             pass
-        ret.append(query_ret)
 
     return success, timing, ret
 
@@ -280,7 +546,7 @@ def _get_query_data(query_file):
     """
     Helper function that extracts the query data from the query file and returns it.
     """
-    query_data = {}
+    key = []
     for file_path in query_file:
         if 'salt://' in file_path:
             orig_fh = file_path
@@ -289,16 +555,29 @@ def _get_query_data(query_file):
             log.error('Could not find file %s.', orig_fh)
             return None
         if os.path.isfile(file_path):
-            with open(file_path, 'r') as yaml_file:
-                f_data = yaml.safe_load(yaml_file)
-                if not isinstance(f_data, dict):
-                    raise CommandExecutionError('File data is not formed as a dict {0}'
-                                                .format(f_data))
-                query_data = _dict_update(query_data,
-                                          f_data,
-                                          recursive_update=True,
-                                          merge_lists=True)
-    return query_data
+            stat = os.stat(file_path)
+            key.append((file_path, stat.st_mtime, stat.st_size))
+    key = tuple(key)
+
+    # the merged data is kept until one of the files changes; callers get a
+    # copy as they modify the queries (e.g. adding query_name)
+    cached = __context__.get('nebula.query_data')
+    if cached is not None and cached[0] == key:
+        return copy.deepcopy(cached[1])
+
+    query_data = {}
+    for file_path, _mtime, _size in key:
+        with open(file_path, 'r') as yaml_file:
+            f_data = yaml.load(yaml_file, Loader=YAML_LOADER)
+            if not isinstance(f_data, dict):
+                raise CommandExecutionError('File data is not formed as a dict {0}'
+                                            .format(f_data))
+            query_data = _dict_update(query_data,
+                                      f_data,
+                                      recursive_update=True,
+                                      merge_lists=True)
+    __context__['nebula.query_data'] = (key, query_data)
+    return copy.deepcopy(query_data)
 
 
 @hubble_status.watch
@@ -364,10 +643,15 @@ def osqueryd_monitor(configfile=None,
 
         osqueryd_running = _osqueryd_running_status(pidfile)
 
+    digests = dict(__context__.get('nebula.osqueryd_digests', {}))
     configfile = configfile or _generate_osquery_conf_file(conftopfile)
     flagfile = flagfile or _generate_osquery_flags_file(flagstopfile)
+    # nothing needs a restart if the generated files are the same as last time
+    unchanged = bool(digests) and digests == __context__.get('nebula.osqueryd_digests')
     if not osqueryd_running:
         _start_osqueryd(pidfile, configfile, flagfile, logdir, databasepath, servicename)
+    elif unchanged and not OSQUERYD_NEEDS_RESTART:
+        log.debug('osqueryd is running and its conf/flags are unchanged')
     else:
         osqueryd_restart = _osqueryd_restart_required(hashfile, flagfile)
         if osqueryd_restart:
@@ -383,7 +667,10 @@ def osqueryd_log_parser(osqueryd_logdir=None,
                         backuplogfilescount=None,
                         enablediskstatslogging=False,
                         topfile_for_mask=None,
-                        mask_passwords=False):
+                        mask_passwords=False,
+                        chunk_size=None,
+                        tail=None,
+                        checkpoint_interval=None):
     """
     Parse osquery daemon logs and perform log rotation based on specified parameters
 
@@ -415,6 +702,26 @@ def osqueryd_log_parser(osqueryd_logdir=None,
         Defaults to False. If set to True, passwords mentioned in the
         return object are masked
 
+    chunk_size
+        If set (or if ``osquery_logfile_chunk_events`` is set in the config),
+        return a generator of lists of at most chunk_size events instead of
+        one list. The whole log is then parsed regardless of
+        maxlogfilesizethreshold, and the stored offset is advanced after each
+        chunk has been handed off (i.e., when the next chunk is requested), so
+        memory use stays bounded and no events are skipped.
+
+    tail
+        If True (or if ``osquery_logfile_tail`` is set in the config), watch
+        osqueryd_logdir with inotify and only read the log files when they
+        have been written to or replaced, from offsets kept in memory. Meant
+        to be scheduled every second or so; calls where nothing was written
+        do no file I/O. Falls back to the usual parsing without pyinotify.
+
+    checkpoint_interval
+        In tail mode, the in-memory offsets are stored to the cachedir at most
+        every checkpoint_interval seconds (default
+        ``osquery_logfile_checkpoint_seconds`` from the config, or 60).
+
     """
     ret = []
     if not osqueryd_logdir:
@@ -430,6 +737,35 @@ def osqueryd_log_parser(osqueryd_logdir=None,
     maxlogfilesizethreshold = maxlogfilesizethreshold or __opts__.get(
         'osquery_logfile_maxbytes_toparse')
     backuplogfilescount = backuplogfilescount or __opts__.get('osquery_backuplogs_count')
+    chunk_size = chunk_size or __opts__.get('osquery_logfile_chunk_events')
+    chunk_size = int(chunk_size) if chunk_size else None
+    if tail is None:
+        tail = __opts__.get('osquery_logfile_tail', False)
+
+    raw_chunks = None
+    if tail:
+        log_tail = _get_osqueryd_log_tail(osqueryd_logdir, [result_logfile, snapshot_logfile])
+        if log_tail is not None:
+            if checkpoint_interval is None:
+                checkpoint_interval = __opts__.get('osquery_logfile_checkpoint_seconds', 60)
+            raw_chunks = log_tail.read(chunk_size,
+                                       backuplogdir,
+                                       logfilethresholdinbytes,
+                                       backuplogfilescount,
+                                       enablediskstatslogging,
+                                       float(checkpoint_interval))
+    if raw_chunks is None and chunk_size:
+        raw_chunks = _poll_log_chunks([result_logfile, snapshot_logfile],
+                                      chunk_size,
+                                      backuplogdir,
+                                      logfilethresholdinbytes,
+                                      backuplogfilescount,
+                                      enablediskstatslogging)
+    if raw_chunks is not None:
+        chunks = _osqueryd_log_chunks(raw_chunks, topfile_for_mask, mask_passwords)
+        if chunk_size:
+            return chunks
+        return [event for chunk in chunks for event in chunk]
 
     if os.path.exists(result_logfile):
         logfile_offset = _get_file_offset(result_logfile)
@@ -467,6 +803,42 @@ def osqueryd_log_parser(osqueryd_logdir=None,
     return ret
 
 
+def _poll_log_chunks(logfiles,
+                     chunk_size,
+                     backuplogdir,
+                     logfilethresholdinbytes,
+                     backuplogfilescount,
+                     enablediskstatslogging):
+    """
+    Yield the raw events of each log file, from its stored offset, in lists
+    of at most chunk_size events.
+    """
+    for logfile in logfiles:
+        if not os.path.exists(logfile):
+            log.warning("Specified osquery log file doesn't exist: %s", logfile)
+            continue
+        for event_data in _parse_log_chunks(logfile,
+                                            _get_file_offset(logfile),
+                                            backuplogdir,
+                                            logfilethresholdinbytes,
+                                            backuplogfilescount,
+                                            enablediskstatslogging,
+                                            chunk_size):
+            yield event_data
+
+
+def _osqueryd_log_chunks(raw_chunks, topfile_for_mask, mask_passwords):
+    """
+    Generator behind osqueryd_log_parser(chunk_size=...): parse (and
+    optionally mask) each list of raw events from raw_chunks.
+    """
+    for event_data in raw_chunks:
+        ret = _update_event_data(event_data)
+        if mask_passwords:
+            _mask_object(ret, topfile_for_mask)
+        yield ret
+
+
 def _update_event_data(ret):
     """
     Helper function that goes over the event_data in ret and updates the objects with 'snapshot and
@@ -567,6 +939,198 @@ def version():
     return __version__
 
 
+def _profile_file():
+    """
+    Return the path of the file holding the per-query cost samples
+    """
+    return os.path.join(__opts__.get('cachedir'), 'nebula', 'profile.json')
+
+
+def _load_profile():
+    """
+    Load the per-query cost samples and the disabled queries
+    """
+    profile_data = {}
+    try:
+        with open(_profile_file(), 'r') as profile_fh:
+            profile_data = json.load(profile_fh)
+    except (IOError, OSError):
+        pass
+    except ValueError:
+        log.error('Discarding unreadable nebula profile %s', _profile_file())
+    if not isinstance(profile_data, dict):
+        profile_data = {}
+    profile_data.setdefault('queries', {})
+    profile_data.setdefault('disabled', {})
+    return profile_data
+
+
+def _save_profile(profile_data):
+    """
+    Store the per-query cost samples and the disabled queries
+    """
+    profile_file = _profile_file()
+    if not os.path.isdir(os.path.dirname(profile_file)):
+        os.makedirs(os.path.dirname(profile_file))
+    tmp_file = profile_file + '.tmp'
+    with open(tmp_file, 'w') as profile_fh:
+        json.dump(profile_data, profile_fh)
+    os.replace(tmp_file, profile_file)
+
+
+def _record_profile(profile_data, costs):
+    """
+    Add the costs of a queries() run to the rolling window of samples kept for
+    each query (``hubblestack:nebula:profile_window`` samples, default 50),
+    disable queries over budget if configured (see ``profile``) and store the
+    result.
+    """
+    window = int(__mods__['config.get']('hubblestack:nebula:profile_window', 50))
+    now = int(time.time())
+    for name, cost in costs.items():
+        samples = profile_data['queries'].setdefault(name, [])
+        samples.append(dict(cost, time=now))
+        del samples[:-window]
+    if __mods__['config.get']('hubblestack:nebula:profile_auto_disable', False):
+        budget = __mods__['config.get']('hubblestack:nebula:profile_budget', {})
+        _disable_over_budget(profile_data, budget)
+    try:
+        _save_profile(profile_data)
+    except Exception:
+        log.error('Unable to store nebula query profile', exc_info=True)
+
+
+def _percentile(values, pct):
+    """
+    Nearest-rank percentile of an already sorted list
+    """
+    if not values:
+        return 0
+    return values[int(round(pct / 100.0 * (len(values) - 1)))]
+
+
+def _profile_stats(samples):
+    """
+    Summarize the samples of one query as percentiles per measurement; a
+    measurement without samples (e.g. cpu of queries run in parallel) is left
+    out
+    """
+    stats = {'samples': len(samples)}
+    for measure in ('wall', 'cpu', 'rows', 'bytes'):
+        values = sorted(sample[measure] for sample in samples if sample.get(measure) is not None)
+        if values:
+            stats[measure] = dict(('p{0}'.format(pct), _percentile(values, pct))
+                                  for pct in (50, 90, 99))
+    return stats
+
+
+def _disable_over_budget(profile_data, budget, pct='p90'):
+    """
+    Disable the queries whose ``pct`` percentile of any measure in budget
+    (e.g. ``{'cpu': 5, 'wall': 60}``) is over that budget. Returns the names
+    of the newly disabled queries.
+    """
+    disabled = []
+    if not budget:
+        return disabled
+    for name, samples in profile_data['queries'].items():
+        if name in profile_data['disabled']:
+            continue
+        stats = _profile_stats(samples)
+        for measure, limit in sorted(budget.items()):
+            if measure in stats and stats[measure][pct] > limit:
+                reason = '{0} {1} {2} over budget {3}'.format(measure, pct,
+                                                              stats[measure][pct], limit)
+                log.warning('Disabling osquery query %s: %s', name, reason)
+                profile_data['disabled'][name] = reason
+                disabled.append(name)
+                break
+    return disabled
+
+
+def profile(top=10, sort_by='cpu', budget=None, disable=False, enable=None):
+    """
+    Report the most expensive nebula queries, as measured by previous runs of
+    ``nebula.queries`` (if ``hubblestack:nebula:profile`` is True).
+
+    For each query the 50th/90th/99th percentiles of the last
+    ``hubblestack:nebula:profile_window`` runs are reported for:
+
+    wall
+        wall clock seconds
+    cpu
+        user+system CPU seconds of the osqueryi child (from getrusage
+        RUSAGE_CHILDREN deltas). Only measured for queries run one at a time,
+        each in its own osqueryi: not when they run in parallel or in a
+        persistent osqueryi session, nor on windows
+    rows
+        number of rows returned
+    bytes
+        size of the JSON output
+
+    top
+        Number of queries to report. Defaults to 10.
+
+    sort_by
+        The measure (p90) to sort by. Defaults to ``cpu``.
+
+    budget
+        Dict of measure to p90 limit, e.g. ``{'cpu': 5, 'wall': 60}``. Queries
+        over budget are listed under ``over_budget``. Defaults to
+        ``hubblestack:nebula:profile_budget``.
+
+    disable
+        If True, queries over budget are disabled: ``nebula.queries`` skips them
+        until they are re-enabled. Setting
+        ``hubblestack:nebula:profile_auto_disable`` does this after every run.
+
+    enable
+        List of query names to re-enable (or ``'*'`` for all). Their samples
+        are dropped, so the budget applies to their runs after being enabled.
+
+    CLI Examples:
+
+    .. code-block:: bash
+
+        hubble nebula.profile
+        hubble nebula.profile top=5 sort_by=wall
+        hubble nebula.profile budget='{cpu: 5}' disable=True
+    """
+    profile_data = _load_profile()
+    if budget is None:
+        budget = __mods__['config.get']('hubblestack:nebula:profile_budget', {})
+    elif isinstance(budget, str):
+        budget = yaml.safe_load(budget)
+    changed = False
+    if enable:
+        names = list(profile_data['disabled']) if enable == '*' else enable
+        if not isinstance(names, (list, tuple)):
+            names = [names]
+        for name in names:
+            changed = profile_data['disabled'].pop(name, None) is not None or changed
+            # judge the query by its runs from now on, not by the ones that disabled it
+            changed = profile_data['queries'].pop(name, None) is not None or changed
+
+    stats = dict((name, _profile_stats(samples))
+                 for name, samples in profile_data['queries'].items() if samples)
+    over_budget = []
+    for name, query_stats in sorted(stats.items()):
+        for measure, limit in sorted((budget or {}).items()):
+            if measure in query_stats and query_stats[measure]['p90'] > limit:
+                over_budget.append(name)
+                break
+    if disable and _disable_over_budget(profile_data, budget):
+        changed = True
+    if changed:
+        _save_profile(profile_data)
+
+    worst = sorted(stats, key=lambda name: stats[name].get(sort_by, {}).get('p90', 0),
+                   reverse=True)[:int(top)]
+    return {'queries': [dict(stats[name], query_name=name) for name in worst],
+            'over_budget': over_budget,
+            'disabled': profile_data['disabled']}
+
+
 def hubble_versions():
     """
     Report version of all hubble modules as query
@@ -609,8 +1173,13 @@ def _get_top_data(topfile):
     Function that reads the topfile and returns a list of matched configs that
     represent .yaml config files
     """
-    topfile = __mods__['cp.cache_file'](topfile)
+    return _read_top_data(__mods__['cp.cache_file'](topfile))
 
+
+def _read_top_data(topfile):
+    """
+    Return the list of configs matched in the (cached) topfile
+    """
     if not topfile:
         raise CommandExecutionError('Topfile not found.')
 
@@ -638,11 +1207,89 @@ def _get_top_data(topfile):
     return ret
 
 
+def _stat_files(paths):
+    """
+    (path, mtime, size) of each of the files in paths; None for a missing one
+    """
+    key = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            key.append((path, stat.st_mtime, stat.st_size))
+        except OSError:
+            key.append(None)
+    return tuple(key)
+
+
+def _resolve_osquery_sources(topfile):
+    """
+    Return the local paths of the yaml files matched in topfile, and a digest
+    of their names and contents (or None, None if a file couldn't be cached)
+
+    Caching the files from the fileserver and matching the topfile are only
+    done again if one of the cached files changed, the grains were refreshed
+    or ``fileserver_update_frequency`` seconds passed (the fileserver may
+    have new versions of the files by then); until then this is a stat() of
+    each cached file.
+    """
+    resolved = __context__.setdefault('nebula.osquery_sources', {})
+    cached = resolved.get(topfile)
+    if cached is not None and cached['expires'] > time.time() \
+            and cached['grains'] == hubblestack.module_runner.runner.GRAINS_GENERATION \
+            and _stat_files(path for path, _, _ in cached['stats']) == cached['stats']:
+        return cached['sources'], cached['digest']
+
+    cached_topfile = __mods__['cp.cache_file'](topfile)
+    sources = _read_top_data(cached_topfile)
+    sources = ['salt://hubblestack_nebula_v2/' + config.replace('.', '/') + '.yaml'
+               for config in sources]
+    local_sources = []
+    digest = hashlib.sha256()
+    for source in sources:
+        if 'salt://' in source:
+            orig_fh = source
+            source = __mods__['cp.cache_file'](source)
+        if not source:
+            log.error('Could not find file %s.', orig_fh)
+            return None, None
+        if os.path.isfile(source):
+            with open(source, 'rb') as yfile:
+                digest.update(source.encode('utf-8') + b'\0' + yfile.read() + b'\0')
+            local_sources.append(source)
+    stats = _stat_files([cached_topfile] + local_sources)
+    if None not in stats:
+        resolved[topfile] = {'sources': local_sources, 'digest': digest.hexdigest(), 'stats': stats,
+                             'grains': hubblestack.module_runner.runner.GRAINS_GENERATION,
+                             'expires': time.time() + __opts__.get('fileserver_update_frequency', 43200)}
+    return local_sources, digest.hexdigest()
+
+
+def _load_osquery_sources(sources):
+    """
+    Load and merge the yaml files in sources
+    """
+    data = {}
+    for source in sources:
+        with open(source, 'r') as yfile:
+            f_data = yaml.load(yfile, Loader=YAML_LOADER)
+            if not isinstance(f_data, dict):
+                raise CommandExecutionError('File data is not formed as a dict {0}'
+                                            .format(f_data))
+            data = _dict_update(data,
+                                f_data,
+                                recursive_update=True,
+                                merge_lists=True)
+    return data
+
+
 def _generate_osquery_conf_file(conftopfile):
     """
     Function to dynamically create osquery configuration file in JSON format.
     This function would load osquery configuration in YAML format and
     make use of topfile to selectively load file(s) based on grains
+
+    The file is only rewritten when the matched yaml files (or their
+    contents) changed since it was last generated.
     """
 
     log.info("Generating osquery conf file using topfile: %s", conftopfile)
@@ -651,28 +1298,15 @@ def _generate_osquery_conf_file(conftopfile):
     cachedir = os.path.join(__opts__.get('cachedir'), 'files', saltenv, 'hubblestack_nebula_v2')
     base_path = cachedir
 
-    osqd_configs = _get_top_data(conftopfile)
     configfile = os.path.join(base_path, "osquery.conf")
-    conf_data = {}
-    osqd_configs = ['salt://hubblestack_nebula_v2/' + config.replace('.', '/') + '.yaml'
-                    for config in osqd_configs]
-    for osqd_conf in osqd_configs:
-        if 'salt://' in osqd_conf:
-            orig_fh = osqd_conf
-            osqd_conf = __mods__['cp.cache_file'](osqd_conf)
-        if not osqd_conf:
-            log.error('Could not find file %s.', orig_fh)
-            return None
-        if os.path.isfile(osqd_conf):
-            with open(osqd_conf, 'r') as yfile:
-                f_data = yaml.safe_load(yfile)
-                if not isinstance(f_data, dict):
-                    raise CommandExecutionError('File data is not formed as a dict {0}'
-                                                .format(f_data))
-                conf_data = _dict_update(conf_data,
-                                         f_data,
-                                         recursive_update=True,
-                                         merge_lists=True)
+    osqd_configs, digest = _resolve_osquery_sources(conftopfile)
+    if osqd_configs is None:
+        return None
+    digests = __context__.setdefault('nebula.osqueryd_digests', {})
+    if digests.get(configfile) == digest and os.path.isfile(configfile):
+        log.debug('osquery conf sources unchanged, keeping %s', configfile)
+        return configfile
+    conf_data = _load_osquery_sources(osqd_configs)
     if conf_data:
         try:
             log.debug("Writing config to osquery.conf file")
@@ -680,6 +1314,8 @@ def _generate_osquery_conf_file(conftopfile):
                 json.dump(conf_data, conf_file)
         except Exception:
             log.error("Failed to generate osquery conf file using topfile.", exc_info=True)
+            return configfile
+    digests[configfile] = digest
 
     return configfile
 
@@ -689,6 +1325,9 @@ def _generate_osquery_flags_file(flagstopfile):
     Function to dynamically create osquery flags file.
     This function would load osquery flags in YAML format and
     make use of topfile to selectively load file(s) based on grains
+
+    The file is only rewritten when the matched yaml files (or their
+    contents) changed since it was last generated.
     """
 
     log.info("Generating osquery flags file using topfile: %s", flagstopfile)
@@ -697,28 +1336,15 @@ def _generate_osquery_flags_file(flagstopfile):
     cachedir = os.path.join(__opts__.get('cachedir'), 'files', saltenv, 'hubblestack_nebula_v2')
     base_path = cachedir
 
-    osqd_flags = _get_top_data(flagstopfile)
     flagfile = os.path.join(base_path, "osquery.flags")
-    flags_data = {}
-    osqd_flags = ['salt://hubblestack_nebula_v2/' + config.replace('.', '/') + '.yaml'
-                  for config in osqd_flags]
-    for out_file in osqd_flags:
-        if 'salt://' in out_file:
-            orig_fh = out_file
-            out_file = __mods__['cp.cache_file'](out_file)
-        if not out_file:
-            log.error('Could not find file %s.', orig_fh)
-            return None
-        if os.path.isfile(out_file):
-            with open(out_file, 'r') as yfile:
-                f_data = yaml.safe_load(yfile)
-                if not isinstance(f_data, dict):
-                    raise CommandExecutionError('File data is not formed as a dict {0}'
-                                                .format(f_data))
-                flags_data = _dict_update(flags_data,
-                                          f_data,
-                                          recursive_update=True,
-                                          merge_lists=True)
+    osqd_flags, digest = _resolve_osquery_sources(flagstopfile)
+    if osqd_flags is None:
+        return None
+    digests = __context__.setdefault('nebula.osqueryd_digests', {})
+    if digests.get(flagfile) == digest and os.path.isfile(flagfile):
+        log.debug('osquery flags sources unchanged, keeping %s', flagfile)
+        return flagfile
+    flags_data = _load_osquery_sources(osqd_flags)
     if flags_data:
         try:
             log.debug("Writing config to osquery.flags file")
@@ -728,6 +1354,8 @@ def _generate_osquery_flags_file(flagstopfile):
                     prop_file.write(propdata)
         except Exception:
             log.error("Failed to generate osquery flags file using topfile.", exc_info=True)
+            return flagfile
+    digests[flagfile] = digest
 
     return flagfile
 
@@ -803,7 +1431,6 @@ def _mask_object(object_to_be_masked, topfile):
         would have the value under their ``value`` key masked.
     """
     try:
-        mask = {}
         if topfile is None:
             # We will maintain backward compatibility by keeping two versions of
             # top files and mask files for now
@@ -815,22 +1442,9 @@ def _mask_object(object_to_be_masked, topfile):
         mask_files = _get_top_data(topfile)
         mask_files = ['salt://hubblestack_nebula_v2/' + mask_file.replace('.', '/') + '.yaml'
                       for mask_file in mask_files]
-        if not mask_files:
-            mask_files = []
-        for mask_file in mask_files:
-            if 'salt://' in mask_file:
-                orig_fh = mask_file
-                mask_file = __mods__['cp.cache_file'](mask_file)
-            if not mask_file:
-                log.error('Could not find file %s.', orig_fh)
-                return None
-            if os.path.isfile(mask_file):
-                with open(mask_file, 'r') as yfile:
-                    f_data = yaml.safe_load(yfile)
-                    if not isinstance(f_data, dict):
-                        raise CommandExecutionError('File data is not formed as a dict {0}'
-                                                    .format(f_data))
-                    mask = _dict_update(mask, f_data, recursive_update=True, merge_lists=True)
+        mask = _get_mask_data(mask_files)
+        if mask is None:
+            return None
 
         log.debug('Masking data: %s', mask)
 
@@ -840,6 +1454,14 @@ def _mask_object(object_to_be_masked, topfile):
         log.info("Total number of results to check for masking: %d", len(object_to_be_masked))
         globbing_enabled = __opts__.get('enable_globbing_in_nebula_masking')
 
+        # only visit the results of the queries named by each blacklisted object,
+        # rather than every result once per query name
+        objects_by_query_name = {}
+        for obj in object_to_be_masked:
+            names = [obj.get('name')] if 'action' in obj else obj
+            for name in names:
+                objects_by_query_name.setdefault(name, []).append(obj)
+
         for blacklisted_object in mask.get('blacklisted_objects', []):
             query_names = blacklisted_object['query_names']
             column = blacklisted_object['column']  # Can be converted to list as well in future
@@ -852,8 +1474,8 @@ def _mask_object(object_to_be_masked, topfile):
             else:
                 # Perform masking on results of specific queries specified in 'query_names'
                 for query_name in query_names:
-                    _mask_object_helper(object_to_be_masked, perform_masking_kwargs,
-                                        column, query_name)
+                    _mask_object_helper(objects_by_query_name.get(query_name, []),
+                                        perform_masking_kwargs, column, query_name)
 
     except Exception:
         log.exception('An error occured while masking the passwords.', exc_info=True)
@@ -862,6 +1484,42 @@ def _mask_object(object_to_be_masked, topfile):
     return True
 
 
+def _get_mask_data(mask_files):
+    """
+    Load and merge the given mask files. The merged data is kept in
+    __context__ keyed by the content hashes of the files, so the yaml is only
+    parsed again when a mask file changes. Each call gets its own copy, as
+    masking may modify the blacklisted_objects.
+    """
+    key = []
+    for mask_file in mask_files:
+        if 'salt://' in mask_file:
+            orig_fh = mask_file
+            mask_file = __mods__['cp.cache_file'](mask_file)
+        if not mask_file:
+            log.error('Could not find file %s.', orig_fh)
+            return None
+        if os.path.isfile(mask_file):
+            with open(mask_file, 'rb') as yfile:
+                key.append((mask_file, hashlib.sha256(yfile.read()).hexdigest()))
+    key = tuple(key)
+
+    cached = __context__.get('nebula.mask_data')
+    if cached is not None and cached[0] == key:
+        return copy.deepcopy(cached[1])
+
+    mask = {}
+    for mask_file, _ in key:
+        with open(mask_file, 'r') as yfile:
+            f_data = yaml.load(yfile, Loader=YAML_LOADER)
+            if not isinstance(f_data, dict):
+                raise CommandExecutionError('File data is not formed as a dict {0}'
+                                            .format(f_data))
+            mask = _dict_update(mask, f_data, recursive_update=True, merge_lists=True)
+    __context__['nebula.mask_data'] = (key, mask)
+    return copy.deepcopy(mask)
+
+
 def _mask_object_helper(object_to_be_masked, perform_masking_kwargs, column, query_name=None):
     """
     Helper function used to mask an object
@@ -1084,12 +1742,39 @@ def _perform_masking(object_to_mask, blacklisted_object, mask_with, globbing_ena
         log.debug("Both global and local masking is disabled, skipping masking of results.")
 
     if blacklisted_patterns:
-        _recursively_mask_objects(object_to_mask, blacklisted_object, blacklisted_patterns,
-                                  mask_with, globbing_enabled)
+        is_blacklisted = _compile_blacklisted_patterns(tuple(blacklisted_patterns),
+                                                       bool(globbing_enabled))
+        _recursively_mask_objects(object_to_mask, blacklisted_object, is_blacklisted, mask_with)
+
+
+@functools.lru_cache(maxsize=128)
+def _compile_blacklisted_patterns(blacklisted_patterns, globbing_enabled):
+    """
+    Return a function telling whether a value matches any of the
+    blacklisted_patterns (a tuple). With globbing, the patterns are combined
+    into a single regex (matching like fnmatch.fnmatch); without, values are
+    looked up in a set.
+    """
+    if globbing_enabled:
+        regex = re.compile('|'.join(fnmatch.translate(os.path.normcase(pattern))
+                                    for pattern in blacklisted_patterns))
+
+        def _is_blacklisted(value):
+            return regex.match(os.path.normcase(value)) is not None
+    else:
+        patterns = frozenset(blacklisted_patterns)
+
+        def _is_blacklisted(value):
+            try:
+                return value in patterns
+            except TypeError:
+                # unhashable values can't be equal to a pattern
+                return False
 
+    return _is_blacklisted
 
-def _recursively_mask_objects(object_to_mask, blacklisted_object, blacklisted_patterns,
-                              mask_with, globbing_enabled):
+
+def _recursively_mask_objects(object_to_mask, blacklisted_object, is_blacklisted, mask_with):
     """
     This function is used by ``_mask_object()`` to mask passwords contained in
     an osquery data structure (formed as a list of dicts, usually). Since the
@@ -1101,35 +1786,21 @@ def _recursively_mask_objects(object_to_mask, blacklisted_object, blacklisted_pa
     blacklisted_object
         the blacklisted_objects entry from the mask.yaml
 
-    blacklisted_patterns
-        List of blacklisted patterns which will be used to identify if a field is to be masked
+    is_blacklisted
+        Function telling if the value under attribute_to_check means the
+        object is to be masked (see ``_compile_blacklisted_patterns``)
 
     mask_with
         masked values are replaced with this string
-
-    globbing_enabled
-        enable globbing in specified blacklisted patterns of mask file
     """
     if isinstance(object_to_mask, list):
         for child in object_to_mask:
             log.debug("Recursing object %s", child)
-            _recursively_mask_objects(child, blacklisted_object, blacklisted_patterns,
-                                      mask_with, globbing_enabled)
-    elif globbing_enabled and blacklisted_object['attribute_to_check'] in object_to_mask:
-        mask = False
-        for blacklisted_pattern in blacklisted_patterns:
-            if fnmatch.fnmatch(object_to_mask[blacklisted_object['attribute_to_check']],
-                               blacklisted_pattern):
-                mask = True
-                log.info("Attribute %s will be masked.",
-                         object_to_mask[blacklisted_object['attribute_to_check']])
-                break
-        if mask:
-            for key in blacklisted_object['attributes_to_mask']:
-                if key in object_to_mask:
-                    object_to_mask[key] = mask_with
-    elif (not globbing_enabled) and blacklisted_object['attribute_to_check'] in object_to_mask and \
-            object_to_mask[blacklisted_object['attribute_to_check']] in blacklisted_patterns:
+            _recursively_mask_objects(child, blacklisted_object, is_blacklisted, mask_with)
+    elif blacklisted_object['attribute_to_check'] in object_to_mask and \
+            is_blacklisted(object_to_mask[blacklisted_object['attribute_to_check']]):
+        log.info("Attribute %s will be masked.",
+                 object_to_mask[blacklisted_object['attribute_to_check']])
         for key in blacklisted_object['attributes_to_mask']:
             if key in object_to_mask:
                 object_to_mask[key] = mask_with
@@ -1179,9 +1850,60 @@ def _dict_update(dest, upd, recursive_update=True, merge_lists=False):
     return dest
 
 
+def _proc_starttime(pid):
+    """
+    Return the start time (in clock ticks since boot) of process pid from
+    /proc/<pid>/stat, or None if there's no such process
+    """
+    try:
+        with open('/proc/{0}/stat'.format(pid), 'r') as stat_file:
+            stat = stat_file.read()
+        # the fields after the (parenthesized, possibly space containing) command name;
+        # starttime is the 22nd field overall
+        return stat[stat.rindex(')') + 2:].split()[19]
+    except (IOError, OSError, ValueError, IndexError):
+        return None
+
+
 def _osqueryd_running_status(pidfile):
     """
     This function will check whether osqueryd is running in *nix systems
+
+    Once the process in the pidfile is known to be osqueryd, later checks
+    only verify that the pidfile is unchanged and that the same process
+    (pid and start time) still exists.
+    """
+    known = __context__.get('nebula.osqueryd_process')
+    if known is not None:
+        pidfile_key, pid, starttime = known
+        try:
+            stat = os.stat(pidfile)
+            if (pidfile, stat.st_mtime, stat.st_size) == pidfile_key and \
+                    _proc_starttime(pid) == starttime:
+                return True
+        except OSError:
+            pass
+        __context__.pop('nebula.osqueryd_process', None)
+
+    osqueryd_running = _check_osqueryd_running_status(pidfile)
+    if osqueryd_running:
+        try:
+            stat = os.stat(pidfile)
+            with open(pidfile, 'r') as pfile:
+                pid = int(pfile.readline().strip())
+            starttime = _proc_starttime(pid)
+            if starttime is not None:
+                __context__['nebula.osqueryd_process'] = (
+                    (pidfile, stat.st_mtime, stat.st_size), pid, starttime)
+        except (IOError, OSError, ValueError):
+            pass
+    return osqueryd_running
+
+
+def _check_osqueryd_running_status(pidfile):
+    """
+    Check the pidfile and the /proc entry of its process to see whether
+    osqueryd is running
     """
     log.info("checking if osqueryd is already running or not")
     osqueryd_running = False
@@ -1427,6 +2149,217 @@ def _parse_log(path_to_logfile,
     return event_data
 
 
+def _read_log_chunks(file_des, offset, chunk_size):
+    """
+    Read complete lines from the binary file_des (positioned at offset) and
+    yield them in lists of at most chunk_size lines, along with the offset
+    just after the last line of each list. A trailing partial line (one
+    osqueryd is still writing) is left for the next read.
+    """
+    chunk = []
+    for line in file_des:
+        if not line.endswith(b'\n'):
+            break
+        offset += len(line)
+        chunk.append(line.decode('utf-8', 'replace'))
+        if len(chunk) >= chunk_size:
+            yield chunk, offset
+            chunk = []
+    if chunk:
+        yield chunk, offset
+
+
+def _parse_log_chunks(path_to_logfile,
+                      offset,
+                      backuplogdir,
+                      logfilethresholdinbytes,
+                      backuplogfilescount,
+                      enablediskstatslogging,
+                      chunk_size):
+    """
+    Like _parse_log, but yield the raw events in lists of at most chunk_size
+    events and store the file offset once each list has been consumed.
+    """
+    if not os.path.exists(path_to_logfile):
+        log.error("Log file doesn't exists: %s", path_to_logfile)
+        return
+    rotate_log = os.stat(path_to_logfile).st_size > logfilethresholdinbytes
+    file_offset = offset
+    with open(path_to_logfile, 'rb') as file_des:
+        file_des.seek(offset)
+        for event_data, file_offset in _read_log_chunks(file_des, offset, chunk_size):
+            yield event_data
+            _set_cache_offset(path_to_logfile, file_offset)
+    # the file is closed before rotating to handle File in Use exception in windows
+    if rotate_log:
+        log.info('Log file size above threshold, '
+                 'going to rotate log file: %s', path_to_logfile)
+        residue_events = _perform_log_rotation(path_to_logfile,
+                                               file_offset,
+                                               backuplogdir,
+                                               backuplogfilescount,
+                                               enablediskstatslogging,
+                                               True)
+        # Reset file offset to start of file in case original file is rotated
+        _set_cache_offset(path_to_logfile, 0)
+        for idx in range(0, len(residue_events), chunk_size):
+            yield residue_events[idx:idx + chunk_size]
+
+
+class OsquerydLogTail(object):
+    """
+    inotify watch on the osqueryd log directory for osqueryd_log_parser(tail=True).
+
+    Log files are only read after an event says they were written to (or
+    replaced), starting from offsets kept in memory; the offsets are written
+    to the cachedir (``_set_cache_offset``) every so often rather than on
+    every read.
+    """
+
+    mask = (pyinotify.IN_MODIFY | pyinotify.IN_CREATE | pyinotify.IN_DELETE |
+            pyinotify.IN_MOVED_FROM | pyinotify.IN_MOVED_TO) if HAS_PYINOTIFY else 0
+    replaced_mask = (pyinotify.IN_CREATE | pyinotify.IN_DELETE |
+                     pyinotify.IN_MOVED_FROM | pyinotify.IN_MOVED_TO) if HAS_PYINOTIFY else 0
+
+    def __init__(self, logdir, logfiles):
+        self.logdir = logdir
+        self.logfiles = list(logfiles)
+        self.offsets = dict((logfile, _get_file_offset(logfile) if os.path.exists(logfile) else 0)
+                            for logfile in self.logfiles)
+        self.stored_offsets = dict(self.offsets)
+        self.last_checkpoint = time.time()
+        # read everything once, in case things were written while we weren't watching
+        self.pending = set(self.logfiles)
+        self.watch_manager = pyinotify.WatchManager()
+        self.notifier = pyinotify.Notifier(self.watch_manager, self._process_event)
+        wdd = self.watch_manager.add_watch(logdir, self.mask, quiet=True)
+        if wdd.get(logdir, -1) < 0:
+            self.stop()
+            raise IOError('unable to watch {0}'.format(logdir))
+
+    def stop(self):
+        """ remove the inotify watch """
+        self.notifier.stop()
+
+    def _process_event(self, event):
+        if event.pathname not in self.offsets:
+            return
+        if event.mask & self.replaced_mask:
+            # rotated, removed or recreated: start over with the new file
+            self.offsets[event.pathname] = 0
+        self.pending.add(event.pathname)
+
+    def check_events(self):
+        """ process any inotify events that have arrived, without blocking """
+        while self.notifier.check_events(timeout=0):
+            self.notifier.read_events()
+            self.notifier.process_events()
+
+    def checkpoint(self):
+        """ store the offsets that changed since the last checkpoint """
+        for logfile, offset in self.offsets.items():
+            if offset != self.stored_offsets.get(logfile) and os.path.exists(logfile):
+                _set_cache_offset(logfile, offset)
+                self.stored_offsets[logfile] = offset
+        self.last_checkpoint = time.time()
+
+    def read(self,
+             chunk_size,
+             backuplogdir,
+             logfilethresholdinbytes,
+             backuplogfilescount,
+             enablediskstatslogging,
+             checkpoint_interval):
+        """
+        Yield the raw events appended to the pending log files since the last
+        read, in lists of at most chunk_size events (all at once without one).
+        """
+        self.check_events()
+        for logfile in self.logfiles:
+            if logfile not in self.pending:
+                continue
+            self.pending.discard(logfile)
+            done = False
+            try:
+                for event_data in self._read_logfile(logfile,
+                                                     chunk_size,
+                                                     backuplogdir,
+                                                     logfilethresholdinbytes,
+                                                     backuplogfilescount,
+                                                     enablediskstatslogging):
+                    yield event_data
+                done = True
+            finally:
+                if not done:
+                    # the consumer gave up part way; read the rest next time
+                    self.pending.add(logfile)
+        if time.time() - self.last_checkpoint >= checkpoint_interval:
+            self.checkpoint()
+
+    def _read_logfile(self,
+                      logfile,
+                      chunk_size,
+                      backuplogdir,
+                      logfilethresholdinbytes,
+                      backuplogfilescount,
+                      enablediskstatslogging):
+        try:
+            size = os.stat(logfile).st_size
+        except OSError:
+            self.offsets[logfile] = 0
+            return
+        if size < self.offsets[logfile]:
+            log.info('Log file %s was truncated, reading from the start', logfile)
+            self.offsets[logfile] = 0
+        if size > self.offsets[logfile]:
+            with open(logfile, 'rb') as file_des:
+                file_des.seek(self.offsets[logfile])
+                for event_data, offset in _read_log_chunks(file_des, self.offsets[logfile],
+                                                           chunk_size or float('inf')):
+                    yield event_data
+                    self.offsets[logfile] = offset
+        if size > logfilethresholdinbytes:
+            log.info('Log file size above threshold, '
+                     'going to rotate log file: %s', logfile)
+            residue_events = _perform_log_rotation(logfile,
+                                                   self.offsets[logfile],
+                                                   backuplogdir,
+                                                   backuplogfilescount,
+                                                   enablediskstatslogging,
+                                                   True)
+            self.offsets[logfile] = 0
+            _set_cache_offset(logfile, 0)
+            self.stored_offsets[logfile] = 0
+            step = chunk_size or len(residue_events) or 1
+            for idx in range(0, len(residue_events), step):
+                yield residue_events[idx:idx + step]
+
+
+def _get_osqueryd_log_tail(logdir, logfiles):
+    """
+    Return the OsquerydLogTail for logdir from __context__, creating it if
+    needed. Returns None if the directory can't be watched (no pyinotify, or
+    the directory doesn't exist yet).
+    """
+    if not HAS_PYINOTIFY:
+        log.debug('pyinotify is not available, not tailing osqueryd logs')
+        return None
+    logdir = os.path.normpath(logdir)
+    log_tail = __context__.get('nebula.osqueryd_log_tail')
+    if log_tail is not None and (log_tail.logdir != logdir or log_tail.logfiles != logfiles):
+        log_tail.checkpoint()
+        log_tail.stop()
+        log_tail = None
+    if log_tail is None:
+        try:
+            log_tail = OsquerydLogTail(logdir, logfiles)
+        except Exception:
+            log.error('Unable to watch osqueryd log directory %s', logdir, exc_info=True)
+            return None
+        __context__['nebula.osqueryd_log_tail'] = log_tail
+    return log_tail
+
+
 def _set_cache_offset(path_to_logfile, offset):
     """
     Cache file offset in specified file
@@ -1584,6 +2517,9 @@ def query(query):
     query
         String containgin `SQL` query to be run by osquery
 
+    Results are shared with other callers of the same query for
+    ``osquery_result_cache_ttl`` seconds (see
+    ``hubblestack.utils.osquery_lib.run_all_cached``).
     """
     max_file_size = 104857600
     if 'attach' in query.lower() or 'curl' in query.lower():
@@ -1594,7 +2530,8 @@ def query(query):
 
     # Run the osqueryi query
     cmd = [__grains__['osquerybinpath'], '--read_max', max_file_size, '--json', query]
-    res = __mods__['cmd.run_all'](cmd, timeout=600)
+    res = hubblestack.utils.osquery_lib.run_all_cached(cmd, query, run_all=__mods__['cmd.run_all'],
+                                                       timeout=600)
     if res['retcode'] == 0:
         query_ret['data'] = json.loads(res['stdout'])
     else:
@@ -626,6 +626,12 @@ class delta_t(object):
         self.last_mark = name
         self.marks[name] = time.time()
 
+    def as_dict(self):
+        """ return the elapsed time of each mark (and the total under 'top')
+            e.g., {'top': 0.31, 'read_config': 0.01, 'check_events': 0.29}
+        """
+        return dict( (name, self.get(name)) for name in self.marks )
+
 @hubble_status.watch
 def process(configfile='salt://hubblestack_pulsar/hubblestack_pulsar_config.yaml',
             verbose=False):
@@ -941,6 +947,10 @@ def process(configfile='salt://hubblestack_pulsar/hubblestack_pulsar_config.yaml
                 json.dump(wm.watch_db, fh)
             log.debug("wrote watch_db to {}".format(f))
 
+    # keep the timings of the most recent sweep around for anyone curious
+    # (e.g. contrib/pulsar-storm-bench.py)
+    __context__['pulsar.delta_t'] = dt
+
     return ret
 
 
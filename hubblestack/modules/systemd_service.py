@@ -38,6 +38,12 @@ LOCAL_CONFIG_PATH = '/etc/systemd/system'
 INITSCRIPT_PATH = '/etc/init.d'
 VALID_UNIT_TYPES = ('service', 'socket', 'device', 'mount', 'automount',
                     'swap', 'target', 'path', 'timer')
+# ActiveState and UnitFileState values for which ``systemctl is-active`` and
+# ``systemctl is-enabled`` exit with 0. 'generated' is left out: those units
+# are mostly sysvinit scripts, which ``enabled`` asks systemd-sysv-install about
+ACTIVE_STATES = ('active', 'reloading')
+ENABLED_STATES = ('enabled', 'enabled-runtime', 'static', 'indirect',
+                  'transient', 'alias')
 
 # Define the module's virtual name
 __virtualname__ = 'service'
@@ -164,6 +170,63 @@ def get_all():
     ret.update(set(_get_sysv_services(systemd_services=ret)))
     return sorted(ret)
 
+def unit_states():
+    '''
+    Return whether each unit known to systemd is running and enabled, as
+    ``status`` and ``enabled`` would, from one ``systemctl list-units`` and one
+    ``systemctl list-unit-files`` call instead of two calls per unit.
+
+    Units are keyed by their name (``sshd.service``). ``running`` is None for
+    units that ``list-units`` doesn't show (e.g. aliases, which it lists under
+    their canonical name); ask ``status`` about those. ``enabled`` is None for
+    units without a unit file of their own (e.g. template instances), generated
+    units and sysvinit services; ask ``enabled`` about those. Unlike ``status``, this doesn't check for changed unit files, so it
+    never runs a daemon-reload.
+
+    CLI Example:
+
+    .. code-block:: bash
+
+        salt '*' service.unit_states
+    '''
+    ret = {}
+    out = __mods__['cmd.run_all'](
+        _systemctl_cmd('list-unit-files --full --no-legend --no-pager'),
+        python_shell=False,
+        ignore_retcode=True
+    )
+    if out['retcode'] != 0:
+        raise CommandExecutionError(
+            'Failed to list unit files: %s' % out['stderr']
+        )
+    for line in out['stdout'].splitlines():
+        fields = line.split()
+        if len(fields) >= 2:
+            ret[fields[0]] = {'running': None,
+                              'enabled': None if fields[1] == 'generated' else fields[1] in ENABLED_STATES}
+
+    out = __mods__['cmd.run_all'](
+        _systemctl_cmd('list-units --all --full --plain --no-legend --no-pager'),
+        python_shell=False,
+        ignore_retcode=True
+    )
+    if out['retcode'] != 0:
+        raise CommandExecutionError(
+            'Failed to list units: %s' % out['stderr']
+        )
+    for line in out['stdout'].splitlines():
+        # some systemd releases mark failed units even with --plain
+        fields = line.lstrip('\u25cf* ').split()
+        if len(fields) >= 3:
+            state = ret.setdefault(fields[0], {'running': False, 'enabled': None})
+            state['running'] = fields[2] in ACTIVE_STATES
+
+    for sysv_service in _get_sysv_services():
+        for name in (sysv_service, sysv_service + '.service'):
+            if name in ret:
+                ret[name]['enabled'] = None
+    return ret
+
 def _get_systemd_services():
     '''
     Use os.listdir() to get all the unit files
@@ -95,12 +95,10 @@ def list_pkgs(versions_as_list=False, **kwargs):
 
     if contextkey not in __context__:
         ret = {}
-        cmd = ['rpm', '-qa', '--queryformat',
-               hubblestack.utils.pkg.rpm.QUERYFORMAT.replace('%{REPOID}', '(none)') + '\n']
-        output = __mods__['cmd.run'](cmd,
-                                     python_shell=False,
-                                     output_loglevel='trace')
-        for line in output.splitlines():
+        lines = hubblestack.utils.pkg.read_db(__opts__, 'rpm',
+                                              hubblestack.utils.pkg.rpm.rpmdb_path(),
+                                              _read_rpmdb)
+        for line in lines:
             pkginfo = hubblestack.utils.pkg.rpm.parse_pkginfo(
                 line,
                 osarch=__grains__['osarch']
@@ -134,6 +132,23 @@ def list_pkgs(versions_as_list=False, **kwargs):
         versions_as_list,
         attr)
 
+def _read_rpmdb():
+    '''
+    The installed packages as lines of ``rpm -qa --queryformat``, read with
+    the rpm python bindings if available
+    '''
+    if hubblestack.utils.pkg.rpm.HAS_RPM_BINDINGS:
+        try:
+            return hubblestack.utils.pkg.rpm.read_rpmdb()
+        except Exception as exc:
+            log.warning('Could not read the rpm database, running rpm instead: %s', exc)
+    cmd = ['rpm', '-qa', '--queryformat',
+           hubblestack.utils.pkg.rpm.QUERYFORMAT.replace('%{REPOID}', '(none)') + '\n']
+    output = __mods__['cmd.run'](cmd,
+                                 python_shell=False,
+                                 output_loglevel='trace')
+    return output.splitlines()
+
 def version(*names, **kwargs):
     '''
     Returns a string representing the package version or an empty string if not
@@ -44,12 +44,59 @@ import socket
 import json
 import logging
 import os
-from collections import defaultdict
 from hubblestack.hec import http_event_collector, get_splunk_options, make_hec_args
 
 log = logging.getLogger(__name__)
 
 
+LINUX_ACTIONS = {
+    'IN_ACCESS': 'read',
+    'IN_ATTRIB': 'acl_modified',
+    'IN_CLOSE_NOWRITE': 'read',
+    'IN_CLOSE_WRITE': 'read',
+    'IN_CREATE': 'created',
+    'IN_DELETE': 'deleted',
+    'IN_DELETE_SELF': 'deleted',
+    'IN_MODIFY': 'modified',
+    'IN_MOVE_SELF': 'modified',
+    'IN_MOVED_FROM': 'modified',
+    'IN_MOVED_TO': 'modified',
+    'IN_OPEN': 'read',
+    'IN_MOVE': 'modified',
+    'IN_CLOSE': 'read',
+}
+
+WINDOWS_ACTIONS = {
+    'Delete': 'deleted',
+    'Read Control': 'read',
+    'Write DAC': 'acl_modified',
+    'Write Owner': 'modified',
+    'Synchronize': 'modified',
+    'Access Sys Sec': 'read',
+    'Read Data': 'read',
+    'Write Data': 'modified',
+    'Append Data': 'modified',
+    'Read EA': 'read',
+    'Write EA': 'modified',
+    'Execute/Traverse': 'read',
+    'Read Attributes': 'read',
+    'Write Attributes': 'acl_modified',
+    'Query Key Value': 'read',
+    'Set Key Value': 'modified',
+    'Create Sub Key': 'created',
+    'Enumerate Sub-Keys': 'read',
+    'Notify About Changes to Keys': 'read',
+    'Create Link': 'created',
+    'Print': 'read',
+    'Basic info change': 'modified',
+    'Compression change': 'modified',
+    'Data extend': 'modified',
+    'EA change': 'modified',
+    'File create': 'created',
+    'File delete': 'deleted',
+}
+
+
 def returner(ret):
     """
     Get pulsar data and post it to Splunk
@@ -65,11 +112,13 @@ def returner(ret):
     # Sometimes there are duplicate events in the list. Dedup them:
     data = _dedup_list(data)
     host_args = _build_args(ret)
-    alerts = _build_alerts(data)
+    alerts = _dedup_list(_build_alerts(data))
 
     # Get cloud details
     cloud_details = __grains__.get('cloud_details', {})
     try:
+        # The events don't depend on the splunk options, build them just once
+        events = _build_events(alerts)
         opts_list = get_splunk_options(sourcetype='hubble_fim',
                                        _nick={'sourcetype_pulsar': 'sourcetype'})
         for opts in opts_list:
@@ -85,18 +134,8 @@ def returner(ret):
             args, kwargs = make_hec_args(opts)
             hec = http_event_collector(*args, **kwargs)
 
-            for alert in alerts:
-                if 'change' in alert:  # Linux, normal pulsar
-                    # The second half of the change will be '|IN_ISDIR' for directories
-                    change = alert['change'].split('|')[0]
-                    # Skip the IN_IGNORED events
-                    if change == 'IN_IGNORED':
-                        continue
-                    event = _build_linux_event(alert, change)
-                else:  # Windows, win_pulsar
-                    event = _build_windows_event(alert)
-                event = _update_event(opts['custom_fields'], host_args, cloud_details, event)
-                payload = _build_payload(host_args, event, opts, index_extracted_fields)
+            for payload in _build_payloads(events, opts, host_args, cloud_details,
+                                           index_extracted_fields):
                 hec.batchEvent(payload)
 
             hec.flushBatch()
@@ -105,74 +144,76 @@ def returner(ret):
     return
 
 
+def _dedup_key(item):
+    """
+    Helper function that turns an arbitrarily nested item into a hashable key
+    that compares equal exactly when the items compare equal
+    """
+    if isinstance(item, dict):
+        return dict, frozenset((k, _dedup_key(v)) for k, v in item.items())
+    if isinstance(item, (list, tuple)):
+        return list, tuple(_dedup_key(v) for v in item)
+    if isinstance(item, (set, frozenset)):
+        return set, frozenset(_dedup_key(v) for v in item)
+    try:
+        hash(item)
+    except TypeError:
+        return repr(item)
+    return item
+
+
 def _dedup_list(input_list):
     """
     Function that removes duplicates from a list
+
+    Like the original (quadratic) implementation, the last occurrence of each
+    item is the one that is kept.
     """
+    seen = set()
     deduped = []
-    for idx, item in enumerate(input_list):
-        if item not in input_list[idx + 1:]:
+    for item in reversed(input_list):
+        key = _dedup_key(item)
+        if key not in seen:
+            seen.add(key)
             deduped.append(item)
+    deduped.reverse()
     return deduped
 
 
-def _build_linux_actions():
+def _build_events(alerts):
     """
-    Helper function that builds the actions defaultdict for Linux - pulsar
+    Helper function that builds the (option independent) event dicts for all the alerts
     """
-    actions = defaultdict(lambda: 'unknown')
-    actions['IN_ACCESS'] = 'read'
-    actions['IN_ATTRIB'] = 'acl_modified'
-    actions['IN_CLOSE_NOWRITE'] = 'read'
-    actions['IN_CLOSE_WRITE'] = 'read'
-    actions['IN_CREATE'] = 'created'
-    actions['IN_DELETE'] = 'deleted'
-    actions['IN_DELETE_SELF'] = 'deleted'
-    actions['IN_MODIFY'] = 'modified'
-    actions['IN_MOVE_SELF'] = 'modified'
-    actions['IN_MOVED_FROM'] = 'modified'
-    actions['IN_MOVED_TO'] = 'modified'
-    actions['IN_OPEN'] = 'read'
-    actions['IN_MOVE'] = 'modified'
-    actions['IN_CLOSE'] = 'read'
-
-    return actions
-
-
-def _build_windows_actions():
+    events = []
+    for alert in alerts:
+        if 'change' in alert:  # Linux, normal pulsar
+            # The second half of the change will be '|IN_ISDIR' for directories
+            change = alert['change'].split('|')[0]
+            # Skip the IN_IGNORED events
+            if change == 'IN_IGNORED':
+                continue
+            events.append(_build_linux_event(alert, change))
+        else:  # Windows, win_pulsar
+            events.append(_build_windows_event(alert))
+
+    return events
+
+
+def _build_payloads(events, opts, host_args, cloud_details, index_extracted_fields):
     """
-    Helper function that builds the actions defaultdict for Windows - win_pulsar
+    Construct the payloads of all the events for one set of splunk options in a single pass
     """
-    actions = defaultdict(lambda: 'unknown')
-    actions['Delete'] = 'deleted'
-    actions['Read Control'] = 'read'
-    actions['Write DAC'] = 'acl_modified'
-    actions['Write Owner'] = 'modified'
-    actions['Synchronize'] = 'modified'
-    actions['Access Sys Sec'] = 'read'
-    actions['Read Data'] = 'read'
-    actions['Write Data'] = 'modified'
-    actions['Append Data'] = 'modified'
-    actions['Read EA'] = 'read'
-    actions['Write EA'] = 'modified'
-    actions['Execute/Traverse'] = 'read'
-    actions['Read Attributes'] = 'read'
-    actions['Write Attributes'] = 'acl_modified'
-    actions['Query Key Value'] = 'read'
-    actions['Set Key Value'] = 'modified'
-    actions['Create Sub Key'] = 'created'
-    actions['Enumerate Sub-Keys'] = 'read'
-    actions['Notify About Changes to Keys'] = 'read'
-    actions['Create Link'] = 'created'
-    actions['Print'] = 'read'
-    actions['Basic info change'] = 'modified'
-    actions['Compression change'] = 'modified'
-    actions['Data extend'] = 'modified'
-    actions['EA change'] = 'modified'
-    actions['File create'] = 'created'
-    actions['File delete'] = 'deleted'
-
-    return actions
+    common = _build_common_fields(opts['custom_fields'], host_args, cloud_details)
+    payloads = []
+    for event in events:
+        event = dict(event)
+        event.update(common)
+        # Remove any empty fields from the event payload
+        for k in [k for k in event if event[k] == ""]:
+            del event[k]
+        payloads.append(_build_payload(host_args, event, opts, index_extracted_fields))
+
+    return payloads
 
 
 def _build_windows_event(alert):
@@ -188,10 +229,10 @@ def _build_windows_event(alert):
     else:
         change = alert['Reason']
         object_type = 'file'
-    actions = _build_windows_actions()
+    actions = WINDOWS_ACTIONS
     event = {}
     if alert.get('Accesses', None):
-        event['action'] = actions[change]
+        event['action'] = actions.get(change, 'unknown')
         event['change_type'] = 'filesystem'
         event['object_category'] = object_type
         event['object_path'] = alert['Object Name']
@@ -230,9 +271,7 @@ def _build_linux_event(alert, change):
         object_type = 'directory'
     else:
         object_type = 'file'
-    actions = _build_linux_actions()
-
-    event = {'action': actions[change],
+    event = {'action': LINUX_ACTIONS.get(change, 'unknown'),
              'change_type': 'filesystem',
              'object_category': object_type,
              'object_path': alert['path'],
@@ -298,29 +337,25 @@ def _build_args(ret):
     return args
 
 
-def _update_event(custom_fields, host_args, cloud_details, event):
+def _build_common_fields(custom_fields, host_args, cloud_details):
     """
-    Helper function that updates the event with the values from custom fields and removes duplicates
+    Helper function that builds the fields shared by every event: host, cloud and custom fields
     """
-    event.update({'minion_id': host_args['minion_id'],
-                  'dest_host': host_args['fqdn'],
-                  'dest_ip': host_args['fqdn_ip4'],
-                  'dest_fqdn': host_args['local_fqdn'],
-                  'system_uuid': __grains__.get('system_uuid')})
-    event.update(cloud_details)
+    common = {'minion_id': host_args['minion_id'],
+              'dest_host': host_args['fqdn'],
+              'dest_ip': host_args['fqdn_ip4'],
+              'dest_fqdn': host_args['local_fqdn'],
+              'system_uuid': __grains__.get('system_uuid')}
+    common.update(cloud_details)
     for custom_field in custom_fields:
         custom_field_name = 'custom_' + custom_field
         custom_field_value = __mods__['config.get'](custom_field, '')
         if isinstance(custom_field_value, list):
             custom_field_value = ','.join(custom_field_value)
         if isinstance(custom_field_value, str):
-            event.update({custom_field_name: custom_field_value})
-    # Remove any empty fields from the event payload
-    remove_keys = [k for k in event if event[k] == ""]
-    for k in remove_keys:
-        del event[k]
+            common.update({custom_field_name: custom_field_value})
 
-    return event
+    return common
 
 
 def _build_alerts(data):
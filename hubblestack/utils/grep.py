@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+"""
+In-process grep for the audit modules
+
+grep() handles the invocations audit profiles use: basic, extended or fixed
+string patterns with -i, -v, -w, -x, -c, -n, -q and -s, on the lines of a
+single file or string. It returns what ``cmd.run_all`` of grep would:
+retcode 0 when lines were selected, 1 when none were, and the selected lines
+on stdout, with trailing whitespace stripped.
+
+Anything else (other flags, binary or non utf-8 input, patterns that can't be
+translated to python regular expressions) gets None, and the caller should
+run grep itself.
+"""
+
+import functools
+import logging
+import mmap
+import os
+import re
+import string
+
+log = logging.getLogger(__name__)
+
+# posix character classes, as the inside of a python character set
+_CLASSES = {
+    'alpha': 'a-zA-Z',
+    'digit': '0-9',
+    'alnum': '0-9a-zA-Z',
+    'upper': 'A-Z',
+    'lower': 'a-z',
+    'space': r' \t\n\r\f\v',
+    'blank': r' \t',
+    'punct': ''.join('\\' + char for char in string.punctuation),
+    'xdigit': '0-9A-Fa-f',
+    'cntrl': r'\x00-\x1f\x7f',
+    'print': r'\x20-\x7e',
+    'graph': r'\x21-\x7e',
+}
+
+_SHORT_OPTIONS = {
+    'E': ('syntax', 'E'), 'F': ('syntax', 'F'), 'G': ('syntax', 'G'),
+    'i': ('ignore_case', True), 'y': ('ignore_case', True),
+    'v': ('invert', True), 'w': ('word', True), 'x': ('line', True),
+    'c': ('count', True), 'n': ('line_number', True), 'q': ('quiet', True),
+    's': ('no_messages', True), 'h': ('no_filename', True),
+}
+
+_LONG_OPTIONS = {
+    '--extended-regexp': 'E', '--fixed-strings': 'F', '--basic-regexp': 'G',
+    '--ignore-case': 'i', '--invert-match': 'v', '--word-regexp': 'w',
+    '--line-regexp': 'x', '--count': 'c', '--line-number': 'n', '--quiet': 'q',
+    '--silent': 'q', '--no-messages': 's', '--no-filename': 'h',
+}
+
+
+def parse_args(*args):
+    """
+    Return the options given by the grep command line flags in args, or
+    None if there's a flag grep() doesn't handle
+    """
+    options = {'syntax': 'G'}
+    for arg in args:
+        if not isinstance(arg, str):
+            return None
+        for flag in arg.split():
+            if flag in _LONG_OPTIONS:
+                flag = '-' + _LONG_OPTIONS[flag]
+            if not flag.startswith('-') or flag.startswith('--') or len(flag) < 2:
+                return None
+            for char in flag[1:]:
+                if char not in _SHORT_OPTIONS:
+                    return None
+                key, value = _SHORT_OPTIONS[char]
+                options[key] = value
+    return options
+
+
+def _translate_bracket(pattern, idx):
+    """
+    Translate the bracket expression starting at pattern[idx]; return the
+    index after it and the python character set (or None, None)
+    """
+    end = len(pattern)
+    jdx = idx + 1
+    out = ['[']
+    if jdx < end and pattern[jdx] == '^':
+        out.append('^')
+        jdx += 1
+    first = True
+    while jdx < end:
+        char = pattern[jdx]
+        if char == ']' and not first:
+            out.append(']')
+            return jdx + 1, ''.join(out)
+        first = False
+        if char == '[' and jdx + 1 < end and pattern[jdx + 1] in ':.=':
+            kind = pattern[jdx + 1]
+            close = pattern.find(kind + ']', jdx + 2)
+            if close < 0:
+                return None, None
+            name = pattern[jdx + 2:close]
+            if kind == ':' and name in _CLASSES:
+                out.append(_CLASSES[name])
+            elif kind != ':' and len(name) == 1:
+                out.append(re.escape(name))
+            else:
+                return None, None
+            jdx = close + 2
+            continue
+        # backslash is not special in a bracket expression; '-' makes ranges
+        out.append(char if char == '-' or char.isalnum() else re.escape(char))
+        jdx += 1
+    return None, None
+
+
+def _translate(pattern, extended):
+    """
+    Translate a posix basic (or extended) regular expression into a python one
+    """
+    out = []
+    idx = 0
+    end = len(pattern)
+    while idx < end:
+        char = pattern[idx]
+        at_start = not out or out[-1] in ('(', '|', '^')
+        if char == '[':
+            idx, char_set = _translate_bracket(pattern, idx)
+            if char_set is None:
+                raise ValueError('unterminated bracket expression')
+            out.append(char_set)
+            continue
+        if char == '\\':
+            if idx + 1 >= end:
+                raise ValueError('trailing backslash')
+            char = pattern[idx + 1]
+            idx += 2
+            if char in '<>':
+                out.append(r'\b')
+            elif not extended and char in '(){}|+?':
+                out.append(char)
+            elif char.isdigit() or char in 'wWsSbB':
+                out.append('\\' + char)
+            elif char.isalnum() or char in '`\'':
+                # \d and friends mean something else (or nothing) to grep
+                raise ValueError('unsupported escape \\' + char)
+            else:
+                out.append(re.escape(char))
+            continue
+        idx += 1
+        if extended and char == '(' and pattern.startswith('?', idx):
+            # a python extension, not a posix group
+            raise ValueError('unsupported group (?')
+        if not extended and char in '(){}|+?':
+            out.append(re.escape(char))
+        elif char == '*' and at_start:
+            out.append(r'\*')
+        elif char == '^' and not extended and not at_start:
+            out.append(r'\^')
+        elif char == '$' and not extended and idx < end and not pattern.startswith(('\\)', '\\|'), idx):
+            out.append(r'\$')
+        elif char in '.*+?(){}|^$':
+            out.append(char)
+        else:
+            out.append(re.escape(char))
+    return ''.join(out)
+
+
+@functools.lru_cache(maxsize=1024)
+def compile_pattern(pattern, syntax='G', ignore_case=False, word=False, line=False):
+    """
+    Compile a grep pattern (newline separated alternatives) into a python
+    regular expression, or None if it can't be translated
+    """
+    alternatives = pattern.split('\n')
+    try:
+        if syntax == 'F':
+            regexes = [re.escape(alternative) for alternative in alternatives]
+        else:
+            regexes = [_translate(alternative, syntax == 'E') for alternative in alternatives]
+        if len(regexes) > 1 and any(re.search(r'\\\d', regex) for regex in regexes):
+            # back-references would be numbered differently in the combined regex
+            return None
+        regex = '|'.join('(?:{0})'.format(regex) for regex in regexes)
+        if word:
+            regex = r'(?<!\w)(?:{0})(?!\w)'.format(regex)
+        if line:
+            regex = r'(?:{0})\Z'.format(regex)
+        return re.compile(regex, re.IGNORECASE if ignore_case else 0)
+    except (ValueError, re.error) as exc:
+        log.debug('Could not translate grep pattern %r: %s', pattern, exc)
+        return None
+
+
+def split_lines(text):
+    """
+    Split text into the lines grep sees
+    """
+    if not isinstance(text, str):
+        return None
+    lines = text.split('\n')
+    if lines[-1] == '':
+        lines.pop()
+    return lines
+
+
+def read_lines(path):
+    """
+    Read the lines of the file at path, or None if it can't be read, is
+    binary or isn't utf-8
+    """
+    try:
+        with open(path, 'rb') as handle:
+            if os.fstat(handle.fileno()).st_size:
+                with mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    if mapped.find(b'\0') >= 0:
+                        return None
+                    content = mapped[:]
+            else:
+                # empty, or a /proc-like file reporting no size
+                content = handle.read()
+                if b'\0' in content:
+                    return None
+        return split_lines(content.decode('utf-8'))
+    except (IOError, OSError, ValueError) as exc:
+        log.debug('Could not read %s for grep: %s', path, exc)
+        return None
+
+
+def grep(lines, pattern, *args):
+    """
+    Select the lines matching pattern, as grep with the flags in args would.
+    Return a dict with retcode, stdout and stderr, or None if grep has to
+    be run instead.
+    """
+    if lines is None or not isinstance(pattern, str):
+        return None
+    options = parse_args(*args)
+    if options is None:
+        return None
+    regex = compile_pattern(pattern, options['syntax'], options.get('ignore_case', False),
+                            options.get('word', False), options.get('line', False))
+    if regex is None:
+        return None
+
+    match = regex.match if options.get('line') else regex.search
+    invert = options.get('invert', False)
+    selected = [(number, line) for number, line in enumerate(lines, 1) if bool(match(line)) != invert]
+
+    if options.get('quiet'):
+        stdout = ''
+    elif options.get('count'):
+        stdout = str(len(selected))
+    elif options.get('line_number'):
+        stdout = '\n'.join('{0}:{1}'.format(number, line) for number, line in selected)
+    else:
+        stdout = '\n'.join(line for _, line in selected)
+    return {'retcode': 0 if selected else 1, 'stdout': stdout.rstrip(), 'stderr': ''}
@@ -4,14 +4,135 @@ Author - Mudit Agarwal (muagarwa@adobe.com)
 """
 import logging
 import os
+import queue
+import subprocess
+import threading
+import time
+import re
 import hubblestack.modules.cmdmod
 import json
+from json.decoder import WHITESPACE
+
+from hubblestack.status import HubbleStatus
 
 __mods__ = {'cmd.run': hubblestack.modules.cmdmod._run_quiet,
             'cmd.run_all': hubblestack.modules.cmdmod.run_all}
+__opts__ = {}
 
 log = logging.getLogger(__name__)
 
+hubble_status = HubbleStatus(__name__, 'cache_hit', 'cache_miss')
+
+DEFAULT_CACHE_TTL = 60
+MAX_CACHE_ENTRIES = 256
+_RESULT_CACHE = {}
+_IN_FLIGHT = {}
+_CACHE_LOCK = threading.Lock()
+_SQL_QUOTED = re.compile(r"""('(?:[^']|'')*'|"(?:[^"]|"")*")""")
+# quoted strings and identifiers (group 1, kept) or comments (removed)
+_SQL_COMMENTS = re.compile(r"""('(?:[^']|'')*'|"(?:[^"]|"")*"|`[^`]*`)|--[^\n]*|/\*.*?(?:\*/|\Z)""", re.S)
+
+
+def strip_sql_comments(query_sql):
+  """
+  Remove the ``--`` and ``/* */`` comments (outside of quoted strings and
+  identifiers) from query_sql
+  """
+  return _SQL_COMMENTS.sub(lambda mat: mat.group(1) or ' ', query_sql)
+
+
+def normalize_sql(query_sql):
+  """
+  Collapse the comments and whitespace (outside of quoted strings) and the
+  trailing semicolon of query_sql, so equivalent queries share a cache entry
+  """
+  parts = _SQL_QUOTED.split(strip_sql_comments(query_sql))
+  for idx in range(0, len(parts), 2):
+    parts[idx] = re.sub(r'\s+', ' ', parts[idx])
+  return ''.join(parts).strip().rstrip(';').strip()
+
+
+def cache_ttl():
+  """
+  The configured lifetime (``osquery_result_cache_ttl``, in seconds) of
+  cached osquery results; 0 disables the cache
+  """
+  try:
+    return float(__opts__.get('osquery_result_cache_ttl', DEFAULT_CACHE_TTL))
+  except (TypeError, ValueError):
+    return DEFAULT_CACHE_TTL
+
+
+class _InFlight(object):
+  """ an osqueryi run that other callers asking for the same query can wait on """
+
+  def __init__(self):
+    self.done = threading.Event()
+    self.res = None
+
+
+def run_all_cached(cmd, query_sql, run_all=None, ttl=None, **kwargs):
+  """
+  Run the osqueryi command ``cmd`` (which includes ``query_sql``) with
+  ``cmd.run_all`` (or the given run_all function) and return its result.
+
+  Successful results are cached for ``ttl`` seconds (default: cache_ttl()),
+  keyed by the command with the query normalized. Callers asking for a query
+  that is already running wait for that run rather than starting another
+  osqueryi. Hits and misses are counted in hubblestack.status as
+  hubblestack.utils.osquery_lib.cache_hit and .cache_miss.
+  """
+  if run_all is None:
+    run_all = __mods__['cmd.run_all']
+  if ttl is None:
+    ttl = cache_ttl()
+  if not ttl or ttl <= 0:
+    return run_all(cmd, **kwargs)
+
+  key = tuple(normalize_sql(arg) if arg is query_sql else str(arg) for arg in cmd)
+  while True:
+    with _CACHE_LOCK:
+      cached = _RESULT_CACHE.get(key)
+      if cached is not None and cached[0] > time.time():
+        hubble_status.mark('cache_hit')
+        return dict(cached[1])
+      flight = _IN_FLIGHT.get(key)
+      leader = flight is None
+      if leader:
+        flight = _IN_FLIGHT[key] = _InFlight()
+    if leader:
+      break
+    flight.done.wait()
+    if flight.res is not None:
+      hubble_status.mark('cache_hit')
+      return dict(flight.res)
+    # the run we waited for failed with an exception; try it ourselves
+
+  hubble_status.mark('cache_miss')
+  res = None
+  try:
+    res = run_all(cmd, **kwargs)
+  finally:
+    with _CACHE_LOCK:
+      _IN_FLIGHT.pop(key, None)
+      if isinstance(res, dict) and res.get('retcode') == 0:
+        now = time.time()
+        for old_key in [k for k, v in _RESULT_CACHE.items() if v[0] <= now]:
+          del _RESULT_CACHE[old_key]
+        if len(_RESULT_CACHE) >= MAX_CACHE_ENTRIES:
+          del _RESULT_CACHE[min(_RESULT_CACHE, key=lambda k: _RESULT_CACHE[k][0])]
+        _RESULT_CACHE[key] = (now + ttl, dict(res))
+    flight.res = res
+    flight.done.set()
+  return res
+
+
+def clear_cache():
+  """ forget all cached osquery results """
+  with _CACHE_LOCK:
+    _RESULT_CACHE.clear()
+
+
 def query(query_sql='', osquery_path='/opt/osquery/osqueryi', args=None, max_file_size=104857600, timeout=10000, output_loglevel='quiet'):
   try:
     if not query_sql:
@@ -31,7 +152,7 @@ def query(query_sql='', osquery_path='/opt/osquery/osqueryi', args=None, max_fil
 
     # Run the command
 
-    res = __mods__['cmd.run_all'](cmd, timeout=timeout, python_shell=False, output_loglevel=output_loglevel)
+    res = run_all_cached(cmd, query_sql, timeout=timeout, python_shell=False, output_loglevel=output_loglevel)
     if res['retcode'] == 0:
       ret = json.loads(res['stdout'])
       return ret
@@ -39,3 +160,162 @@ def query(query_sql='', osquery_path='/opt/osquery/osqueryi', args=None, max_fil
   except Exception as e:
     log.exception('An exception occurred while executing query {0} - {1}'.format(query_sql, e))
     return None
+
+
+class OsqueryiSession(object):
+  """
+  A long-lived ``osqueryi --json`` shell that queries are piped through.
+
+  Spawning osqueryi for every query pays for the osquery startup, extension
+  loading and table initialization each time. A session starts the shell
+  once and writes each query to its stdin, followed by a sentinel query
+  whose (known) output marks the end of the query's results. Queries are
+  written as they are (line breaks included), only without comments: a
+  comment would swallow the terminating semicolon or the sentinel. Queries
+  with a line starting with '.' (a shell meta-command) are refused.
+
+  Queries that time out, or a shell that dies, cause the shell to be
+  stopped; the next query transparently starts a new one.
+
+  .. code-block:: python
+
+      session = OsqueryiSession(['/opt/osquery/osqueryi', '--json'])
+      session.query('select * from os_version;', timeout=60)
+      # {'result': True, 'data': [{'name': 'CentOS Linux', ...}]}
+  """
+
+  sentinel_column = 'hubble_sentinel'
+
+  def __init__(self, cmd, timeout=600):
+    self.cmd = [ str(x) for x in cmd ]
+    self.timeout = timeout
+    self.proc = None
+    self.starts = 0
+    self._serial = 0
+    self._output = None
+    self.lock = threading.Lock()
+
+  @property
+  def alive(self):
+    return self.proc is not None and self.proc.poll() is None
+
+  def _reader(self, fh, output):
+    for line in iter(fh.readline, ''):
+      output.put(line)
+    output.put(None)
+
+  def start(self):
+    """ start the shell (if it isn't already running) """
+    if self.alive:
+      return
+    self.stop()
+    log.debug('starting osqueryi session: %s', self.cmd)
+    # stderr is merged into stdout so error messages arrive in order with the results
+    self.proc = subprocess.Popen(self.cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                 stderr=subprocess.STDOUT, universal_newlines=True, bufsize=1)
+    self.starts += 1
+    self._output = queue.Queue()
+    thread = threading.Thread(target=self._reader, args=(self.proc.stdout, self._output))
+    thread.daemon = True
+    thread.start()
+
+  def stop(self):
+    """ stop the shell (if it's running) """
+    proc, self.proc = self.proc, None
+    if proc is None:
+      return
+    try:
+      proc.stdin.close()
+    except Exception:
+      pass
+    if proc.poll() is None:
+      proc.kill()
+    try:
+      proc.wait(timeout=5)
+    except Exception:
+      log.error('osqueryi session pid=%d did not exit after kill', proc.pid)
+
+  def _fail(self, error):
+    self.stop()
+    return {'result': False, 'error': error}
+
+  def query(self, query_sql, timeout=None):
+    """
+    Run ``query_sql`` in the shell and return a dict formatted like the
+    nebula query results: ``{'result': True, 'data': [...]}`` or
+    ``{'result': False, 'error': '...'}``
+    """
+    with self.lock:
+      return self._query(query_sql, timeout)
+
+  def _query(self, query_sql, timeout):
+    query_sql = strip_sql_comments(query_sql).strip()
+    if any(line.strip().startswith('.') for line in query_sql.splitlines()):
+      # shell meta-commands are not queries
+      return {'result': False, 'error': 'refusing to run osqueryi meta-command'}
+    if not query_sql.endswith(';'):
+      query_sql += ';'
+    if timeout is None:
+      timeout = self.timeout
+
+    try:
+      self.start()
+    except Exception as exc:
+      return self._fail('unable to start osqueryi: {0}'.format(exc))
+
+    self._serial += 1
+    token = 'hubble-{0}-{1}-{2}'.format(os.getpid(), self.starts, self._serial)
+    sentinel = "select '{0}' as {1};".format(token, self.sentinel_column)
+    try:
+      self.proc.stdin.write('{0}\n{1}\n'.format(query_sql, sentinel))
+      self.proc.stdin.flush()
+    except Exception as exc:
+      return self._fail('unable to write to osqueryi: {0}'.format(exc))
+
+    deadline = time.time() + timeout
+    lines = []
+    seen_token = False
+    while True:
+      remaining = deadline - time.time()
+      if remaining <= 0:
+        log.error('TIMEOUT during osqueryi session query: %s', query_sql)
+        return self._fail('Timed out after {0}s'.format(timeout))
+      try:
+        line = self._output.get(timeout=remaining)
+      except queue.Empty:
+        continue
+      if line is None:
+        return self._fail('osqueryi exited: {0}'.format(''.join(lines).strip()))
+      lines.append(line)
+      if token in line:
+        seen_token = True
+      if seen_token and line.rstrip().endswith(']'):
+        break
+
+    decoded = []
+    errors = []
+    decoder = json.JSONDecoder()
+    text = ''.join(lines)
+    idx = WHITESPACE.match(text, 0).end()
+    while idx < len(text):
+      try:
+        obj, end = decoder.raw_decode(text, idx)
+        decoded.append(obj)
+      except ValueError:
+        # not json, so it's a message from osqueryi: an error ("Error: near ...")
+        # or a warning (logged, osqueryi still answers the query)
+        end = text.find('\n', idx)
+        end = len(text) if end < 0 else end
+        message = text[idx:end]
+        if message.startswith('Error'):
+          errors.append(message)
+        else:
+          log.warning('osqueryi session query %s: %s', query_sql, message)
+      idx = WHITESPACE.match(text, end).end()
+
+    # the last thing decoded is the sentinel; anything before it is the result
+    if len(decoded) >= 2:
+      return {'result': True, 'data': decoded[-2]}
+    if errors:
+      return {'result': False, 'error': '\n'.join(errors)}
+    return {'result': True, 'data': []}
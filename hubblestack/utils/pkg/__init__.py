@@ -9,11 +9,16 @@ import os
 import re
 
 # Import Salt libs
+import hubblestack.utils.atomicfile
 import hubblestack.utils.data
 import hubblestack.utils.files
+import hubblestack.utils.json
 
 log = logging.getLogger(__name__)
 
+# name -> (db key, contents) of the package databases read by read_db()
+_DB_CACHE = {}
+
 
 def rtag(opts):
     '''
@@ -65,6 +70,74 @@ def check_refresh(opts, refresh=None):
     )
 
 
+def _db_key(db_path):
+    '''
+    Identify the state of the package database file at db_path by its mtime
+    and size. None if it doesn't exist.
+    '''
+    if not db_path:
+        return None
+    try:
+        stat = os.stat(db_path)
+        return [db_path, stat.st_mtime_ns, stat.st_size]
+    except OSError:
+        return None
+
+
+def db_fingerprint():
+    '''
+    Identify the state of the installed dpkg and rpm package databases (see
+    _db_key), or None if there is neither
+    '''
+    import hubblestack.utils.pkg.deb
+    import hubblestack.utils.pkg.rpm
+    keys = [_db_key(hubblestack.utils.pkg.deb.DPKG_STATUS), _db_key(hubblestack.utils.pkg.rpm.rpmdb_path())]
+    if not any(keys):
+        return None
+    return keys
+
+
+def read_db(opts, name, db_path, reader):
+    '''
+    Return reader(), the (json serializable) contents of the package
+    database file at db_path. The contents are cached in memory and in the
+    cachedir for as long as the database file doesn't change, so an
+    unchanged package set is read only once, even across restarts.
+    '''
+    key = _db_key(db_path)
+    if key is None:
+        return reader()
+    if name in _DB_CACHE and _DB_CACHE[name][0] == key:
+        return _DB_CACHE[name][1]
+
+    cache_file = None
+    if opts.get('cachedir'):
+        cache_file = os.path.join(opts['cachedir'], 'pkg_db', '{0}.json'.format(name))
+        try:
+            with hubblestack.utils.files.fopen(cache_file, 'r') as handle:
+                cached = hubblestack.utils.json.load(handle)
+            if cached['key'] == key:
+                _DB_CACHE[name] = (key, cached['data'])
+                return cached['data']
+        except (IOError, OSError, ValueError, KeyError, TypeError):
+            pass
+
+    data = reader()
+    if not data:
+        # don't remember a failed read
+        return data
+    _DB_CACHE[name] = (key, data)
+    if cache_file:
+        try:
+            if not os.path.isdir(os.path.dirname(cache_file)):
+                os.makedirs(os.path.dirname(cache_file))
+            with hubblestack.utils.atomicfile.atomic_open(cache_file, 'w') as handle:
+                hubblestack.utils.json.dump({'key': key, 'data': data}, handle)
+        except (IOError, OSError) as exc:
+            log.warning('Could not cache the %s package database: %s', name, exc)
+    return data
+
+
 def split_comparison(version):
     match = re.match(r'^(<=>|!=|>=|<=|>>|<<|<>|>|<|=)?\s?([^<>=]+)$', version)
     if match:
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+'''
+Common functions for working with deb packages
+'''
+
+# Import python libs
+import logging
+
+import hubblestack.utils.files
+import hubblestack.utils.stringutils
+
+log = logging.getLogger(__name__)
+
+DPKG_STATUS = '/var/lib/dpkg/status'
+
+
+def read_status(path=DPKG_STATUS):
+    '''
+    Read the dpkg status database at path. Returns the packages as lines in
+    the format of ``dpkg-query -W --showformat '${Status} ${Package}
+    ${Version} ${Architecture}\\n'``, e.g.::
+
+        install ok installed zsh 4.3.17-1ubuntu1 amd64
+    '''
+    ret = []
+    fields = {}
+    with hubblestack.utils.files.fopen(path, 'rb') as handle:
+        for line in handle:
+            line = hubblestack.utils.stringutils.to_unicode(line, errors='replace').rstrip('\n')
+            if not line.strip():
+                if fields:
+                    ret.append(_format_status(fields))
+                    fields = {}
+            elif not line[0].isspace() and ':' in line:
+                # continuation lines (starting with a space) belong to
+                # multiline fields, which aren't needed here
+                field, value = line.split(':', 1)
+                if field in ('Package', 'Status', 'Version', 'Architecture'):
+                    fields[field] = value.strip()
+    if fields:
+        ret.append(_format_status(fields))
+    return ret
+
+
+def _format_status(fields):
+    return '{0} {1} {2} {3}'.format(fields.get('Status', ''), fields.get('Package', ''),
+                                    fields.get('Version', ''), fields.get('Architecture', ''))
@@ -7,9 +7,16 @@ Common functions for working with RPM packages
 import collections
 import datetime
 import logging
+import os
 import subprocess
 import hubblestack.utils.stringutils
 
+try:
+    import rpm as rpm_bindings
+    HAS_RPM_BINDINGS = True
+except ImportError:
+    HAS_RPM_BINDINGS = False
+
 log = logging.getLogger(__name__)
 
 # These arches compiled from the rpmUtils.arch python module source
@@ -33,6 +40,39 @@ ARCHES = ARCHES_64 + ARCHES_32 + ARCHES_PPC + ARCHES_S390 + \
 # EPOCHNUM can't be used until RHEL5 is EOL as it is not present
 QUERYFORMAT = '%{NAME}_|-%{EPOCH}_|-%{VERSION}_|-%{RELEASE}_|-%{ARCH}_|-%{REPOID}_|-%{INSTALLTIME}'
 
+# the rpm database moved to /usr/lib/sysimage/rpm on newer distributions
+RPMDB_PATHS = ('/var/lib/rpm', '/usr/lib/sysimage/rpm')
+# the package database file of the sqlite, ndb and bdb backends; the other
+# files there (bdb __db.* regions, sqlite -shm/-wal) change on every read
+RPMDB_FILES = ('rpmdb.sqlite', 'Packages.db', 'Packages')
+
+def rpmdb_path():
+    '''
+    Return the package database file of the rpm database, or None if there
+    is none
+    '''
+    for path in RPMDB_PATHS:
+        for name in RPMDB_FILES:
+            db_file = os.path.join(path, name)
+            if os.path.isfile(db_file):
+                return db_file
+    return None
+
+def read_rpmdb():
+    '''
+    Read the installed packages with the rpm python bindings. Returns them as
+    lines of ``rpm -qa --queryformat QUERYFORMAT``, with (none) as the REPOID.
+    '''
+    ret = []
+    for header in rpm_bindings.TransactionSet().dbMatch():
+        values = [header[tag] for tag in ('name', 'epoch', 'version', 'release', 'arch')]
+        values += [None, header['installtime']]
+        ret.append('_|-'.join('(none)' if value is None else
+                              str(value) if isinstance(value, int) else
+                              hubblestack.utils.stringutils.to_str(value)
+                              for value in values))
+    return ret
+
 def get_osarch():
     '''
     Get the os architecture using rpm --eval
@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+"""
+Cached file parsing for the readfile audit and fdg modules
+
+Parsed files are cached by (path, mtime, size, format, parse options), so
+checks reading the same file only parse it once as long as it's unchanged.
+The cached structures are never handed out: callers get their own copy and
+may modify it.
+"""
+
+import collections
+import functools
+import json
+import logging
+import os
+import re
+import threading
+
+import yaml
+
+log = logging.getLogger(__name__)
+
+YAML_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+MAX_CACHE_ENTRIES = 256
+
+_CACHE = collections.OrderedDict()
+_CACHE_LOCK = threading.Lock()
+
+
+def clear_cache():
+    """
+    Forget all the parsed files
+    """
+    with _CACHE_LOCK:
+        _CACHE.clear()
+
+
+def _copy(data):
+    """
+    Copy parsed data (nested dicts and lists of scalars) for a caller
+    """
+    if isinstance(data, dict):
+        return {key: _copy(val) for key, val in data.items()}
+    if isinstance(data, list):
+        return [_copy(val) for val in data]
+    return data
+
+
+def _cached(path, kind, parse, *options):
+    """
+    Return the cached result of parse() for the file at path, parsing it if
+    the file changed (or was never parsed)
+    """
+    stat = os.stat(path)
+    key = (path, stat.st_mtime_ns, stat.st_size, kind) + options
+    with _CACHE_LOCK:
+        if key in _CACHE:
+            _CACHE.move_to_end(key)
+            return _CACHE[key]
+    ret = parse()
+    with _CACHE_LOCK:
+        _CACHE[key] = ret
+        while len(_CACHE) > MAX_CACHE_ENTRIES:
+            _CACHE.popitem(last=False)
+    return ret
+
+
+def _read(path):
+    with open(path, 'r') as input_file:
+        return input_file.read()
+
+
+def _parse(path, file_format):
+    with open(path, 'r') as input_file:
+        if file_format == 'json':
+            return json.load(input_file)
+        return yaml.load(input_file, Loader=YAML_LOADER)
+
+
+def _read_lines(path):
+    with open(path, 'r') as input_file:
+        return [line.strip() for line in input_file.readlines()]
+
+
+def load(path, file_format):
+    """
+    Return the parsed contents of the json or yaml file at path
+    """
+    if file_format not in ('json', 'yaml'):
+        raise ValueError('unknown format {0}'.format(file_format))
+    return _copy(_cached(path, file_format, functools.partial(_parse, path, file_format)))
+
+
+def read(path):
+    """
+    Return the contents of the file at path
+    """
+    return _cached(path, 'string', functools.partial(_read, path))
+
+
+def read_lines(path):
+    """
+    Return the lines of the file at path, stripped
+    """
+    return list(_cached(path, 'lines', functools.partial(_read_lines, path)))
+
+
+def lines_as_list(path, pattern, ignore_pattern):
+    """
+    Return the (stripped) lines of the file at path, which match pattern and
+    don't match ignore_pattern
+    """
+    if not pattern and not ignore_pattern:
+        return read_lines(path)
+
+    def _parse_lines():
+        return [line for line in _cached(path, 'lines', functools.partial(_read_lines, path))
+                if check_pattern(line, pattern, ignore_pattern)]
+    return list(_cached(path, 'list', _parse_lines, pattern, ignore_pattern))
+
+
+def lines_as_dict(path, pattern, ignore_pattern, dictsep, valsep, subsep):
+    """
+    Return the lines of the file at path (filtered like lines_as_list) as
+    key/value pairs in a dict; see process_line
+    """
+    def _parse_lines():
+        ret = {}
+        found_keys = set()
+        processed_keys = set()
+        for line in _cached(path, 'lines', functools.partial(_read_lines, path)):
+            if not check_pattern(line, pattern, ignore_pattern):
+                continue
+            key, val = process_line(line, dictsep, valsep, subsep)
+            if key in found_keys and key not in processed_keys:
+                # Duplicate keys, make it a list of values underneath
+                # and add to list of values
+                ret[key] = [ret[key]]
+                ret[key].append(val)
+                processed_keys.add(key)
+            elif key in found_keys and key in processed_keys:
+                # Duplicate keys, add to list of values
+                ret[key].append(val)
+            else:
+                # First found, add to dict as normal
+                ret[key] = val
+                found_keys.add(key)
+        return ret
+    return _copy(_cached(path, 'dict', _parse_lines, pattern, ignore_pattern, dictsep, valsep, subsep))
+
+
+@functools.lru_cache(maxsize=512)
+def _compile(pattern):
+    return re.compile(pattern)
+
+
+def check_pattern(line, pattern, ignore_pattern):
+    """
+    Check a given line against both a pattern and an ignore_pattern and return
+    True or False based on whether that line should be used.
+    """
+    keep = False
+
+    if pattern is None:
+        keep = True
+    elif _compile(pattern).match(line):
+        keep = True
+
+    if ignore_pattern is not None and _compile(ignore_pattern).match(line):
+        keep = False
+
+    return keep
+
+
+def process_line(line, dictsep, valsep, subsep):
+    """
+    Process a given line of data using the dictsep, valsep, and subsep
+    provided. For documentation, please see the docstring for ``config()``
+    """
+    if dictsep is None:
+        return line, None
+
+    try:
+        key, val = line.split(dictsep, 1)
+    except (AttributeError, ValueError, TypeError):
+        return line, None
+
+    if valsep is not None:
+        # List of values
+        val = val.split(valsep)
+
+        # List of key-value pairs to form into a dict
+        if subsep is not None:
+            new_val = {}
+            for subval in val:
+                try:
+                    val_key, val_val = subval.split(subsep, 1)
+                except (AttributeError, ValueError, TypeError):
+                    val_key, val_val = subval, None
+                new_val[val_key] = val_val
+            val = new_val
+    elif subsep is not None:
+        # Single key-value pair to form into a dict
+        try:
+            val_key, val_val = val.split(subsep, 1)
+        except (AttributeError, ValueError, TypeError):
+            val_key, val_val = val, None
+        val = {val_key: val_val}
+
+    return key, val
@@ -95,3 +95,26 @@ class TestComparatorMatch(TestCase):
         with pytest.raises(HubbleCheckFailedError) as exception:
             status, result = comparator.run('test', args, module_result, module_status)
             pytest.fail('Should not have come here')
+
+    def test_compile_plan(self):
+        """
+        A compiled plan gives the results of run, looking its command up once
+        """
+        class Comparators(dict):
+            lookups = 0
+
+            def __contains__(self, key):
+                Comparators.lookups += 1
+                return dict.__contains__(self, key)
+
+        comparator.__comparator__ = Comparators({
+            "number.match": lambda audit_id, result, args: (result == args['match'], '')
+        })
+        plan = comparator.compile_plan({"type": "number", "match": 3})
+        self.assertEqual(plan('test', 3), comparator.run('test', {"type": "number", "match": 3}, 3))
+        self.assertEqual(plan('test', {'result': 4}), (False, ''))
+        self.assertFalse(plan('test', {'error': 'failed'}, False)[0])
+        self.assertEqual(Comparators.lookups, 1)
+
+        with pytest.raises(HubbleCheckFailedError):
+            comparator.compile_plan({"type": "number", "unknown_command": 3})('test', 3)
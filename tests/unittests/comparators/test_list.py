@@ -487,3 +487,63 @@ class TestListFilterCompare(TestCase):
             comparator_mock.run.return_value = (False, "Pass")
             status, result = list_comparator.filter_compare("test-1", result_to_compare, args)
             self.assertFalse(status)
+
+
+class TestListIndexByKey(TestCase):
+    """
+    Unit tests for pairing dicts by key in the list comparator, compared with
+    matching every dict with every other
+    """
+
+    def setUp(self):
+        from hubblestack.comparators import dict as dict_comparator
+        from hubblestack.module_runner import comparator
+        self.comparator = comparator
+        self.saved = getattr(comparator, '__comparator__', None)
+        comparator.__comparator__ = {
+            'dict.match': dict_comparator.match,
+            'dict.match_any': dict_comparator.match_any,
+            'dict.match_any_if_keyvalue_matches': dict_comparator.match_any_if_keyvalue_matches,
+        }
+        self.results = [{"name": "svc{0}".format(idx), "running": idx % 2 == 0} for idx in range(40)]
+
+    def tearDown(self):
+        self.comparator.__comparator__ = self.saved
+
+    def _check(self, method, args, expected_status):
+        """
+        Run method on self.results with index_by and without indexing, and
+        check both give expected_status
+        """
+        with patch.object(list_comparator, 'INDEX_MIN_PAIRS', 10 ** 9):
+            status, _ = method("test-1", self.results, args)
+        self.assertEqual(status, expected_status)
+        status, _ = method("test-1", self.results, dict(args, index_by="name"))
+        self.assertEqual(status, expected_status)
+        with patch.object(list_comparator, 'INDEX_MIN_PAIRS', 0):
+            status, _ = method("test-1", self.results, args)
+        self.assertEqual(status, expected_status)
+
+    def test_match_all(self):
+        expected = [{"name": "svc{0}".format(idx), "running": True} for idx in range(0, 40, 2)]
+        self._check(list_comparator.match_all, {"type": "list", "match_all": expected}, True)
+        expected.append({"name": "svc3", "running": True})
+        self._check(list_comparator.match_all, {"type": "list", "match_all": expected}, False)
+        expected[-1] = {"name": "missing", "running": True}
+        self._check(list_comparator.match_all, {"type": "list", "match_all": expected}, False)
+
+    def test_match_any(self):
+        expected = [{"name": "svc{0}".format(idx), "running": True} for idx in range(1, 40, 2)]
+        self._check(list_comparator.match_any, {"type": "list", "match_any": expected}, False)
+        expected.append({"name": "svc39", "running": False})
+        self._check(list_comparator.match_any, {"type": "list", "match_any": expected}, True)
+        expected[-1] = {"running": False}
+        self._check(list_comparator.match_any, {"type": "list", "match_any": expected}, True)
+
+    def test_match_any_if_keyvalue_matches(self):
+        expected = [{"name": "svc{0}".format(idx), "running": False} for idx in range(1, 40, 2)]
+        args = {"type": "list",
+                "match_any_if_keyvalue_matches": {"match_key": "name", "args": expected}}
+        self._check(list_comparator.match_any_if_keyvalue_matches, args, True)
+        expected[:] = [{"name": "svc{0}".format(idx), "running": idx % 2 == 1} for idx in range(40)]
+        self._check(list_comparator.match_any_if_keyvalue_matches, args, False)
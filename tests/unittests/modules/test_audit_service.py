@@ -117,3 +117,31 @@ class TestService(TestCase):
             {"name": "service1", "running": True, "enabled": True},
             {"name": "service2", "running": False, "enabled": True}
             ]})
+
+    def test_execute_unit_states(self):
+        """
+        States come from the unit states snapshot; services missing from it
+        are asked for
+        """
+        def _unit_states():
+            return {"service1.service": {"running": True, "enabled": True},
+                    "service2.timer": {"running": False, "enabled": None}}
+        asked = []
+        def _status(name):
+            asked.append(('status', name))
+            return True
+        def _enabled(name):
+            asked.append(('enabled', name))
+            return False
+        service.__mods__ = {
+            "service.get_all": lambda: ["service1", "service2.timer", "service3"],
+            "service.unit_states": _unit_states,
+            "service.status": _status,
+            "service.enabled": _enabled
+        }
+        status, res = service.execute("test-1", {"args": {"name": "*"}}, {})
+        self.assertEqual(res, {"result": [
+            {"name": "service1", "running": True, "enabled": True},
+            {"name": "service2.timer", "running": False, "enabled": False},
+            {"name": "service3", "running": True, "enabled": False}]})
+        self.assertEqual(asked, [('enabled', 'service2.timer'), ('status', 'service3'), ('enabled', 'service3')])
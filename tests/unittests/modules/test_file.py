@@ -88,6 +88,34 @@ class FileModuleTestCase(TestCase, LoaderModuleMockMixin):
             self.assertEqual(ret["mode"], "0644")
             self.assertEqual(ret["type"], "file")
 
+    def test_stats_from_result(self):
+        """
+        Tests that user and group names are looked up once per run
+        """
+        import hubblestack.module_runner.fact_cache as fact_cache
+
+        uid_to_user = MagicMock(return_value="dummy")
+        gid_to_group = MagicMock(return_value="dummies")
+        with patch.object(filemod, "uid_to_user", uid_to_user), \
+                patch.object(filemod, "gid_to_group", gid_to_group), \
+                patch("os.path.realpath", MagicMock(side_effect=lambda path: path)):
+            with fact_cache.scope():
+                for name in ("/dir/one", "/dir/two"):
+                    ret = filemod.stats_from_result(name, DummyStat(), lstat=DummyStat())
+                    self.assertEqual(ret["user"], "dummy")
+                    self.assertEqual(ret["group"], "dummies")
+                    self.assertEqual(ret["target"], name)
+                    self.assertNotIn("nlink", ret)
+            self.assertEqual(uid_to_user.call_count, 1)
+            self.assertEqual(gid_to_group.call_count, 1)
+            # no run, no caching
+            filemod.stats_from_result("/dir/one", DummyStat(), lstat=DummyStat())
+            self.assertEqual(uid_to_user.call_count, 2)
+
+        ret = filemod.stats(__file__, extended=True)
+        self.assertEqual(ret["nlink"], os.stat(__file__).st_nlink)
+        self.assertEqual(ret["mtime_ns"], os.stat(__file__).st_mtime_ns)
+
 
 class FileBasicsTestCase(TestCase, LoaderModuleMockMixin):
     def setup_loader_modules(self):
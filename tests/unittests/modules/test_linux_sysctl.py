@@ -25,9 +25,30 @@ class LinuxSysctlTestCase(TestCase, LoaderModuleMockMixin):
         Tests the return of get function
         """
         mock_cmd = MagicMock(return_value=1)
-        with patch.dict(linux_sysctl.__mods__, {"cmd.run": mock_cmd}):
+        with patch.dict(linux_sysctl.__mods__, {"cmd.run": mock_cmd}), \
+                patch("hubblestack.modules.linux_sysctl._read_proc_sys", MagicMock(return_value=None)):
             self.assertEqual(linux_sysctl.get("net.ipv4.ip_forward"), 1)
 
+    def test_get_proc_sys(self):
+        """
+        Tests get and get_matching reading /proc/sys
+        """
+        mock_cmd = MagicMock()
+        with patch.dict(linux_sysctl.__mods__, {"cmd.run": mock_cmd}), \
+                patch("hubblestack.utils.files.fopen", mock_open(read_data="32768\t60999\n")) as mock_fopen:
+            self.assertEqual(linux_sysctl.get("net.ipv4.ip_local_port_range"), "32768\t60999")
+            self.assertEqual(linux_sysctl.get("net.ipv4.conf.eth0/1.rp_filter"), "32768\t60999")
+            self.assertEqual(list(mock_fopen.filehandles), ["/proc/sys/net/ipv4/ip_local_port_range",
+                                                            "/proc/sys/net/ipv4/conf/eth0.1/rp_filter"])
+        mock_cmd.assert_not_called()
+
+        with patch("glob.glob", MagicMock(return_value=["/proc/sys/net/ipv4/conf/all/rp_filter",
+                                                        "/proc/sys/net/ipv4/conf/eth0.1/rp_filter"])), \
+                patch("os.path.isfile", MagicMock(return_value=True)), \
+                patch("hubblestack.utils.files.fopen", mock_open(read_data="1\n")):
+            self.assertEqual(linux_sysctl.get_matching("net.ipv4.conf.*.rp_filter"),
+                             {"net.ipv4.conf.all.rp_filter": "1", "net.ipv4.conf.eth0/1.rp_filter": "1"})
+
     def test_assign_proc_sys_failed(self):
         """
         Tests if /proc/sys/<kernel-subsystem> exists or not
@@ -112,3 +112,21 @@ class MatchTestCase(TestCase, LoaderModuleMockMixin):
         self.assertTrue(compound_match.match("L@rest03", {"id": "rest03"}))
         self.assertFalse(compound_match.match("L@rest03"))
         self.assertFalse(compound_match.match("G@bar03"))
+
+    def test_compound_match_results_are_remembered(self):
+        """
+        Test that a compound target is evaluated once per grains generation
+        """
+        grain_match_mock = MagicMock(side_effect=grain_match.match)
+        opts = {"id": MINION_ID, "grains": {"os": "CentOS"}}
+        with patch.dict(MATCHERS_DICT, {"grain_match.match": grain_match_mock}):
+            for _ in range(3):
+                self.assertTrue(compound_match.match("G@os:Cent* and L@bar03", opts))
+                self.assertFalse(compound_match.match("G@os:Ubuntu", opts))
+            self.assertEqual(grain_match_mock.call_count, 2)
+
+            # a grains refresh replaces the grains
+            opts["grains"] = {"os": "Ubuntu"}
+            self.assertFalse(compound_match.match("G@os:Cent* and L@bar03", opts))
+            self.assertTrue(compound_match.match("G@os:Ubuntu", opts))
+            self.assertEqual(grain_match_mock.call_count, 4)
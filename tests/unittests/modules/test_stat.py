@@ -77,3 +77,18 @@ class TestStat(TestCase):
         status, res = stat.execute(check_id, block_dict, {})
         self.assertFalse(status)
         self.assertEqual(res, {"error": "file_not_found"})
+
+    def test_fingerprint(self):
+        """
+        The fingerprint changes with the stats of the file
+        """
+        import os
+        import tempfile
+
+        with tempfile.NamedTemporaryFile() as handle:
+            block_dict = {"args": {"path": handle.name}}
+            fingerprint = stat.get_fingerprint("test-1", block_dict, {})
+            self.assertEqual(fingerprint, stat.get_fingerprint("test-1", block_dict, {}))
+            os.utime(handle.name, ns=(0, 0))
+            self.assertNotEqual(fingerprint, stat.get_fingerprint("test-1", block_dict, {}))
+        self.assertEqual(stat.get_fingerprint("test-1", {"args": {"path": handle.name}}, {})[0], "missing")
@@ -92,4 +92,18 @@ class TestSysctl(TestCase):
 
         status, res = sysctl.execute(check_id, block_dict, {})
         self.assertFalse(status)
-        self.assertEqual(res, {"error": "An error occurred while reading the value of kernel attribute vm.zone_reclaim_mode"})
\ No newline at end of file
+        self.assertEqual(res, {"error": "An error occurred while reading the value of kernel attribute vm.zone_reclaim_mode"})
+    def test_execute_pattern(self):
+        """
+        Query for kernel params matching a pattern
+        """
+        def _get_matching(name):
+            return {"net.ipv4.conf.all.rp_filter": "1", "net.ipv4.conf.lo.rp_filter": "0"}
+        sysctl.__mods__ = {
+            "sysctl.get_matching": _get_matching
+        }
+        block_dict={"args": {"name": "net.ipv4.conf.*.rp_filter"}}
+
+        status, res = sysctl.execute("test-7", block_dict, {})
+        self.assertTrue(status)
+        self.assertEqual(res, {"result": {"net.ipv4.conf.all.rp_filter": "1", "net.ipv4.conf.lo.rp_filter": "0"}})
@@ -112,6 +112,41 @@ class SystemdTestCase(TestCase, LoaderModuleMockMixin):
                     ['bar', 'foo', 'mysql', 'mytimer.timer', 'nginx']
                 )
 
+    def test_unit_states(self):
+        '''
+        Test the states of all units from the unit lists
+        '''
+        mock = MagicMock(side_effect=[
+            {'stdout': _LIST_UNIT_FILES + '\ngetty@.service  enabled  enabled'
+                                          '\nnfs.service  generated  -'
+                                          '\nsshd.service  alias  -',
+             'stderr': '', 'retcode': 0, 'pid': 12345},
+            {'stdout': '''\
+service1.service    loaded    active   running Service 1
+ssh.service         loaded    active   running OpenBSD Secure Shell server
+service2.service    loaded    inactive dead    Service 2
+getty@tty1.service  loaded    active   running Getty on tty1
+* foo.service       not-found failed   failed  foo.service
+nfs.service         loaded    active   exited  LSB: NFS
+legacy.service      loaded    inactive dead    LSB: legacy''',
+             'stderr': '', 'retcode': 0, 'pid': 12345},
+        ])
+        with patch.dict(systemd.__mods__, {'cmd.run_all': mock}), \
+                patch.object(systemd, '_get_sysv_services', MagicMock(return_value=['legacy'])):
+            states = systemd.unit_states()
+        self.assertEqual(states['service1.service'], {'running': True, 'enabled': True})
+        self.assertEqual(states['service2.service'], {'running': False, 'enabled': False})
+        # units that list-units doesn't show (aliases, units not loaded) are left to ``status``
+        self.assertEqual(states['service3.service'], {'running': None, 'enabled': True})
+        self.assertEqual(states['timer2.timer'], {'running': None, 'enabled': False})
+        self.assertEqual(states['ssh.service'], {'running': True, 'enabled': None})
+        self.assertEqual(states['sshd.service']['running'], None)
+        self.assertEqual(states['getty@tty1.service'], {'running': True, 'enabled': None})
+        self.assertEqual(states['foo.service'], {'running': False, 'enabled': None})
+        # generated (sysvinit) units are left to ``enabled``
+        self.assertEqual(states['nfs.service'], {'running': True, 'enabled': None})
+        self.assertEqual(states['legacy.service'], {'running': False, 'enabled': None})
+
     def test_available(self):
         '''
         Test to check that the given service is available
@@ -0,0 +1,150 @@
+"""
+Test the AuditRunner check execution
+"""
+import time
+
+import hubblestack.module_runner.audit_runner as audit_runner
+import hubblestack.module_runner.incremental as incremental
+import hubblestack.module_runner.runner as runner_base
+
+
+def _check(module='grep', expr=None, tag='TAG'):
+    items = [{'args': {'expr': expr}, 'comparator': {'type': 'boolean', 'match': True}}] if expr else [{}]
+    check = {'description': 'test', 'tag': tag,
+             'implementations': [{'filter': {'grains': '*'}, 'module': module, 'items': items}]}
+    return check
+
+
+def _runner(monkeypatch, delays):
+    audit_runner.__mods__ = {'match.compound': lambda target: True}
+    audit_runner.__grains__ = runner_base.__grains__ = {'hubble_version': '4.0.0'}
+    runner = audit_runner.AuditRunner()
+
+    def execute_audit(audit_id, audit_impl, audit_data, verbose, audit_profile, result_list=None, run_config=None):
+        if audit_impl['module'] == 'bexpr':
+            expr = audit_impl['items'][0]['args']['expr']
+            found = dict((result['check_id'], result['check_result']) for result in result_list)
+            status = 'Success' if all(found.get(ref) == 'Success' for ref in expr.split(' AND ')) else 'Failure'
+            return {'check_id': audit_id, 'check_result': status}
+        time.sleep(delays.get(audit_id, 0))
+        return {'check_id': audit_id, 'check_result': 'Success'}
+
+    monkeypatch.setattr(runner, '_execute_audit', execute_audit)
+    monkeypatch.setattr(runner, '_validate_module_params', lambda *args: None)
+    monkeypatch.setattr(runner, '_get_filtered_params_to_log', lambda *args: {})
+    return runner
+
+
+def test_execute_parallel_keeps_order(monkeypatch):
+    delays = {'slow': 0.3, 'fast': 0.2, 'medium': 0.3}
+    runner = _runner(monkeypatch, delays)
+    profile = {
+        'both': _check('bexpr', 'slow AND nested'),
+        'slow': _check(),
+        'nested': _check('bexpr', 'fast AND medium'),
+        'fast': _check(),
+        'old': _check(),
+        'medium': _check(),
+    }
+    profile['old']['implementations'][0]['hubble_version'] = '<1.0'
+    serial = runner._execute(profile, 'profile.yaml', {})
+    t0 = time.time()
+    parallel = runner._execute(profile, 'profile.yaml', {'max_workers': 4})
+    assert time.time() - t0 < 0.6
+    assert parallel == serial
+    assert [result['check_id'] for result in parallel] == ['slow', 'fast', 'old', 'medium', 'both', 'nested']
+    assert [result['check_result'] for result in parallel] == ['Success', 'Success', 'Skipped',
+                                                                'Success', 'Success', 'Success']
+
+
+def test_execute_parallel_timeout(monkeypatch):
+    runner = _runner(monkeypatch, {'stuck': 2})
+    profile = {'stuck': _check(), 'quick': _check()}
+    t0 = time.time()
+    ret = runner._execute(profile, 'profile.yaml', {'max_workers': 2, 'check_timeout': 0.2})
+    assert time.time() - t0 < 1
+    assert [result['check_id'] for result in ret] == ['stuck', 'quick']
+    assert ret[0]['check_result'] == 'Error'
+    assert 'timed out' in ret[0]['failure_reason']
+    assert ret[1]['check_result'] == 'Success'
+
+
+def test_execute_parallel_timeout_frees_workers(monkeypatch):
+    # the hung checks take up all the workers, the next ones still run
+    runner = _runner(monkeypatch, {'stuck1': 3, 'stuck2': 3, 'stuck3': 3})
+    profile = {'stuck1': _check(), 'stuck2': _check(), 'stuck3': _check(), 'quick': _check()}
+    t0 = time.time()
+    ret = runner._execute(profile, 'profile.yaml', {'max_workers': 2, 'check_timeout': 0.2})
+    assert time.time() - t0 < 1
+    assert [result['check_id'] for result in ret] == ['stuck1', 'stuck2', 'stuck3', 'quick']
+    assert [result['check_result'] for result in ret] == ['Error', 'Error', 'Error', 'Success']
+
+
+def test_execute_parallel_timeout_not_stored(monkeypatch):
+    runner = _runner(monkeypatch, {'stuck': 0.5})
+    monkeypatch.setattr(runner, '_get_fingerprint', lambda module, check_id, audit_check: 1)
+    store = incremental.ResultStore(runs=1)
+    profile = {'stuck': _check(), 'quick': _check()}
+    ret = runner._execute(profile, 'profile.yaml', {'max_workers': 2, 'check_timeout': 0.2,
+                                                    'result_store': store})
+    assert [result['check_result'] for result in ret] == ['Error', 'Success']
+    # the abandoned check finishes in the background, but its result is not stored
+    time.sleep(0.5)
+    assert list(store._new) == ['profile|quick']
+
+
+def test_compiled_profile(monkeypatch):
+    runner = _runner(monkeypatch, {})
+    audit_runner.COMPILED_PROFILES.clear()
+    matches = []
+    monkeypatch.setitem(audit_runner.__mods__, 'match.compound', lambda target: matches.append(target) or True)
+    profile = {'one': _check(), 'two': _check()}
+    args = {'profile_digest': 'abc'}
+
+    ret = runner._execute(profile, 'profile.yaml', args)
+    assert [result['check_id'] for result in ret] == ['one', 'two']
+    assert len(matches) == 2
+    assert runner._execute(profile, 'profile.yaml', args) == ret
+    assert len(matches) == 2
+
+    # a grains refresh, another profile digest or other tags need a new compile
+    monkeypatch.setattr(runner_base, 'GRAINS_GENERATION', runner_base.GRAINS_GENERATION + 1)
+    runner._execute(profile, 'profile.yaml', args)
+    assert len(matches) == 4
+    runner._execute(profile, 'profile.yaml', {'profile_digest': 'def'})
+    assert len(matches) == 6
+    assert runner._execute(profile, 'profile.yaml', {'profile_digest': 'def', 'tags': 'NOPE'}) == []
+
+
+def test_incremental(monkeypatch, tmp_path):
+    runner = _runner(monkeypatch, {})
+    executed = []
+    execute_audit = runner._execute_audit
+
+    def counting_execute_audit(audit_id, *args, **kwargs):
+        executed.append(audit_id)
+        return execute_audit(audit_id, *args, **kwargs)
+
+    fingerprints = {'one': 1, 'two': 2, 'three': None}
+    monkeypatch.setattr(runner, '_execute_audit', counting_execute_audit)
+    monkeypatch.setattr(runner, '_get_fingerprint', lambda module, check_id, audit_check: fingerprints[check_id])
+    profile = {'one': _check(), 'two': _check(), 'three': _check(), 'both': _check('bexpr', 'one AND two')}
+    path = str(tmp_path / 'results.json')
+
+    def run():
+        del executed[:]
+        store = incremental.ResultStore.load(path, full_run_every=3)
+        ret = runner._execute(profile, 'profile.yaml', {'result_store': store, 'max_workers': 2})
+        store.save()
+        assert [result['check_id'] for result in ret] == ['one', 'two', 'three', 'both']
+        assert all(result['check_result'] == 'Success' for result in ret)
+        return sorted(executed)
+
+    assert run() == ['both', 'one', 'three', 'two']
+    # unchanged fingerprints reuse the results; no fingerprint, no reuse
+    assert run() == ['both', 'three']
+    fingerprints['two'] = 3
+    assert run() == ['both', 'three', 'two']
+    # full run every 3 runs
+    assert run() == ['both', 'one', 'three', 'two']
+    assert run() == ['both', 'three']
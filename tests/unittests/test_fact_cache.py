@@ -0,0 +1,43 @@
+"""
+Test the run-scoped audit fact cache
+"""
+import hubblestack.module_runner.fact_cache as fact_cache
+
+
+def test_call_outside_scope_is_not_cached():
+    calls = []
+    for _ in range(2):
+        assert fact_cache.call('pkg.list_pkgs', lambda: calls.append(1) or {'bash': '5'}) == {'bash': '5'}
+    assert len(calls) == 2
+    assert fact_cache.current() is None
+
+
+def test_scope():
+    calls = []
+
+    def stats(path):
+        calls.append(path)
+        return {'path': path, 'mode': '0644'}
+
+    with fact_cache.scope() as cache:
+        for _ in range(3):
+            assert fact_cache.call('file.stats', stats, '/etc/passwd')['path'] == '/etc/passwd'
+            fact_cache.call('file.stats', stats, '/etc/shadow')
+        # nested scopes share the outer cache
+        with fact_cache.scope() as nested:
+            assert nested is cache
+            fact_cache.call('file.stats', stats, '/etc/passwd')
+        assert calls == ['/etc/passwd', '/etc/shadow']
+
+        fact_cache.invalidate('file.stats', '/etc/passwd')
+        fact_cache.call('file.stats', stats, '/etc/passwd')
+        fact_cache.call('file.stats', stats, '/etc/shadow')
+        assert calls == ['/etc/passwd', '/etc/shadow', '/etc/passwd']
+
+        fact_cache.invalidate()
+        fact_cache.call('file.stats', stats, '/etc/shadow')
+        assert len(calls) == 4
+
+    assert fact_cache.current() is None
+    assert fact_cache.LAST_STATS['file.stats'] == {'hits': 6, 'misses': 4, 'hit_rate': 0.6}
+    assert fact_cache.LAST_STATS['total']['hits'] == 6
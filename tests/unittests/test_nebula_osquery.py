@@ -1,6 +1,12 @@
 import os
 import json
+import time
+
 import pytest
+import yaml
+
+import hubblestack.module_runner.runner as runner_base
+import hubblestack.modules.nebula_osquery as nebula_osquery
 
 __mods__ = None
 
@@ -15,8 +21,7 @@ def dump_var_file(var, name='var', dumpster='tests/unittests/output'):
 @pytest.mark.usefixtures('osqueryd') # starts osqueryd in the background
 class TestNebula():
     def test___virtual__(self):
-        import hubblestack.modules.nebula_osquery
-        var = hubblestack.modules.nebula_osquery.__virtual__()
+        var = nebula_osquery.__virtual__()
         assert var == 'nebula'
 
     def test_loader(self, __mods__):
@@ -68,3 +73,293 @@ class TestNebula():
         assert 'data' in os_info[0]['os_info']
         assert 'version' in os_info[0]['os_info']['data'][0]
         assert __grains__['os'] in os_info[0]['os_info']['data'][0]['name']
+
+
+def _fake_osqueryi(monkeypatch, config, opts=None):
+    """
+    point nebula_osquery at a pretend osqueryi that sleeps and echos the query;
+    monkeypatch restores the dunders after the test
+    """
+    def run_all(cmd, timeout=None):
+        time.sleep(0.2)
+        return {'retcode': 0, 'stdout': json.dumps([{'sql': cmd[-1]}]), 'stderr': ''}
+
+    def config_get(key, default=None):
+        return config.get(key, default)
+
+    monkeypatch.setattr(nebula_osquery, '__mods__', {'cmd.run_all': run_all, 'config.get': config_get},
+                        raising=False)
+    monkeypatch.setattr(nebula_osquery, '__grains__', {'osquerybinpath': 'osqueryi'}, raising=False)
+    monkeypatch.setattr(nebula_osquery, '__context__', {}, raising=False)
+    monkeypatch.setattr(nebula_osquery, '__opts__', opts or {}, raising=False)
+
+def test_run_osquery_queries_parallel_keeps_order(monkeypatch):
+    _fake_osqueryi(monkeypatch, {'hubblestack:nebula:max_workers': 4})
+    query_data = dict(('q{0}'.format(i), {'query': 'select {0};'.format(i)}) for i in range(8))
+    query_data['bad'] = {'query': 'select * from curl;'}
+
+    t0 = time.time()
+    success, timing, ret = nebula_osquery._run_osquery_queries(query_data, False)
+    elapsed = time.time() - t0
+
+    assert success
+    assert elapsed < 8 * 0.2
+    assert sorted(timing) == ['q{0}'.format(i) for i in range(8)]
+    assert [list(x) for x in ret] == [['q{0}'.format(i)] for i in range(8)]
+    for i, x in enumerate(ret):
+        assert x['q{0}'.format(i)]['data'] == [{'sql': 'select {0};'.format(i)}]
+
+def test_osqueryi_priority_prefix(monkeypatch):
+    _fake_osqueryi(monkeypatch, {'hubblestack:nebula:nice': 10})
+    cmd = nebula_osquery._osqueryi_cmd()
+    assert cmd[1:3] == ['-n', '10']
+    assert cmd[3] == 'osqueryi'
+
+def test_apply_differential(tmp_path, monkeypatch):
+    _fake_osqueryi(monkeypatch, {}, {'cachedir': str(tmp_path)})
+    query_data = {'pkgs': {'query': 'select 1;', 'differential': True,
+                           'differential_ignore': ['_time']},
+                  'other': {'query': 'select 2;'}}
+
+    def run(pkgs, time_col='t1'):
+        ret = [{'pkgs': {'result': True, 'data': [dict(name=p, _time=time_col) for p in pkgs]}},
+               {'other': {'result': True, 'data': [{'x': 1}]}}]
+        ret = nebula_osquery._apply_differential(ret, query_data, 'day')
+        assert ret[1]['other']['data'] == [{'x': 1}]
+        return sorted((row['_action'], row['name']) for row in ret[0]['pkgs']['data'])
+
+    assert run(['a', 'b']) == [('snapshot', 'a'), ('snapshot', 'b')]
+    assert run(['a', 'b'], 't2') == []
+    assert run(['a', 'c']) == [('added', 'c'), ('removed', 'b')]
+    # identical rows are counted
+    assert run(['a', 'a', 'c'], 't3') == [('added', 'a')]
+    assert run(['c']) == [('removed', 'a'), ('removed', 'a')]
+    query_data['pkgs']['snapshot_interval'] = 0
+    assert run(['a', 'c', 'c']) == [('snapshot', 'a'), ('snapshot', 'c'), ('snapshot', 'c')]
+
+def test_osqueryd_log_parser_chunks(tmp_path, monkeypatch):
+    _fake_osqueryi(monkeypatch, {}, {'cachedir': str(tmp_path / 'cache')})
+    logdir = tmp_path / 'logs'
+    logdir.mkdir()
+    logfile = logdir / 'osqueryd.results.log'
+    events = [json.dumps({'name': 'q', 'action': 'added', 'columns': {'n': str(i)}}) for i in range(5)]
+    logfile.write_text('\n'.join(events) + '\n{"name": "partial')
+
+    chunks = nebula_osquery.osqueryd_log_parser(osqueryd_logdir=str(logdir),
+                                                backuplogdir=str(tmp_path / 'backup'),
+                                                logfilethresholdinbytes=10 ** 6,
+                                                chunk_size=2)
+    first = next(chunks)
+    assert [e['columns']['n'] for e in first] == ['0', '1']
+    # the offset is only stored once the chunk has been handed off
+    assert nebula_osquery._get_file_offset(str(logfile)) == 0
+    rest = list(chunks)
+    assert [[e['columns']['n'] for e in chunk] for chunk in rest] == [['2', '3'], ['4']]
+    offset = nebula_osquery._get_file_offset(str(logfile))
+    assert offset == len('\n'.join(events)) + 1
+
+    with open(str(logfile), 'a') as fh:
+        fh.write('", "action": "added", "columns": {"n": "5"}}\n')
+    chunks = nebula_osquery.osqueryd_log_parser(osqueryd_logdir=str(logdir),
+                                                backuplogdir=str(tmp_path / 'backup'),
+                                                logfilethresholdinbytes=10 ** 6,
+                                                chunk_size=2)
+    assert [[e['columns']['n'] for e in chunk] for chunk in chunks] == [['5']]
+
+def test_osqueryd_log_parser_tail(tmp_path, monkeypatch):
+    if not nebula_osquery.HAS_PYINOTIFY:
+        pytest.skip('requires pyinotify')
+    _fake_osqueryi(monkeypatch, {}, {'cachedir': str(tmp_path / 'cache')})
+    logdir = tmp_path / 'logs'
+    logdir.mkdir()
+    logfile = logdir / 'osqueryd.results.log'
+
+    def event(n):
+        # long enough for the stored offset to be past the CRC_BYTES of _get_file_offset
+        return json.dumps({'name': 'q', 'action': 'added', 'columns': {'n': str(n), 'pad': 'x' * 100}}) + '\n'
+
+    def parse():
+        ret = nebula_osquery.osqueryd_log_parser(osqueryd_logdir=str(logdir),
+                                                 backuplogdir=str(tmp_path / 'backup'),
+                                                 logfilethresholdinbytes=10 ** 6,
+                                                 tail=True, checkpoint_interval=3600)
+        return [e['columns']['n'] for e in ret]
+
+    logfile.write_text(event(0) + event(1))
+    assert parse() == ['0', '1']
+    assert parse() == []
+    with open(str(logfile), 'a') as fh:
+        fh.write(event(2))
+    assert parse() == ['2']
+    # offsets are only stored on checkpoints
+    assert nebula_osquery._get_file_offset(str(logfile)) == 0
+    nebula_osquery.__context__['nebula.osqueryd_log_tail'].checkpoint()
+    assert nebula_osquery._get_file_offset(str(logfile)) == len(event(0)) * 3
+
+    # rotated by someone else
+    logfile.rename(logdir / 'osqueryd.results.log.1')
+    logfile.write_text(event(3))
+    assert parse() == ['3']
+    nebula_osquery.__context__['nebula.osqueryd_log_tail'].stop()
+
+def test_mask_object(tmp_path, monkeypatch):
+    _fake_osqueryi(monkeypatch, {})
+    top = tmp_path / 'top.mask'
+    top.write_text(yaml.safe_dump({'nebula': [{'*': ['mask']}]}))
+    mask = tmp_path / 'mask.yaml'
+    mask.write_text(yaml.safe_dump({
+        'mask_with': 'MASKED',
+        'blacklisted_objects': [{'query_names': ['running_procs'], 'column': 'environment',
+                                 'attribute_to_check': 'variable_name',
+                                 'attributes_to_mask': ['value'],
+                                 'enable_global_masking': True,
+                                 'blacklisted_patterns': ['*PASSWORD*', 'SECRET']}]}))
+    files = {'salt://top.mask': str(top), 'salt://hubblestack_nebula_v2/mask.yaml': str(mask)}
+    nebula_osquery.__mods__.update({'cp.cache_file': files.get, 'match.compound': lambda tgt: True})
+
+    def procs():
+        return [{'running_procs': {'result': True, 'data': [
+                    {'pid': '1', 'environment': [{'variable_name': 'DB_PASSWORD', 'value': 'x'},
+                                                 {'variable_name': 'SECRET', 'value': 'y'},
+                                                 {'variable_name': 'HOME', 'value': '/root'}]}]}},
+                {'other': {'result': True, 'data': [
+                    {'environment': [{'variable_name': 'SECRET', 'value': 'z'}]}]}},
+                {'name': 'running_procs', 'action': 'added',
+                 'columns': {'environment': [{'variable_name': 'SECRET', 'value': 'z'}]}}]
+
+    for globbing, masked in ((True, ['MASKED', 'MASKED', '/root']), (False, ['x', 'MASKED', '/root'])):
+        monkeypatch.setattr(nebula_osquery, '__opts__', {'enable_globbing_in_nebula_masking': globbing})
+        ret = procs()
+        assert nebula_osquery._mask_object(ret, 'salt://top.mask')
+        env = ret[0]['running_procs']['data'][0]['environment']
+        assert [e['value'] for e in env] == masked
+        assert ret[1]['other']['data'][0]['environment'][0]['value'] == 'z'
+        assert ret[2]['columns']['environment'][0]['value'] == 'MASKED'
+    # the mask file was parsed once
+    assert nebula_osquery.__context__['nebula.mask_data'][0][0][0] == str(mask)
+
+def test_get_query_data_cache(tmp_path, monkeypatch):
+    _fake_osqueryi(monkeypatch, {})
+    queries = tmp_path / 'queries.yaml'
+    queries.write_text(yaml.safe_dump({'day': {'os_info': {'query': 'select * from os_version;'}}}))
+    extra = tmp_path / 'extra.yaml'
+    extra.write_text(yaml.safe_dump({'day': {'uptime': {'query': 'select * from uptime;'}}}))
+    files = [str(queries), str(extra)]
+
+    first = nebula_osquery._get_query_data(files)
+    assert sorted(first['day']) == ['os_info', 'uptime']
+    first['day']['os_info']['query_name'] = 'os_info'
+    # callers get their own copy of the cached data
+    assert nebula_osquery._get_query_data(files) == {'day': {'os_info': {'query': 'select * from os_version;'},
+                                                             'uptime': {'query': 'select * from uptime;'}}}
+
+    extra.write_text(yaml.safe_dump({'day': {'uptime': {'query': 'select total_seconds from uptime;'}}}))
+    assert nebula_osquery._get_query_data(files)['day']['uptime']['query'] == 'select total_seconds from uptime;'
+
+def test_profile(tmp_path, monkeypatch):
+    _fake_osqueryi(monkeypatch, {'hubblestack:nebula:profile_window': 3}, {'cachedir': str(tmp_path)})
+    query_data = {'cheap': {'query': 'select 1;'}, 'pricey': {'query': 'select 2;'}}
+
+    costs = {}
+    nebula_osquery._run_osquery_queries(query_data, False, costs=costs)
+    assert sorted(costs) == ['cheap', 'pricey']
+    assert costs['cheap']['rows'] == 1
+    assert costs['cheap']['bytes'] == len(json.dumps([{'sql': 'select 1;'}]))
+    assert costs['cheap']['wall'] >= 0.2
+    assert 'cpu' in costs['cheap']
+    assert 'max_rss' not in costs['cheap']
+
+    # the cpu time of the children can't be told apart when queries run in parallel
+    _fake_osqueryi(monkeypatch, {'hubblestack:nebula:max_workers': 2}, {'cachedir': str(tmp_path)})
+    parallel_costs = {}
+    nebula_osquery._run_osquery_queries(query_data, False, costs=parallel_costs)
+    assert sorted(parallel_costs) == ['cheap', 'pricey']
+    assert 'cpu' not in parallel_costs['cheap']
+    _fake_osqueryi(monkeypatch, {'hubblestack:nebula:profile_window': 3}, {'cachedir': str(tmp_path)})
+
+    for wall in (1, 2, 3, 4):
+        profile_data = nebula_osquery._load_profile()
+        nebula_osquery._record_profile(profile_data, {
+            'cheap': dict(costs['cheap'], wall=0.1),
+            'pricey': dict(costs['pricey'], wall=wall * 10)})
+    profile_data = nebula_osquery._load_profile()
+    assert [s['wall'] for s in profile_data['queries']['pricey']] == [20, 30, 40]
+
+    ret = nebula_osquery.profile(sort_by='wall', budget={'wall': 25})
+    assert [q['query_name'] for q in ret['queries']] == ['pricey', 'cheap']
+    assert ret['queries'][0]['wall']['p50'] == 30
+    assert ret['over_budget'] == ['pricey']
+    assert ret['disabled'] == {}
+
+    ret = nebula_osquery.profile(budget={'wall': 25}, disable=True)
+    assert list(ret['disabled']) == ['pricey']
+    assert list(nebula_osquery._load_profile()['disabled']) == ['pricey']
+    ret = nebula_osquery.profile(enable='*')
+    assert ret['disabled'] == {}
+    assert [q['query_name'] for q in ret['queries']] == ['cheap']
+
+    # the samples that got it disabled don't disable it again after its next run
+    _fake_osqueryi(monkeypatch, {'hubblestack:nebula:profile_window': 3,
+                                 'hubblestack:nebula:profile_auto_disable': True,
+                                 'hubblestack:nebula:profile_budget': {'wall': 25}},
+                   {'cachedir': str(tmp_path)})
+    profile_data = nebula_osquery._load_profile()
+    nebula_osquery._record_profile(profile_data, {'pricey': dict(costs['pricey'], wall=5)})
+    assert nebula_osquery._load_profile()['disabled'] == {}
+    assert [s['wall'] for s in nebula_osquery._load_profile()['queries']['pricey']] == [5]
+
+def test_generate_osquery_conf_file_unchanged(tmp_path, monkeypatch):
+    _fake_osqueryi(monkeypatch, {}, {'cachedir': str(tmp_path / 'cache')})
+    os.makedirs(str(tmp_path / 'cache' / 'files' / 'base' / 'hubblestack_nebula_v2'))
+    top = tmp_path / 'top.osqueryconf'
+    top.write_text(yaml.safe_dump({'nebula': [{'*': ['osquery']}]}))
+    conf = tmp_path / 'osquery.yaml'
+    conf.write_text(yaml.safe_dump({'options': {'host_identifier': 'hostname'}}))
+    cached = {str(top): str(top), 'salt://hubblestack_nebula_v2/osquery.yaml': str(conf)}
+    fetched = []
+    nebula_osquery.__mods__['cp.cache_file'] = lambda path: fetched.append(path) or cached.get(path)
+    nebula_osquery.__mods__['match.compound'] = lambda match: True
+
+    loads = []
+    load_osquery_sources = nebula_osquery._load_osquery_sources
+    monkeypatch.setattr(nebula_osquery, '_load_osquery_sources',
+                        lambda sources: loads.append(sources) or load_osquery_sources(sources))
+
+    configfile = nebula_osquery._generate_osquery_conf_file(str(top))
+    assert json.load(open(configfile)) == {'options': {'host_identifier': 'hostname'}}
+    assert len(fetched) == 2
+    # unchanged cached files: nothing is fetched, matched or loaded again
+    assert nebula_osquery._generate_osquery_conf_file(str(top)) == configfile
+    assert len(loads) == 1
+    assert len(fetched) == 2
+
+    conf.write_text(yaml.safe_dump({'options': {'host_identifier': 'uuid'}}))
+    nebula_osquery._generate_osquery_conf_file(str(top))
+    assert len(loads) == 2
+    assert len(fetched) == 4
+    assert json.load(open(configfile)) == {'options': {'host_identifier': 'uuid'}}
+
+    # grains refreshes and fileserver updates fetch the files again
+    monkeypatch.setattr(runner_base, 'GRAINS_GENERATION', runner_base.GRAINS_GENERATION + 1)
+    nebula_osquery.__opts__['fileserver_update_frequency'] = 0
+    nebula_osquery._generate_osquery_conf_file(str(top))
+    assert len(fetched) == 6
+    nebula_osquery._generate_osquery_conf_file(str(top))
+    assert len(fetched) == 8
+    assert len(loads) == 2
+
+def test_osqueryd_running_status_cached(tmp_path, monkeypatch):
+    _fake_osqueryi(monkeypatch, {})
+    pidfile = tmp_path / 'hubble_osqueryd.pidfile'
+    pidfile.write_text('{0}\n'.format(os.getpid()))
+    checks = []
+    monkeypatch.setattr(nebula_osquery, '_check_osqueryd_running_status',
+                        lambda pidfile: checks.append(pidfile) or True)
+
+    assert nebula_osquery._osqueryd_running_status(str(pidfile))
+    assert nebula_osquery._osqueryd_running_status(str(pidfile))
+    assert len(checks) == 1
+
+    pidfile.write_text('{0}\n'.format(os.getppid()))
+    assert nebula_osquery._osqueryd_running_status(str(pidfile))
+    assert len(checks) == 2
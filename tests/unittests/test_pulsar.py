@@ -86,6 +86,16 @@ class TestPulsar(object):
         assert len(var) == 0
         assert isinstance(var, list)
 
+    def test_delta_t_as_dict(self):
+        dt = pulsar.delta_t()
+        dt.mark('read_config')
+        dt.fin()
+        dt.mark('check_events')
+        dt.fin()
+        res = dt.as_dict()
+        assert set(res) == set(['top', 'read_config', 'check_events'])
+        assert res['top'] >= res['read_config'] + res['check_events']
+
     def test_top_result_for_list(self):
         topfile = 'tests/unittests/resources/top.pulsar'
 
@@ -288,6 +298,7 @@ class TestPulsar2(object):
         assert len(self.events) == 2
         assert self.events[0].startswith('IN_CREATE')
         assert self.events[1].startswith('IN_MODIFY')
+        assert 'check_events' in pulsar.__context__['pulsar.delta_t'].as_dict()
 
         if modality in ('watch_files', 'watch_new_files'):
             assert len(self.watch_manager.watch_db) == 2
@@ -0,0 +1,56 @@
+"""
+Test the pulsar-to-splunk returner event building
+"""
+
+import hubblestack.returners.splunk_pulsar_return as splunk_pulsar_return
+
+
+def _alert(path, change='IN_MODIFY'):
+    return {'change': change, 'path': path, 'tag': '/tmp', 'name': path.split('/')[-1],
+            'pulsar_config': 'test.yaml'}
+
+
+def test_dedup_list_keeps_last_occurrence():
+    a, b, c = {'x': [1, {'y': 2}]}, {'x': 2}, {'x': 3}
+    assert splunk_pulsar_return._dedup_list([a, b, dict(a), c, b]) == [a, c, b]
+    assert splunk_pulsar_return._dedup_list([]) == []
+
+
+def test_build_events_skips_ignored():
+    alerts = [_alert('/tmp/a'), _alert('/tmp/b', 'IN_IGNORED'), _alert('/tmp/c', 'IN_CREATE|IN_ISDIR'),
+              _alert('/tmp/d', 'IN_NONSENSE')]
+    events = splunk_pulsar_return._build_events(alerts)
+    assert [e['object_path'] for e in events] == ['/tmp/a', '/tmp/c', '/tmp/d']
+    assert [e['action'] for e in events] == ['modified', 'created', 'unknown']
+    assert events[1]['object_category'] == 'directory'
+
+
+def test_build_payloads():
+    def config_get(key, default=None):
+        return {'site': 'moon', 'empty': ''}.get(key, default)
+
+    splunk_pulsar_return.__mods__ = {'config.get': config_get}
+    splunk_pulsar_return.__grains__ = {'system_uuid': 'uuid'}
+    host_args = {'minion_id': 'id', 'fqdn': 'host.tld', 'fqdn_ip4': '10.0.0.1', 'local_fqdn': 'host'}
+    opts = {'index': 'idx', 'sourcetype': 'hubble_fim', 'custom_fields': ['site', 'empty']}
+    events = splunk_pulsar_return._build_events([_alert('/tmp/a'), _alert('/tmp/b')])
+
+    payloads = splunk_pulsar_return._build_payloads(events, opts, host_args, {'cloud': 'c'}, ['dest_ip'])
+    assert len(payloads) == 2
+    for payload in payloads:
+        assert payload['index'] == 'idx'
+        assert payload['host'] == 'host.tld'
+        assert payload['fields'] == {'meta_dest_ip': '10.0.0.1'}
+        assert payload['event']['custom_site'] == 'moon'
+        assert payload['event']['cloud'] == 'c'
+        assert 'custom_empty' not in payload['event']
+    # the shared events are not modified by building payloads
+    assert 'minion_id' not in events[0]
+
+
+def test_returner_logs_malformed_alerts(monkeypatch):
+    monkeypatch.setattr(splunk_pulsar_return, '__grains__', {}, raising=False)
+    monkeypatch.setattr(splunk_pulsar_return, '_build_args', lambda ret: {})
+    monkeypatch.setattr(splunk_pulsar_return, '_build_alerts', lambda data: [{'change': None}])
+    # logged, not raised to the caller
+    assert splunk_pulsar_return.returner({'return': [{'change': None}]}) is None
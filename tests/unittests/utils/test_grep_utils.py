@@ -0,0 +1,81 @@
+"""
+Test the in-process grep against the grep command
+"""
+
+import shutil
+import subprocess
+
+import pytest
+
+import hubblestack.utils.grep as native_grep
+
+SSHD_CONFIG = '''\
+# sample sshd_config
+Protocol 2
+PermitRootLogin no
+#PermitRootLogin yes
+MaxAuthTries  4
+Ciphers aes256-ctr,aes192-ctr
+ClientAliveInterval 300\r
+  LogLevel INFO
+AllowUsers root admin[1]
+banner /etc/issue.net
+a+b (c) {2} $HOME ^caret
+'''
+
+CASES = [
+    ('^PermitRootLogin', []),
+    ('^PermitRootLogin no$', []),
+    ('permitrootlogin', ['-i']),
+    ('^#', ['-v']),
+    ('^MaxAuthTries[[:space:]]\\+[0-9]', []),
+    ('^MaxAuthTries\\s+[0-9]{1,2}$', ['-E']),
+    ('aes(128|256)-ctr', ['-E']),
+    ('aes\\(128\\|192\\)-ctr', []),
+    ('a+b', []),
+    ('a+b', ['-E']),
+    ('a+b', ['-F']),
+    ('(c) {2} $HOME ^', []),
+    ('admin[1]', ['-F']),
+    ('[^:#]*Interval', []),
+    ('\\<INFO\\>', []),
+    ('Login', ['-w']),
+    ('LogLevel', ['-w']),
+    ('Protocol 2', ['-x']),
+    ('protocol', ['-c', '-i']),
+    ('^P', ['-n']),
+    ('Protocol', ['-q']),
+    ('nomatch', []),
+    ('Protocol\nbanner', []),
+    ('*PermitRoot', []),
+    ('300.$', []),
+]
+
+
+@pytest.mark.skipif(not shutil.which('grep'), reason='needs the grep command')
+@pytest.mark.parametrize('pattern,flags', CASES)
+def test_grep_like_grep(tmp_path, pattern, flags):
+    path = tmp_path / 'sshd_config'
+    path.write_bytes(SSHD_CONFIG.encode('utf-8'))
+    proc = subprocess.run(['grep'] + flags + [pattern, str(path)], stdout=subprocess.PIPE)
+    expected = {'retcode': proc.returncode, 'stdout': proc.stdout.decode('utf-8').rstrip(), 'stderr': ''}
+
+    assert native_grep.grep(native_grep.read_lines(str(path)), pattern, *flags) == expected
+    assert native_grep.grep(native_grep.split_lines(SSHD_CONFIG), pattern, *flags) == expected
+
+
+def test_grep_unsupported(tmp_path):
+    lines = native_grep.split_lines(SSHD_CONFIG)
+    assert native_grep.grep(lines, 'Protocol', '-A2') is None
+    assert native_grep.grep(lines, '\\d+', '-E') is None
+    assert native_grep.grep(lines, '[[:nope:]]') is None
+    assert native_grep.grep(lines, '(?i)x', '-E') is None
+    assert native_grep.grep(None, 'Protocol') is None
+
+    binary = tmp_path / 'binary'
+    binary.write_bytes(b'Protocol\0 2\n')
+    assert native_grep.read_lines(str(binary)) is None
+    assert native_grep.read_lines(str(tmp_path / 'missing')) is None
+    empty = tmp_path / 'empty'
+    empty.write_bytes(b'')
+    assert native_grep.grep(native_grep.read_lines(str(empty)), 'x') == {'retcode': 1, 'stdout': '', 'stderr': ''}
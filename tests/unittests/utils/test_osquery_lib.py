@@ -0,0 +1,175 @@
+"""
+Test the osquery result cache and the persistent osqueryi session
+"""
+
+import sys
+import stat
+import time
+import textwrap
+import threading
+
+import pytest
+
+import hubblestack.utils.osquery_lib as osquery_lib
+from hubblestack.utils.osquery_lib import OsqueryiSession
+
+# a stand-in for "osqueryi --json": reads statements (up to a line ending
+# with ';') from stdin and answers "select '<x>' as <col>;" with pretty
+# printed json, "sleep;" by sleeping, "select * from warned;" with just a
+# warning and anything else with an error message
+FAKE_OSQUERYI = textwrap.dedent('''\
+    import re, sys, json, time
+    statement = ''
+    for line in sys.stdin:
+        statement += line
+        if not statement.strip().endswith(';'):
+            continue
+        line, statement = statement.strip(), ''
+        mat = re.match(r"select '(.*)'\\s+as\\s+(\\w+)\\s*;$", line, re.S)
+        if line == 'select * from empty;':
+            continue
+        if line == 'select * from warned;':
+            print('W1018 12:00:00.000000 1234 virtual_table.cpp:101] Table warned is event-based but events are disabled')
+            sys.stdout.flush()
+            continue
+        if line == 'sleep;':
+            time.sleep(5)
+            continue
+        if mat:
+            print(json.dumps([{mat.group(2): mat.group(1)}], indent=2))
+        else:
+            print('Error: near "%s": syntax error' % line)
+        sys.stdout.flush()
+    ''')
+
+
+
+@pytest.fixture
+def session(tmp_path):
+    script = tmp_path / 'osqueryi'
+    script.write_text(FAKE_OSQUERYI)
+    script.chmod(script.stat().st_mode | stat.S_IXUSR)
+    sess = OsqueryiSession([sys.executable, str(script)], timeout=10)
+    yield sess
+    sess.stop()
+
+
+def test_session_query(session):
+    ret = session.query("select 'a' as x")
+    assert ret == {'result': True, 'data': [{'x': 'a'}]}
+    pid = session.proc.pid
+    ret = session.query("select 'b' as y;")
+    assert ret == {'result': True, 'data': [{'y': 'b'}]}
+    # same shell answered both queries
+    assert session.proc.pid == pid
+    assert session.starts == 1
+
+
+def test_session_multiline_query(session):
+    # the comment must not swallow the rest of the query, nor the line
+    # break in the string
+    ret = session.query("select 'a\nb' -- the column\n as x\n/* the end */;")
+    assert ret == {'result': True, 'data': [{'x': 'a\nb'}]}
+    ret = session.query("select '--' as x; -- trailing comment")
+    assert ret == {'result': True, 'data': [{'x': '--'}]}
+
+
+def test_session_empty_and_error(session):
+    assert session.query('select * from empty;') == {'result': True, 'data': []}
+    ret = session.query('select nonsense')
+    assert ret['result'] is False
+    assert 'syntax error' in ret['error']
+    assert session.alive
+    # osqueryi warnings don't fail a query without rows
+    assert session.query('select * from warned;') == {'result': True, 'data': []}
+
+
+def test_session_refuses_meta_commands(session):
+    ret = session.query('.shell rm -rf /')
+    assert ret['result'] is False
+    assert session.proc is None
+    ret = session.query("select 'a' as x;\n  .mode csv\n")
+    assert ret['result'] is False
+    assert session.proc is None
+
+
+def test_session_timeout_restarts(session):
+    ret = session.query('sleep;', timeout=0.5)
+    assert ret['result'] is False
+    assert 'Timed out' in ret['error']
+    assert session.proc is None
+    ret = session.query("select 'c' as z;")
+    assert ret == {'result': True, 'data': [{'z': 'c'}]}
+    assert session.starts == 2
+
+
+class FakeRunAll(object):
+    """ counts the osqueryi runs; the query's stdout is the query itself """
+
+    def __init__(self, delay=0, retcode=0):
+        self.calls = 0
+        self.delay = delay
+        self.retcode = retcode
+        self.lock = threading.Lock()
+
+    def __call__(self, cmd, timeout=None, python_shell=False):
+        with self.lock:
+            self.calls += 1
+        time.sleep(self.delay)
+        return {'retcode': self.retcode, 'stdout': cmd[-1], 'stderr': ''}
+
+
+@pytest.fixture
+def clear_cache():
+    osquery_lib.clear_cache()
+    yield
+    osquery_lib.clear_cache()
+
+
+def test_normalize_sql():
+    assert osquery_lib.normalize_sql('select  *\n  from processes ;') == 'select * from processes'
+    assert osquery_lib.normalize_sql("select 'a  b' as x;") == "select 'a  b' as x"
+
+
+def test_run_all_cached(clear_cache):
+    run_all = FakeRunAll()
+    for sql in ('select * from processes;', 'select *  from processes'):
+        res = osquery_lib.run_all_cached(['osqueryi', '--json', sql], sql, run_all=run_all,
+                                         ttl=60, timeout=10)
+        assert res['stdout'] == 'select * from processes;'
+    assert run_all.calls == 1
+
+    # different commands aren't shared
+    osquery_lib.run_all_cached(['osqueryi', '--json', '--read_max', '1', 'select 1'], 'select 1',
+                               run_all=run_all, ttl=60)
+    assert run_all.calls == 2
+
+    # no ttl, no cache
+    osquery_lib.run_all_cached(['osqueryi', 'select 1'], 'select 1', run_all=run_all, ttl=0)
+    osquery_lib.run_all_cached(['osqueryi', 'select 1'], 'select 1', run_all=run_all, ttl=0)
+    assert run_all.calls == 4
+
+
+def test_run_all_cached_failures_are_not_cached(clear_cache):
+    run_all = FakeRunAll(retcode=1)
+    for _ in range(2):
+        res = osquery_lib.run_all_cached(['osqueryi', 'select 1'], 'select 1', run_all=run_all, ttl=60)
+        assert res['retcode'] == 1
+    assert run_all.calls == 2
+
+
+def test_run_all_cached_single_flight(clear_cache):
+    run_all = FakeRunAll(delay=0.3)
+    results = []
+
+    def worker():
+        results.append(osquery_lib.run_all_cached(['osqueryi', 'select 1'], 'select 1',
+                                                  run_all=run_all, ttl=60))
+
+    threads = [threading.Thread(target=worker) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert run_all.calls == 1
+    assert [r['stdout'] for r in results] == ['select 1'] * 5
@@ -0,0 +1,81 @@
+"""
+Test reading package databases directly, and caching what was read
+"""
+
+import os
+
+import hubblestack.utils.pkg
+import hubblestack.utils.pkg.deb
+import hubblestack.utils.pkg.rpm
+
+DPKG_STATUS = """Package: zsh
+Status: install ok installed
+Priority: optional
+Version: 4.3.17-1ubuntu1
+Architecture: amd64
+Description: shell with lots of features
+ Zsh is a UNIX command interpreter (shell)
+ .
+ Version: not a field
+
+Package: mc
+Status: deinstall ok config-files
+Architecture: amd64
+Version: 3:4.8.1-2ubuntu1
+
+Package: gone
+Status: unknown ok not-installed
+Architecture: all
+"""
+
+
+def test_read_status(tmp_path):
+    path = tmp_path / 'status'
+    path.write_text(DPKG_STATUS)
+    assert hubblestack.utils.pkg.deb.read_status(str(path)) == [
+        'install ok installed zsh 4.3.17-1ubuntu1 amd64',
+        'deinstall ok config-files mc 3:4.8.1-2ubuntu1 amd64',
+        'unknown ok not-installed gone  all']
+
+
+def test_read_db_cached(tmp_path):
+    db_path = tmp_path / 'Packages'
+    db_path.write_text('one')
+    opts = {'cachedir': str(tmp_path / 'cache')}
+    reads = []
+
+    def _reader():
+        reads.append(1)
+        return ['pkg_|-{0}'.format(len(reads))]
+
+    assert hubblestack.utils.pkg.read_db(opts, 'test', str(db_path), _reader) == ['pkg_|-1']
+    assert hubblestack.utils.pkg.read_db(opts, 'test', str(db_path), _reader) == ['pkg_|-1']
+    assert os.path.isfile(os.path.join(opts['cachedir'], 'pkg_db', 'test.json'))
+    # a new process reads the cache file
+    hubblestack.utils.pkg._DB_CACHE.clear()
+    assert hubblestack.utils.pkg.read_db(opts, 'test', str(db_path), _reader) == ['pkg_|-1']
+    assert len(reads) == 1
+
+    db_path.write_text('one and two')
+    assert hubblestack.utils.pkg.read_db(opts, 'test', str(db_path), _reader) == ['pkg_|-2']
+    # no database, no caching
+    assert hubblestack.utils.pkg.read_db(opts, 'test', str(tmp_path / 'missing'), _reader) == ['pkg_|-3']
+    assert hubblestack.utils.pkg.read_db(opts, 'test', str(tmp_path / 'missing'), _reader) == ['pkg_|-4']
+
+
+def test_rpmdb_path(tmp_path, monkeypatch):
+    old, new = tmp_path / 'var', tmp_path / 'usr'
+    old.mkdir()
+    new.mkdir()
+    monkeypatch.setattr(hubblestack.utils.pkg.rpm, 'RPMDB_PATHS', (str(old), str(new)))
+    assert hubblestack.utils.pkg.rpm.rpmdb_path() is None
+    for name in ('Packages', '__db.001', '__db.002'):
+        (new / name).write_text('bdb')
+    assert hubblestack.utils.pkg.rpm.rpmdb_path() == str(new / 'Packages')
+    # the region files change on every read, the key of the database doesn't
+    key = hubblestack.utils.pkg._db_key(hubblestack.utils.pkg.rpm.rpmdb_path())
+    (new / '__db.001').write_text('read again')
+    assert hubblestack.utils.pkg._db_key(hubblestack.utils.pkg.rpm.rpmdb_path()) == key
+    for name in ('rpmdb.sqlite', 'rpmdb.sqlite-shm', 'rpmdb.sqlite-wal'):
+        (old / name).write_text('sqlite')
+    assert hubblestack.utils.pkg.rpm.rpmdb_path() == str(old / 'rpmdb.sqlite')
@@ -0,0 +1,47 @@
+"""
+Test the cached file parsing of the readfile modules
+"""
+
+import json
+
+import hubblestack.utils.readfile as readfile
+
+
+def test_load_cached_by_mtime_and_size(tmp_path, monkeypatch):
+    readfile.clear_cache()
+    parses = []
+    parse = readfile._parse
+    monkeypatch.setattr(readfile, '_parse', lambda *args: parses.append(args) or parse(*args))
+    path = tmp_path / 'data.json'
+    path.write_text(json.dumps({'a': {'b': [1, 2]}}))
+
+    first = readfile.load(str(path), 'json')
+    first['a']['b'].append(3)
+    # callers get their own copy
+    assert readfile.load(str(path), 'json') == {'a': {'b': [1, 2]}}
+    assert len(parses) == 1
+
+    path.write_text(json.dumps({'a': {'b': [1, 2, 3, 4]}}))
+    assert readfile.load(str(path), 'json') == {'a': {'b': [1, 2, 3, 4]}}
+    assert len(parses) == 2
+
+
+def test_lines(tmp_path, monkeypatch):
+    readfile.clear_cache()
+    reads = []
+    read_lines = readfile._read_lines
+    monkeypatch.setattr(readfile, '_read_lines', lambda path: reads.append(path) or read_lines(path))
+    path = tmp_path / 'sshd_config'
+    path.write_text('# comment\nPermitRootLogin no\n  MaxAuthTries 4\nAllowUsers a:1;b:2\nAllowUsers c:3\n')
+
+    assert readfile.lines_as_list(str(path), None, None) == [
+        '# comment', 'PermitRootLogin no', 'MaxAuthTries 4', 'AllowUsers a:1;b:2', 'AllowUsers c:3']
+    assert readfile.lines_as_list(str(path), None, '#') == [
+        'PermitRootLogin no', 'MaxAuthTries 4', 'AllowUsers a:1;b:2', 'AllowUsers c:3']
+    allow = readfile.lines_as_dict(str(path), '^Allow', None, ' ', ';', ':')
+    assert allow == {'AllowUsers': [{'a': '1', 'b': '2'}, {'c': '3'}]}
+    allow['AllowUsers'].pop()
+    assert readfile.lines_as_dict(str(path), '^Allow', None, ' ', ';', ':') == {
+        'AllowUsers': [{'a': '1', 'b': '2'}, {'c': '3'}]}
+    # the file was read once for all of the above
+    assert len(reads) == 1